@@ -1,10 +1,14 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.utils.functional import SimpleLazyObject
 from django.utils.translation import ugettext_lazy as _
 
 from rest_framework import exceptions
 from rest_framework.authentication import TokenAuthentication
 
+from authentication import signed_tokens
 from authentication.models import Token
+from authentication.token_cache import token_cache
 
 UserModel = get_user_model()
 
@@ -47,11 +51,39 @@ class CustomTokenAuthentication(TokenAuthentication):
     keyword = 'Token'
 
     def authenticate_credentials(self, key):
+        key = Token.stored_key(key)
+        cached = token_cache.get(key) if settings.TOKEN_CACHE_ENABLED else None
         try:
-            token = Token.objects.select_related('user').get(key=key)
+            if cached is None:
+                token = Token.objects.select_related('user').get(key=key)
+                user, is_active = token.user, token.user.is_active
+            else:
+                token = cached.to_token()
+                # the cache holds no user, it is loaded once the request reads it
+                user, is_active = SimpleLazyObject(lambda: token.user), cached.is_active
             token.validate()
         except Token.DoesNotExist:
             raise exceptions.AuthenticationFailed(_('Invalid Token.'))
-        if not token.user.is_active:
+        if not is_active:
             raise exceptions.AuthenticationFailed(_('User inactive, contact customer care.'))
-        return (token.user, token)
+        if settings.TOKEN_CACHE_ENABLED and cached is None:
+            token_cache.set(token)
+        return (user, token)
+
+
+class SignedTokenAuthentication(TokenAuthentication):
+    """
+    Authenticate signed access tokens issued by UserSignInView, checked without database
+    access.
+        Authorization: Bearer <access_token>
+    """
+    keyword = 'Bearer'
+
+    def authenticate_credentials(self, key):
+        try:
+            payload = signed_tokens.decode_token(key, signed_tokens.ACCESS)
+        except signed_tokens.InvalidSignedToken as error:
+            raise exceptions.AuthenticationFailed(str(error))
+        if not payload['is_active']:
+            raise exceptions.AuthenticationFailed(_('User inactive, contact customer care.'))
+        return (signed_tokens.user_from_payload(payload), payload)
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.utils import timezone
+
+from authentication.models import Token
+
+
+def delete_expired_tokens(batch_size=None):
+    """
+    Delete expired tokens in batches of TOKEN_SWEEP_BATCH_SIZE so no statement holds locks
+    on a large part of the table. Returns the number of tokens deleted.
+    """
+    batch_size = batch_size or settings.TOKEN_SWEEP_BATCH_SIZE
+    now = timezone.now()
+    deleted = 0
+    while True:
+        keys = list(Token.objects.filter(expires_on__lte=now)
+                    .values_list('key', flat=True)[:batch_size])
+        if not keys:
+            return deleted
+        # the token cache never keeps a token past its expiry, nothing to invalidate
+        deleted += Token.objects.filter(key__in=keys).delete()[0]
+        if len(keys) < batch_size:
+            return deleted
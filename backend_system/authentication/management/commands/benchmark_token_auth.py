@@ -0,0 +1,91 @@
+"""
+Time authenticated requests with and without the token cache of CustomTokenAuthentication,
+and with signed access tokens when SIGNED_TOKENS_ENABLED is set.
+Every request authenticates against the user detail endpoint.
+--local-cache replaces the shared cache by a local memory cache, for machines without redis.
+All data created is rolled back.
+"""
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.shortcuts import reverse
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from rest_framework.test import APIClient
+
+from authentication import signed_tokens
+from authentication.models import Token, User
+from authentication.token_cache import token_cache
+
+
+class Command(BaseCommand):
+    help = __doc__
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, dest='requests', default=2000)
+        parser.add_argument('--users', type=int, dest='users', default=20,
+                            help='Requests are spread over the tokens of this many users.')
+        parser.add_argument('--local-cache', action='store_true', dest='local_cache')
+
+    def handle(self, *args, **options):
+        if options['local_cache']:
+            caches = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+            with override_settings(CACHES=caches):
+                self.benchmark(options)
+        else:
+            self.benchmark(options)
+
+    def benchmark(self, options):
+        with transaction.atomic():
+            users = [User.objects.create_user(email=f'token.benchmark{number}@email.com',
+                                              password='benchmark')
+                     for number in range(options['users'])]
+            # clients send the raw key, in hashed storage it is only known when the token is
+            # created
+            Token.objects.filter(user__in=users).delete()
+            tokens = {user.pk: Token.objects.create(user=user).raw_key for user in users}
+            urls = [reverse('authentication:user-detail', kwargs={'pk': user.pk}) for user in users]
+            headers = {
+                'database': ['Token ' + tokens[user.pk] for user in users],
+                'cached': ['Token ' + tokens[user.pk] for user in users],
+                'signed': ['Bearer ' + signed_tokens.issue_token(user, signed_tokens.ACCESS)
+                           for user in users],
+            }
+
+            self.stdout.write(f'{options["requests"]} requests by {options["users"]} users')
+            self.stdout.write(f'{"":<12} {"median ms":>10} {"p95 ms":>10} {"req/s":>10} '
+                              f'{"queries":>10} {"hit rate":>10}')
+            modes = [('database', False), ('cached', True)]
+            if settings.SIGNED_TOKENS_ENABLED:
+                modes.append(('signed', False))
+            for name, enabled in modes:
+                calls = [(urls[number % len(urls)], headers[name][number % len(urls)])
+                         for number in range(options['requests'])]
+                with override_settings(TOKEN_CACHE_ENABLED=enabled):
+                    self.run(name, calls)
+            if not settings.SIGNED_TOKENS_ENABLED:
+                self.stdout.write('Set SIGNED_TOKENS_ENABLED to also time signed tokens.')
+            transaction.set_rollback(True)
+
+    def run(self, name, calls):
+        client = APIClient(SERVER_NAME='localhost')
+        token_cache.clear()
+        token_cache.reset_stats()
+        durations = []
+        with CaptureQueriesContext(connection) as queries:
+            for url, header in calls:
+                client.credentials(HTTP_AUTHORIZATION=header)
+                start = time.perf_counter()
+                response = client.get(url)
+                durations.append(time.perf_counter() - start)
+                assert response.status_code == 200, response.data
+        durations.sort()
+        stats = token_cache.stats()
+        self.stdout.write(
+            f'{name:<12} {statistics.median(durations) * 1000:>10.3f} '
+            f'{durations[int(len(durations) * 0.95) - 1] * 1000:>10.3f} '
+            f'{len(durations) / sum(durations):>10.0f} '
+            f'{len(queries) / len(calls):>10.2f} {stats["hit_rate"]:>10.1%}')
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 06:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='token',
+            name='key',
+            field=models.CharField(max_length=64, primary_key=True, serialize=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 07:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0002_token_key_length'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='tokens_revoked_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,4 +1,5 @@
 import binascii
+import hashlib
 import os
 
 from django.conf import settings
@@ -6,7 +7,8 @@ from django.contrib.auth.models import AbstractBaseUser, BaseUserManager
 from django.db import models, transaction
 from django.utils import timezone
 
-from authentication import exceptions
+from authentication import exceptions, signed_tokens
+from authentication.token_cache import token_cache
 from common.models import SoftDeleteModel
 
 
@@ -51,6 +53,8 @@ class User(AbstractBaseUser, SoftDeleteModel):
     is_staff = models.BooleanField(default=False)
     is_superuser = models.BooleanField(default=False)
     passport_photo = models.ImageField(upload_to='passports', null=True, blank=True)
+    # signed tokens issued until then are rejected, see authentication.signed_tokens
+    tokens_revoked_at = models.DateTimeField(null=True, blank=True)
 
     objects = UserManager()
     USERNAME_FIELD = 'email'
@@ -60,21 +64,44 @@ class User(AbstractBaseUser, SoftDeleteModel):
         verbose_name = ('User')
         verbose_name_plural = ('Users')
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        password_changed = self._password is not None
+        super().save(*args, **kwargs)
+        if adding:
+            return
+        # cached tokens carry the user's is_active, drop them so deactivation applies to the
+        # next request
+        token_cache.invalidate_user(self)
+        if password_changed or not self.is_active or self.deleted_at:
+            signed_tokens.revoke_tokens(self)
+
 
 class Token(models.Model):
     """
     Custom Token model.
     Must haves:
-        key: string identifying token
+        key: string identifying token, its sha256 when settings.TOKEN_STORAGE is 'hashed'
         user: user to which the token belongs.
     """
-    key = models.CharField(max_length=2048, primary_key=True)
+    key = models.CharField(max_length=64, primary_key=True)
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='auth_token')
     expires_on = models.DateTimeField(null=True, blank=True)
 
+    # key handed to the client, only known when the token is created in hashed storage
+    raw_key = None
+
+    @staticmethod
+    def stored_key(key):
+        """Value of the key column for a key sent by a client."""
+        if settings.TOKEN_STORAGE == 'hashed':
+            return hashlib.sha256(key.encode()).hexdigest()
+        return key
+
     def save(self, *args, **kwargs):
         if not self.key:
-            self.key = self.generate_key()
+            self.raw_key = self.generate_key()
+            self.key = self.stored_key(self.raw_key)
             current_time = timezone.now()
             password_duration = settings.PASSWORD_VALIDITY_IN_HOURS
             self.expires_on = (
@@ -86,6 +113,7 @@ class Token(models.Model):
 
     def validate(self):
         if self.expires_on <= timezone.now():
+            token_cache.invalidate(self.key)
             self.delete()
             raise exceptions.AuthenticationFailedTokenExpired
 
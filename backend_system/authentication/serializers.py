@@ -106,6 +106,10 @@ class UserChangePasswordSerializer(serializers.Serializer):
         return data
 
 
+class TokenRefreshSerializer(serializers.Serializer):
+    refresh_token = serializers.CharField(required=True)
+
+
 class UserResetPasswordSerializer(serializers.Serializer):
     email = serializers.EmailField()
     password = serializers.CharField(max_length=256, required=False)
@@ -0,0 +1,105 @@
+"""
+Signed access and refresh tokens of SignedTokenAuthentication.
+
+Access tokens carry the user fields the API checks on every request, so they are verified
+without touching the database. Refresh tokens live longer and are exchanged for a new pair,
+reloading the user. Tokens of a user are revoked by storing the time of a password change or
+deactivation on the user, tokens issued before it are rejected. Refresh tokens are checked
+against the user row, access tokens against a copy in the cache kept for as long as they
+last: a cache that loses it, e.g. by evicting keys or being flushed, lets the access tokens
+issued before a revocation through until they expire, SIGNED_TOKEN_ACCESS_MINUTES at most.
+"""
+import time
+import uuid
+
+import jwt
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+
+ALGORITHM = 'HS256'
+ACCESS = 'access'
+REFRESH = 'refresh'
+# user fields copied into access tokens, the others are loaded from the database if used
+USER_CLAIMS = ('email', 'first_name', 'last_name', 'is_active', 'is_staff', 'is_superuser')
+
+
+class InvalidSignedToken(Exception):
+    pass
+
+
+def revoked_key(user_pk):
+    return f'signed-token-revoked:{user_pk}'
+
+
+def issue_token(user, token_type):
+    issued_at = time.time()
+    if token_type == ACCESS:
+        lifetime = settings.SIGNED_TOKEN_ACCESS_MINUTES * 60
+    else:
+        lifetime = settings.SIGNED_TOKEN_REFRESH_HOURS * 3600
+    payload = {
+        'sub': str(user.pk),
+        'type': token_type,
+        'jti': uuid.uuid4().hex,
+        'iat': issued_at,
+        'exp': int(issued_at + lifetime),
+    }
+    if token_type == ACCESS:
+        payload.update({field: getattr(user, field) for field in USER_CLAIMS})
+    return jwt.encode(payload, settings.SIGNED_TOKEN_SECRET, algorithm=ALGORITHM).decode()
+
+
+def issue_tokens(user):
+    """Return a new access and refresh token of user."""
+    return {'access_token': issue_token(user, ACCESS), 'refresh_token': issue_token(user, REFRESH)}
+
+
+def decode_token(token, token_type):
+    """Return the payload of a valid token of token_type, raises InvalidSignedToken."""
+    try:
+        payload = jwt.decode(token, settings.SIGNED_TOKEN_SECRET, algorithms=[ALGORITHM])
+    except jwt.ExpiredSignatureError:
+        raise InvalidSignedToken('Token Expired, Login to get new token.')
+    except jwt.InvalidTokenError:
+        raise InvalidSignedToken('Invalid Token.')
+    if payload.get('type') != token_type or 'sub' not in payload:
+        raise InvalidSignedToken('Invalid Token.')
+    revoked_at = cache.get(revoked_key(payload['sub']))
+    if revoked_at is not None and payload['iat'] <= revoked_at:
+        raise InvalidSignedToken('Token revoked, Login to get new token.')
+    return payload
+
+
+def user_from_payload(payload):
+    """
+    User of an access token built from its claims. Fields not in the token are deferred,
+    so they are only loaded from the database by code that reads them.
+    """
+    field_names = ('id',) + USER_CLAIMS
+    values = (uuid.UUID(payload['sub']),) + tuple(payload[field] for field in USER_CLAIMS)
+    return get_user_model().from_db(DEFAULT_DB_ALIAS, field_names, values)
+
+
+def refresh_tokens(refresh_token):
+    """Exchange a refresh token for a new token pair, raises InvalidSignedToken."""
+    payload = decode_token(refresh_token, REFRESH)
+    user = get_user_model().objects.filter(pk=payload['sub'], is_active=True).first()
+    if user is None:
+        raise InvalidSignedToken('User inactive, contact customer care.')
+    if user.tokens_revoked_at and payload['iat'] <= user.tokens_revoked_at.timestamp():
+        raise InvalidSignedToken('Token revoked, Login to get new token.')
+    return issue_tokens(user)
+
+
+def revoke_tokens(user):
+    """Reject the signed tokens of user issued until now."""
+    revoked_at = timezone.now()
+    get_user_model().objects.filter(pk=user.pk).update(tokens_revoked_at=revoked_at)
+    user.tokens_revoked_at = revoked_at
+    # access tokens issued before are expired once the cached copy is
+    cache.set(revoked_key(user.pk), revoked_at.timestamp(),
+              settings.SIGNED_TOKEN_ACCESS_MINUTES * 60)
@@ -1,6 +1,10 @@
+from django.db import connection
 from django.db.utils import IntegrityError
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 
+from authentication.jobs import delete_expired_tokens
 from authentication.models import User, Token
 
 
@@ -31,3 +35,24 @@ class TokenModelTestCase(TestCase):
         with self.assertRaises(User.DoesNotExist):
             Token.objects.create(user=User.objects.get(email='invalid@email.com'),
                                  key='Token thiswillfail123')
+
+    def test_delete_expired_tokens_in_batches(self):
+        users = [User.objects.create_user(email=f'user{number}@email.com', password='password')
+                 for number in range(5)]
+        Token.objects.filter(user__in=users[:4]).update(
+            expires_on=timezone.now() - timezone.timedelta(minutes=1))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(delete_expired_tokens(batch_size=3), 4)
+        deletes = [query for query in queries.captured_queries
+                   if query['sql'].startswith('DELETE')]
+        self.assertEqual(len(deletes), 2)
+        self.assertEqual(Token.objects.count(), 2)
+
+    @override_settings(TOKEN_STORAGE='hashed')
+    def test_hashed_token_storage(self):
+        Token.objects.filter(user=self.user).delete()
+        token = Token.objects.create(user=self.user)
+        self.assertEqual(len(token.key), 64)
+        self.assertNotEqual(token.key, token.raw_key)
+        self.assertEqual(Token.stored_key(token.raw_key), token.key)
+        self.assertFalse(Token.objects.filter(key=token.raw_key).exists())
@@ -1,8 +1,19 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
 from django.shortcuts import reverse
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 
 from rest_framework.test import APITestCase
+from rest_framework.views import APIView
 
+from authentication import exceptions
+from authentication.backends import CustomTokenAuthentication, SignedTokenAuthentication
 from authentication.models import User, Token
+from authentication.token_cache import TokenCache, token_cache
 
 
 class UserSignupViewsetTestCase(APITestCase):
@@ -75,6 +86,19 @@ class UserSignInViewTestCase(APITestCase):
         self.assertEqual(response2.status_code, 200)
         self.assertIn('token', str(response2.data))
 
+    @override_settings(TOKEN_STORAGE='hashed')
+    def test_user_sign_in_hashed_token_storage(self):
+        """Test a token stored hashed authenticates with the key returned at sign in."""
+        User.objects.create_user(email='user@app.com', password='test_password1')
+        response = self.client.post(
+            self.url, data={'email': 'user@app.com', 'password': 'test_password1'})
+        self.assertEqual(response.status_code, 200)
+        key = response.data['token']
+        self.assertFalse(Token.objects.filter(key=key).exists())
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + key)
+        response = self.client.get(reverse('authentication:users-list'))
+        self.assertEqual(response.status_code, 200)
+
     def test_user_sign_in_wrong_password(self):
         """Test user sign in fails invalid password."""
         # signup user first
@@ -206,3 +230,167 @@ class UserChangePasswordViewTestCase(APITestCase):
         self.assertIn(new_token, str(response.data))
         # confirm token changes
         self.assertNotEqual(old_token, new_token)
+
+
+class TokenCacheTestCase(APITestCase):
+    """CustomTokenAuthentication token cache Tests."""
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='user@app.com',
+            first_name='test',
+            last_name='user',
+            password='test_password1'
+        )
+        self.token = Token.objects.get(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.url = reverse('authentication:user-detail', kwargs={'pk': self.user.pk})
+
+    def token_queries(self):
+        """Count the token lookups of a request."""
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        return sum(1 for query in queries if 'authentication_token' in query['sql'])
+
+    def test_token_served_from_cache(self):
+        """Test only the first request looks the token up in the database."""
+        self.assertEqual(self.token_queries(), 1)
+        self.assertEqual(self.token_queries(), 0)
+        stats = token_cache.stats()
+        self.assertEqual((stats['misses'], stats['local_hits']), (1, 1))
+
+        with self.subTest('Test the shared cache serves other processes'):
+            token_cache.clear()
+            self.assertEqual(self.token_queries(), 0)
+            self.assertEqual(token_cache.stats()['shared_hits'], 1)
+
+    def test_cached_token_holds_no_user(self):
+        """Test only the ids, expiry and is_active of a token are cached."""
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        cached = cache.get(token_cache.cache_key(self.token.key))
+        self.assertEqual(vars(cached), {
+            'key': self.token.key, 'user_id': self.user.pk,
+            'expires_on': self.token.expires_on, 'is_active': True})
+
+    def test_invalidation_by_another_process_drops_the_local_copy(self):
+        """Test a process stops trusting its copy once another process invalidates it."""
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        # the other process deactivates the user without touching this process's LRU
+        other_process = TokenCache()
+        with mock.patch('authentication.models.token_cache', other_process):
+            self.user.is_active = False
+            self.user.save()
+        self.assertIn(self.token.key, token_cache._entries)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('User inactive', str(response.data))
+
+    def test_deactivated_user_token_invalidated(self):
+        """Test a deactivated user is rejected although the token was cached."""
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('User inactive', str(response.data))
+
+    def test_password_change_invalidates_token(self):
+        """Test the token replaced on password change is rejected."""
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        response = self.client.post(reverse('authentication:change-password'), data={
+            'old_password': 'test_password1',
+            'new_password': 'New_password2',
+            'confirm_new_password': 'New_password2'
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + response.data['token'])
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_expired_token_invalidated(self):
+        """Test an expired token is dropped from the cache and deleted."""
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        key = self.token.key
+        self.token.expires_on = timezone.now() - timezone.timedelta(minutes=1)
+        with self.assertRaises(exceptions.AuthenticationFailedTokenExpired):
+            self.token.validate()
+        self.assertIsNone(token_cache.get(key))
+        self.assertFalse(Token.objects.filter(user=self.user).exists())
+
+
+@override_settings(SIGNED_TOKENS_ENABLED=True)
+@mock.patch.object(APIView, 'authentication_classes',
+                   [CustomTokenAuthentication, SignedTokenAuthentication])
+class SignedTokenAuthenticationTestCase(APITestCase):
+    """SignedTokenAuthentication Tests."""
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='user@app.com',
+            first_name='test',
+            last_name='user',
+            password='test_password1'
+        )
+        response = self.client.post(reverse('authentication:sign-in'), data={
+            'email': 'user@app.com', 'password': 'test_password1'})
+        self.assertEqual(response.status_code, 200)
+        self.tokens = response.data
+        self.url = reverse('authentication:user-detail', kwargs={'pk': self.user.pk})
+
+    def get(self, access_token):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + access_token)
+        return self.client.get(self.url)
+
+    def test_access_token_checked_without_database(self):
+        """Test requests with an access token run no authentication query."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get(self.tokens['access_token'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['email'], self.user.email)
+        # the user detail query of the view only
+        self.assertEqual(len(queries), 1)
+
+    def test_refresh_token(self):
+        """Test a refresh token is exchanged for a new token pair."""
+        url = reverse('authentication:token-refresh')
+        response = self.client.post(url, data={'refresh_token': self.tokens['refresh_token']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get(response.data['access_token']).status_code, 200)
+        with self.subTest('Test an access token can not be used as refresh token'):
+            response = self.client.post(
+                url, data={'refresh_token': self.tokens['access_token']})
+            self.assertEqual(response.status_code, 401)
+        with self.subTest('Test a refresh token can not be used as access token'):
+            self.assertEqual(self.get(self.tokens['refresh_token']).status_code, 401)
+
+    def test_password_change_revokes_tokens(self):
+        """Test tokens issued before a password change are rejected."""
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.tokens['access_token'])
+        response = self.client.post(reverse('authentication:change-password'), data={
+            'old_password': 'test_password1',
+            'new_password': 'New_password2',
+            'confirm_new_password': 'New_password2'
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(User.objects.get(pk=self.user.pk).check_password('New_password2'))
+        self.assertEqual(self.get(self.tokens['access_token']).status_code, 401)
+        self.assertEqual(self.get(response.data['access_token']).status_code, 200)
+        response = self.client.post(reverse('authentication:token-refresh'),
+                                    data={'refresh_token': self.tokens['refresh_token']})
+        self.assertEqual(response.status_code, 401)
+
+    def test_revocation_outlives_the_cache(self):
+        """Test refresh tokens stay revoked when the cache loses the revocation."""
+        self.user.set_password('New_password2')
+        self.user.save()
+        cache.clear()
+        response = self.client.post(reverse('authentication:token-refresh'),
+                                    data={'refresh_token': self.tokens['refresh_token']})
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('revoked', str(response.data))
+
+    def test_deactivated_user_tokens_revoked(self):
+        """Test tokens of a deactivated user are rejected."""
+        self.user.is_active = False
+        self.user.save()
+        response = self.get(self.tokens['access_token'])
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('revoked', str(response.data))
@@ -0,0 +1,143 @@
+"""
+Token -> user cache of CustomTokenAuthentication.
+
+Only the key and expiry of a token with the id and is_active of its user are cached, the
+user itself is loaded when a request reads it. Entries are cached in two layers: a per
+process LRU of TOKEN_CACHE_SIZE entries kept for TOKEN_CACHE_LOCAL_SECONDS, in front of the
+shared django cache (redis) holding them for TOKEN_CACHE_SECONDS. No entry outlives the
+expiry of its token.
+Invalidation removes tokens from the shared cache and moves the shared generation on, a
+process only trusts its own copies while the generation they were stored under is current.
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+
+class CachedToken(object):
+    """What is cached of a token, its user's password hash and profile are left out."""
+
+    def __init__(self, key, user_id, expires_on, is_active):
+        self.key = key
+        self.user_id = user_id
+        self.expires_on = expires_on
+        self.is_active = is_active
+
+    def to_token(self):
+        """Token without its user, the user is loaded on first access."""
+        from authentication.models import Token
+
+        return Token.from_db(
+            None, ['key', 'user_id', 'expires_on'], [self.key, self.user_id, self.expires_on])
+
+
+class TokenCache(object):
+    key_prefix = 'auth-token:'
+    generation_key = 'auth-token-generation'
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def cache_key(self, key):
+        return self.key_prefix + key
+
+    def seconds_left(self, token, seconds):
+        """Seconds token may be cached for, at most seconds."""
+        if token.expires_on is None:
+            return seconds
+        return min(seconds, (token.expires_on - timezone.now()).total_seconds())
+
+    def generation(self):
+        """Current invalidation generation, a new one when the shared cache lost it."""
+        generation = cache.get(self.generation_key)
+        if generation is None:
+            cache.add(self.generation_key, uuid.uuid4().hex, None)
+            generation = cache.get(self.generation_key)
+        return generation
+
+    def get(self, key):
+        """Return the CachedToken of key, None when it is not cached."""
+        # read before the shared entry, an invalidation in between then leaves the local
+        # copy under an old generation
+        generation = self.generation()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, entry_generation, cached = entry
+                if expires > time.monotonic() and entry_generation == generation:
+                    self._entries.move_to_end(key)
+                    self.local_hits += 1
+                    return cached
+                del self._entries[key]
+
+        cached = cache.get(self.cache_key(key))
+        with self._lock:
+            if cached is None:
+                self.misses += 1
+                return None
+            self.shared_hits += 1
+        self._store_local(cached, generation)
+        return cached
+
+    def set(self, token):
+        """Cache a token loaded with its user."""
+        seconds = self.seconds_left(token, settings.TOKEN_CACHE_SECONDS)
+        if seconds > 0:
+            cached = CachedToken(token.key, token.user_id, token.expires_on, token.user.is_active)
+            cache.set(self.cache_key(token.key), cached, seconds)
+            self._store_local(cached, self.generation())
+
+    def _store_local(self, cached, generation):
+        seconds = self.seconds_left(cached, settings.TOKEN_CACHE_LOCAL_SECONDS)
+        if seconds <= 0:
+            return
+        with self._lock:
+            self._entries[cached.key] = (time.monotonic() + seconds, generation, cached)
+            self._entries.move_to_end(cached.key)
+            while len(self._entries) > settings.TOKEN_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+        cache.delete_many([self.cache_key(key) for key in keys])
+        # after the delete, so a process trusting its copy again reads the shared cache
+        cache.set(self.generation_key, uuid.uuid4().hex, None)
+
+    def invalidate_user(self, user):
+        """Invalidate the tokens of user e.g. after a password change or deactivation."""
+        from authentication.models import Token
+
+        keys = list(Token.objects.filter(user_id=user.pk).values_list('key', flat=True))
+        if keys:
+            self.invalidate(*keys)
+
+    def clear(self):
+        """Empty the LRU of this process."""
+        with self._lock:
+            self._entries.clear()
+
+    def reset_stats(self):
+        self.local_hits = self.shared_hits = self.misses = 0
+
+    def stats(self):
+        """Hit counters of this process."""
+        lookups = self.local_hits + self.shared_hits + self.misses
+        return {
+            'local_hits': self.local_hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'hit_rate': (self.local_hits + self.shared_hits) / lookups if lookups else 0.0,
+            'size': len(self._entries),
+        }
+
+
+token_cache = TokenCache()
@@ -7,6 +7,7 @@ urlpatterns = [
     url(r'^signup/$', views.UserSignupViewset.as_view(
         actions={'post': 'create'}), name='signup'),
     url(r'^sign-in/$', views.UserSignInView.as_view(), name='sign-in'),
+    url(r'^token-refresh/$', views.TokenRefreshView.as_view(), name='token-refresh'),
     url(r'^users/$', views.UserProfileViewset.as_view(
         actions={'get': 'list'}), name='users-list'),
     url(r'^users/(?P<pk>[a-f0-9-]+)/$', views.UserProfileViewset.as_view(
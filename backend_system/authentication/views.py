@@ -1,21 +1,27 @@
 import os
 import binascii
 
+from django.conf import settings
+
 from rest_framework import viewsets
+from rest_framework.exceptions import AuthenticationFailed, NotFound
 from rest_framework.views import APIView
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework import status
 
-from authentication import exceptions
+from authentication import exceptions, signed_tokens
 from authentication.models import User, Token
 from authentication.serializers import (
+    TokenRefreshSerializer,
     UserChangePasswordSerializer,
     UserSerializer,
     UserSignInSerializer,
     UserSignupSerializer,
 )
+from authentication.token_cache import token_cache
 from common.permissions import IsAuthenticatedUser
+from common.views import EagerLoadingMixin
 
 
 class UserSignupViewset(viewsets.ModelViewSet):
@@ -39,14 +45,38 @@ class UserSignInView(APIView):
         serializer = self.serializer_class(data=request.data, context={'request': request})
         serializer.is_valid(raise_exception=True)
         user = serializer.validated_data['user']
-        try:
-            token, _ = Token.objects.get_or_create(user=user)
-            token.validate()
-        except exceptions.AuthenticationFailedTokenExpired:
+        if settings.TOKEN_STORAGE == 'hashed':
+            # the key of a hashed token can not be read back, issue a new one
+            token_cache.invalidate_user(user)
+            Token.objects.filter(user=user).delete()
             token = Token.objects.create(user=user)
-        return Response({'token': token.key,
-                        'user': UserSerializer(user, context={'request': request}).data},
-                        status=status.HTTP_200_OK)
+        else:
+            try:
+                token, _ = Token.objects.get_or_create(user=user)
+                token.validate()
+            except exceptions.AuthenticationFailedTokenExpired:
+                token = Token.objects.create(user=user)
+        data = {'token': token.raw_key or token.key,
+                'user': UserSerializer(user, context={'request': request}).data}
+        if settings.SIGNED_TOKENS_ENABLED:
+            data.update(signed_tokens.issue_tokens(user))
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class TokenRefreshView(APIView):
+    serializer_class = TokenRefreshSerializer
+    permission_classes = (AllowAny,)
+
+    def post(self, request):
+        if not settings.SIGNED_TOKENS_ENABLED:
+            raise NotFound()
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            tokens = signed_tokens.refresh_tokens(serializer.validated_data['refresh_token'])
+        except signed_tokens.InvalidSignedToken as error:
+            raise AuthenticationFailed(str(error))
+        return Response(tokens, status=status.HTTP_200_OK)
 
 
 class UserChangePasswordView(APIView):
@@ -58,16 +88,21 @@ class UserChangePasswordView(APIView):
             data=request.data, context={'user': request.user})
         serializer.is_valid(raise_exception=True)
         request.user.set_password(serializer.validated_data['new_password'])
+        # saving the user also drops its old token from the token cache
         request.user.save()
 
         # update the token
         new_token = binascii.hexlify(os.urandom(20)).decode()
-        Token.objects.filter(user=request.user).update(key=new_token)
+        Token.objects.filter(user=request.user).update(key=Token.stored_key(new_token))
 
-        return Response(data={'token': new_token}, status=status.HTTP_200_OK)
+        data = {'token': new_token}
+        if settings.SIGNED_TOKENS_ENABLED:
+            # signed tokens issued before the password change are revoked
+            data.update(signed_tokens.issue_tokens(request.user))
+        return Response(data=data, status=status.HTTP_200_OK)
 
 
-class UserProfileViewset(viewsets.ModelViewSet):
+class UserProfileViewset(EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = (IsAuthenticatedUser,)
@@ -0,0 +1,173 @@
+"""
+Email templates rendered from flat booking rows.
+
+Templates are str.format strings split into literal text and fields once when the module
+loads, rendering a row only escapes its values and joins them with the text. Rows are dicts
+read with Booking.objects.values, see booking_rows, so a batch of bookings is rendered from
+one query without loading models; instance_row builds the row of a booking already loaded.
+Each template renders an HTML body and a plain-text alternative.
+"""
+import functools
+import html
+import string
+
+from django.conf import settings
+from django.db.models import F
+
+from bookings.reminders import departure_from
+
+# values of a booking row, name: lookup
+ROW_FIELDS = {
+    'id': F('id'),
+    'email': F('booked_by__email'),
+    'first_name': F('booked_by__first_name'),
+    'travel_date': F('travel_date'),
+    'origin_airport': F('origin__airport'),
+    'origin_city': F('origin__city'),
+    'origin_country': F('origin__country'),
+    'destination_airport': F('destination__airport'),
+    'destination_city': F('destination__city'),
+    'destination_country': F('destination__country'),
+    'flight_name': F('flight__name'),
+    'departure_time': F('flight__departure_time'),
+    'seat_row': F('seat__row'),
+    'seat_letter': F('seat__letter'),
+    'class_group': F('seat__class_group'),
+}
+
+
+def booking_rows(queryset):
+    """Flat rows of the bookings of queryset, read in one query."""
+    return queryset.values(**{f'row_{name}': lookup for name, lookup in ROW_FIELDS.items()})
+
+
+def instance_row(booking):
+    """Row of a booking from the instance and its related objects, as booking_rows reads it."""
+    row = {}
+    for name, lookup in ROW_FIELDS.items():
+        value = booking
+        for attribute in lookup.name.split('__'):
+            value = getattr(value, attribute) if value is not None else None
+        row[f'row_{name}'] = value
+    return row
+
+
+def row_values(row):
+    """Template values of a booking row."""
+    values = {name: row[f'row_{name}'] for name in ROW_FIELDS}
+    departure = departure_from(values['departure_time'], values['travel_date'])
+    values.update({
+        'name': (values['first_name'] or '').title(),
+        'departure': departure,
+        'departure_display': f'{departure:%Y-%m-%d %H:%M}' if departure else '',
+        'seat': f'{values["seat_row"]}{values["seat_letter"]}' if values['seat_row'] else '',
+    })
+    return values
+
+
+@functools.lru_cache(maxsize=8)
+def _allowed_domains(domains):
+    return frozenset(domain.lower() for domain in domains)
+
+
+def is_allowed_recipient(email):
+    """Whether emails may be sent to email, its domain is in EMAIL_ALLOWED_DOMAINS."""
+    return email.rpartition('@')[2].lower() in _allowed_domains(
+        tuple(settings.EMAIL_ALLOWED_DOMAINS))
+
+
+class Template:
+    """
+    str.format template split once into (literal, field) parts, values are escaped by escape.
+    Fields are plain names, format specs and conversions are not supported.
+    """
+
+    def __init__(self, source, escape):
+        self.source = source
+        self.escape = escape
+        self.parts = []
+        for literal, field, format_spec, conversion in string.Formatter().parse(source):
+            if format_spec or conversion:
+                raise ValueError(f'Field {field} of a template can not be formatted.')
+            self.parts.append((literal, field))
+        self.fields = tuple(sorted({field for _, field in self.parts if field}))
+
+    def render(self, values):
+        escape = self.escape
+        return ''.join([literal + escape(values[field]) if field else literal
+                        for literal, field in self.parts])
+
+
+def escape_html(value):
+    return '' if value is None else html.escape(str(value))
+
+
+def escape_text(value):
+    return '' if value is None else str(value)
+
+
+class EmailTemplate:
+    def __init__(self, kind, subject, html_source, text_source):
+        self.kind = kind
+        self.subject = subject
+        self.html = Template(html_source, escape_html)
+        self.text = Template(text_source, escape_text)
+
+    def render(self, values):
+        """Return the HTML and plain-text bodies for the values of a row."""
+        return self.html.render(values), self.text.render(values)
+
+
+BOOKING_SUCCESSFUL = EmailTemplate(
+    kind='booking_successful',
+    subject='Flight Airtech Booking successful',
+    html_source=(
+        '<html>'
+        '<body>'
+        '<strong>Hello {name}, </strong>'
+        '<p>You have successfully booked a flight with Airtech. Find below your ticket details.</p>'
+        '<p>  </p>'
+        '<p>  </p>'
+        '<p> <b style="font-size:15px;">Ticket Number: </b> {id}</p>'
+        '<p> <b style="font-size:15px;">From: </b> {origin_airport}, {origin_city}, {origin_country}</p>'
+        '<p> <b style="font-size:15px;">To: </b> {destination_airport}, {destination_city}, {destination_country}</p>'
+        '<p> <b style="font-size:15px;">Travel Date: </b> {travel_date}</p>'
+        '<p> <b style="font-size:15px;">Flight Name: </b> {flight_name}</p>'
+        '<p> <b style="font-size:15px;">Seat: </b> {seat}, {class_group}</p>'
+        '</body>'
+        '</html>'
+    ),
+    text_source=(
+        'Hello {name},\n\n'
+        'You have successfully booked a flight with Airtech. Find below your ticket details.\n\n'
+        'Ticket Number: {id}\n'
+        'From: {origin_airport}, {origin_city}, {origin_country}\n'
+        'To: {destination_airport}, {destination_city}, {destination_country}\n'
+        'Travel Date: {travel_date}\n'
+        'Flight Name: {flight_name}\n'
+        'Seat: {seat}, {class_group}\n'
+    ),
+)
+
+BOOKING_REMINDER = EmailTemplate(
+    kind='booking_reminder',
+    subject='Flight Airtech Travel Date Reminder',
+    html_source=(
+        '<html>'
+        '<body>'
+        '<strong>Hello {name}, </strong>'
+        '<p>You booked a flight with us from {origin_city}, {origin_country} to {destination_city}, {destination_country}.</p>'
+        '<p>Kindly login into the platform to confirm your flight details and make sure everything is in order for your departure on {departure_display}  </p>'
+        '<p>Thank you for choosing to travel with us.</p>'
+        '<p>Flight Airtech </p>'
+        '</body>'
+        '</html>'
+    ),
+    text_source=(
+        'Hello {name},\n\n'
+        'You booked a flight with us from {origin_city}, {origin_country} to {destination_city}, {destination_country}.\n'
+        'Kindly login into the platform to confirm your flight details and make sure everything is in order for your departure on {departure_display}\n\n'
+        'Thank you for choosing to travel with us.\n'
+        'Flight Airtech\n'
+    ),
+)
@@ -1,70 +1,72 @@
-import re
-from django.conf import settings
-from postmarker.core import PostmarkClient
+from bookings.email_templates import (
+    BOOKING_REMINDER,
+    BOOKING_SUCCESSFUL,
+    booking_rows,
+    instance_row,
+    is_allowed_recipient,
+    row_values,
+)
+from bookings.models import Booking, OutboxEmail
+from bookings.outbox import enqueue_email
 
-postmark = PostmarkClient(server_token=settings.POSTMARK_TOKEN)
 
+def render_booking_emails(template, rows, idempotency_key, priority):
+    """
+    Outbox emails of template for the flat rows of bookings.
+    Bookings of users outside EMAIL_ALLOWED_DOMAINS get no emails.
+    """
+    emails = []
+    for row in rows:
+        values = row_values(row)
+        if not is_allowed_recipient(values['email']):
+            continue
+        key = idempotency_key(values)
+        if key is None:
+            continue
+        html_body, text_body = template.render(values)
+        emails.append({
+            'idempotency_key': key,
+            'kind': template.kind,
+            'to': values['email'],
+            'subject': template.subject,
+            'html_body': html_body,
+            'text_body': text_body,
+            'priority': priority,
+        })
+    return emails
 
-def get_booking_successful_template(booking):
-    template = (
-        '<html>'
-        '<body>'
-        f'<strong>Hello {booking.booked_by.first_name.title()}, </strong>'
-        '<p>You have successfully booked a flight with Airtech. Find below your ticket details.</p>'
-        '<p>  </p>'
-        '<p>  </p>'
-        f'<p> <b style="font-size:15px;">Ticket Number: </b> {booking.id}</p>'
-        f'<p> <b style="font-size:15px;">From: </b> {booking.origin.airport}, {booking.origin.city}, {booking.origin.country}</p>'
-        f'<p> <b style="font-size:15px;">To: </b> {booking.destination.airport}, {booking.destination.city}, {booking.destination.country}</p>'
-        f'<p> <b style="font-size:15px;">Travel Date: </b> {booking.travel_date}</p>'
-        f'<p> <b style="font-size:15px;">Flight Name: </b> {booking.flight.name if booking.flight else ""}</p>'
-        f'<p> <b style="font-size:15px;">Seat: </b> {booking.seat.seat if booking.seat else ""}, {booking.seat.class_group if booking.seat else ""}</p>'
-        '</body>'
-        '</html>'
-    )
-    return template
 
+def booking_successful_key(values):
+    return f'booking-successful:{values["id"]}'
 
-def get_booking_reminder_template(booking):
-    template = (
-        '<html>'
-        '<body>'
-        f'<strong>Hello {booking.booked_by.first_name.title()}, </strong>'
-        f'<p>You booked a flight with us from {booking.origin.city}, {booking.origin.country} to {booking.destination.city}, {booking.destination.country}.</p>'
-        f'<p>Kindly login into the platform to confirm your flight details and make sure everything is in order for your departure tomorrow, {booking.flight.departure_time if booking.flight and booking.flight.departure_time else booking.travel_date}  </p>'
-        '<p>Thank you for choosing to travel with us.</p>'
-        '<p>Flight Airtech </p>'
-        '</body>'
-        '</html>'
-    )
-    return template
+
+def booking_successful_emails(queryset):
+    return render_booking_emails(
+        BOOKING_SUCCESSFUL, booking_rows(queryset), booking_successful_key,
+        OutboxEmail.TRANSACTIONAL)
+
+
+def reminder_key(values):
+    # one reminder per departure, a booking moved to another flight is reminded again
+    if values['departure'] is None:
+        return None
+    return f'booking-reminder:{values["id"]}:{values["departure"].isoformat()}'
+
+
+def booking_reminder_emails(queryset):
+    return render_booking_emails(
+        BOOKING_REMINDER, booking_rows(queryset), reminder_key, OutboxEmail.BULK)
 
 
 def send_booking_successful_email(booking):
     """Sends an email with ticket information to users upon successfully booking."""
-    # confirm if email belongs to andela domain before trying to send an email
-    if re.search(r'@andela.com$', booking.booked_by.email) is not None:
-        # email if user has an andela email
-        template = str(get_booking_successful_template(booking))
-        # import pdb; pdb.set_trace()
-        postmark.emails.send(
-            From=settings.POSTMARK_SENDER_EMAIL,
-            To=str(booking.booked_by.email),
-            Subject='Flight Airtech Booking successful',
-            HtmlBody=template
-        )
+    # rendered from the booking the caller loaded, sent by the outbox after it commits
+    for email in render_booking_emails(BOOKING_SUCCESSFUL, [instance_row(booking)],
+                                       booking_successful_key, OutboxEmail.TRANSACTIONAL):
+        enqueue_email(**email)
 
 
 def send_booking_reminder_email(booking):
     """Sends an email to user reminding them of their flight."""
-    # confirm if email belongs to andela domain before trying to send an email
-    if re.search(r'@andela.com$', booking.booked_by.email) is not None:
-        # email if user has an andela email
-        template = str(get_booking_reminder_template(booking))
-        # import pdb; pdb.set_trace()
-        postmark.emails.send(
-            From=settings.POSTMARK_SENDER_EMAIL,
-            To=str(booking.booked_by.email),
-            Subject='Flight Airtech Travel Date Reminder',
-            HtmlBody=template
-        )
+    for email in booking_reminder_emails(Booking.objects.filter(pk=booking.pk)):
+        enqueue_email(**email)
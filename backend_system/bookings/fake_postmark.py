@@ -0,0 +1,97 @@
+"""
+Local fake of the Postmark email API for tests and benchmarks.
+
+    with FakePostmarkServer() as server, override_settings(POSTMARK_API_URL=server.url):
+        ...
+    server.messages  # every message accepted
+
+Messages to fail_addresses are rejected with Postmark's error code 300 and the next
+fail_requests requests answer with a server error. With rate_limit, requests taking the
+messages accepted in the last second over rate_limit are refused with 429 like Postmark's.
+"""
+import collections
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+
+class FakePostmarkHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        data = json.loads(self.rfile.read(int(self.headers['Content-Length'])) or b'null')
+        with server.lock:
+            server.requests.append((self.path, data))
+            if server.fail_requests:
+                server.fail_requests -= 1
+                return self.respond(500, {'ErrorCode': 500, 'Message': 'Fake server error.'})
+            if server.over_rate_limit(len(data) if isinstance(data, list) else 1):
+                server.throttled_requests += 1
+                return self.respond(429, {'ErrorCode': 429, 'Message': 'Rate limit exceeded.'})
+        if self.path.rstrip('/') == '/email/batch':
+            return self.respond(200, [server.accept(message) for message in data])
+        if self.path.rstrip('/') == '/email':
+            return self.respond(200, server.accept(data))
+        return self.respond(404, {'ErrorCode': 404, 'Message': 'Not found.'})
+
+    def respond(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakePostmarkServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, fail_addresses=(), fail_requests=0, rate_limit=None):
+        super().__init__(('127.0.0.1', 0), FakePostmarkHandler)
+        self.fail_addresses = set(fail_addresses)
+        self.fail_requests = fail_requests
+        self.rate_limit = rate_limit
+        self.lock = threading.Lock()
+        self.requests = []
+        self.messages = []
+        self.throttled_requests = 0
+        # times of the messages accepted within the last second
+        self.recent = collections.deque()
+
+    def over_rate_limit(self, count):
+        """Called holding the lock, records count messages unless they go over rate_limit."""
+        if self.rate_limit is None:
+            return False
+        now = time.monotonic()
+        while self.recent and self.recent[0] <= now - 1:
+            self.recent.popleft()
+        if len(self.recent) + count > self.rate_limit:
+            return True
+        self.recent.extend([now] * count)
+        return False
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_port}/'
+
+    def accept(self, message):
+        if message['To'] in self.fail_addresses:
+            return {'ErrorCode': 300, 'Message': 'Invalid email request', 'To': message['To']}
+        with self.lock:
+            self.messages.append(message)
+        return {'ErrorCode': 0, 'Message': 'OK', 'To': message['To'],
+                'MessageID': str(uuid.uuid4())}
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
@@ -1,21 +1,89 @@
-from django_rq import job
+import datetime
 
+from django.conf import settings
 from django.utils import timezone
 
 from bookings.emails import send_booking_reminder_email
 from bookings.models import Booking
+from bookings.outbox import drain_outbox
+from bookings.reminders import is_due, schedule_reminder
+from common.job_backends import get_job_backend
+from common.queues import routed_job
 
 
-@job('default')
-def travel_date_reminder_job(bookings):
+@routed_job
+def drain_outbox_job():
+    drain_outbox()
+
+
+@routed_job
+def send_booking_reminder_job(booking_id):
+    """Remind the user of a booking about their flight, run by its scheduled job."""
+    booking = Booking.objects.filter(id=booking_id).select_related('flight').first()
+    # skip bookings deleted or moved since the job was queued, a moved one has a new job
+    if booking is None or not is_due(booking):
+        return False
+    # the outbox sends a reminder once per booking and departure, so reruns are harmless
+    send_booking_reminder_email(booking)
+    return True
+
+
+@routed_job
+def schedule_reminders_job(booking_ids):
+    """Schedule the reminders of a chunk of bookings."""
+    bookings = Booking.objects_with_deleted.filter(id__in=booking_ids).select_related('flight')
+    backend = get_job_backend()
     for booking in bookings:
-        # send user's reminders of their travel
-        send_booking_reminder_email(booking)
+        schedule_reminder(booking, backend=backend)
+    return len(booking_ids)
+
+
+def schedule_booking_reminders(booking_ids, chunk_size=None):
+    """
+    Schedule the reminders of booking_ids, an iterable of ids, by enqueueing a job per chunk
+    of REMINDER_CHUNK_SIZE ids so workers share the scheduling of large flights.
+    """
+    chunk_size = chunk_size or settings.REMINDER_CHUNK_SIZE
+    chunk = []
+    chunks = 0
+    for booking_id in booking_ids:
+        chunk.append(str(booking_id))
+        if len(chunk) == chunk_size:
+            schedule_reminders_job.delay(chunk)
+            chunk = []
+            chunks += 1
+    if chunk:
+        schedule_reminders_job.delay(chunk)
+        chunks += 1
+    return chunks
+
+
+def schedule_upcoming_reminders(chunk_size=None, hours=None):
+    """
+    Schedule the reminders of every booking not departed yet, e.g. after a deploy, or with
+    hours only of the bookings whose reminder is due within hours of now.
+    """
+    chunk_size = chunk_size or settings.REMINDER_CHUNK_SIZE
+    start = timezone.now()
+    by_date = Booking.objects.filter(travel_date__gte=start.date())
+    by_flight = Booking.objects.filter(flight__departure_time__gte=start)
+    if hours:
+        departs_in = datetime.timedelta(hours=settings.BOOKING_REMINDER_HOURS)
+        window = datetime.timedelta(hours=hours)
+        start, end = max(start, start + departs_in - window), start + departs_in + window
+        by_date = by_date.filter(travel_date__range=(start.date(), end.date()))
+        by_flight = by_flight.filter(flight__departure_time__range=(start, end))
+    booking_ids = by_date.values_list('id', flat=True).union(
+        by_flight.values_list('id', flat=True))
+    return schedule_booking_reminders(
+        booking_ids.iterator(chunk_size=chunk_size), chunk_size=chunk_size)
 
 
-def travel_date_reminder():
-    """Remind users a day before about their flight."""
-    next_days_date = timezone.now().date() + timezone.timedelta(days=1)
-    # get all bookings for the next day
-    bookings = Booking.objects.filter(travel_date=next_days_date)
-    travel_date_reminder_job.delay(bookings)
+def reconcile_reminders():
+    """
+    Schedule the reminders due within REMINDER_RECONCILE_HOURS of now again, run every hour
+    so reminders whose scheduling failed after commit are still sent.
+    """
+    if not settings.BOOKING_REMINDERS_ENABLED:
+        return 0
+    return schedule_upcoming_reminders(hours=settings.REMINDER_RECONCILE_HOURS)
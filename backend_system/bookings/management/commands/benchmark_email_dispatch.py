@@ -0,0 +1,111 @@
+"""
+Simulate draining a burst of reminders with booking confirmations arriving behind them,
+against a local fake Postmark that refuses requests over --provider-rate emails per second.
+The outbox is drained by --workers threads sharing the send rate, first with no rate limit
+and then at --send-rate. Reports the throughput, the requests refused by the provider, the
+attempts per email and how long confirmations and reminders waited to be sent.
+--local-cache replaces the shared cache by a local memory cache, for machines without redis.
+All emails created are deleted afterwards.
+"""
+import logging
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from bookings.fake_postmark import FakePostmarkServer
+from bookings.models import OutboxEmail
+from bookings.outbox import drain_outbox
+
+
+class Command(BaseCommand):
+    help = __doc__
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reminders', type=int, dest='reminders', default=2000)
+        parser.add_argument('--confirmations', type=int, dest='confirmations', default=100)
+        parser.add_argument('--workers', type=int, dest='workers', default=4)
+        parser.add_argument('--batch-size', type=int, dest='batch_size', default=50)
+        parser.add_argument('--provider-rate', type=int, dest='provider_rate', default=500)
+        parser.add_argument('--send-rate', type=float, dest='send_rate', default=None,
+                            help='Shaped send rate, 90%% of --provider-rate by default.')
+        parser.add_argument('--local-cache', action='store_true', dest='local_cache')
+
+    def handle(self, *args, **options):
+        send_rate = options['send_rate'] or options['provider_rate'] * 0.9
+        # refused requests are expected here, keep their tracebacks out of the report
+        for name in ('bookings.outbox', 'urllib3'):
+            logging.getLogger(name).setLevel(logging.CRITICAL)
+        overrides = {'OUTBOX_RETRY_SECONDS': 1, 'OUTBOX_MAX_ATTEMPTS': 100}
+        if options['local_cache']:
+            overrides['CACHES'] = {
+                'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+        self.stdout.write(f'{options["reminders"]} reminders, {options["confirmations"]} '
+                          f'confirmations, {options["workers"]} workers, provider limit '
+                          f'{options["provider_rate"]}/s')
+        self.stdout.write(f'{"":<10} {"seconds":>8} {"emails/s":>9} {"refused":>8} '
+                          f'{"attempts":>9} {"confirm p50/max s":>18} {"remind p50/max s":>17}')
+        for name, rate in [('unshaped', 1000000), ('shaped', send_rate)]:
+            with override_settings(EMAIL_SEND_RATE=rate, EMAIL_SEND_BURST=options['batch_size'],
+                                   **overrides):
+                try:
+                    self.simulate(name, options)
+                finally:
+                    OutboxEmail.objects.filter(idempotency_key__startswith='benchmark:').delete()
+
+    def simulate(self, name, options):
+        OutboxEmail.objects.bulk_create([
+            OutboxEmail(idempotency_key=f'benchmark:reminder:{number}', kind='booking_reminder',
+                        to=f'reminder{number}@email.com', subject='Reminder', html_body='<p></p>',
+                        priority=OutboxEmail.BULK)
+            for number in range(options['reminders'])
+        ] + [
+            OutboxEmail(idempotency_key=f'benchmark:confirmation:{number}',
+                        kind='booking_successful', to=f'confirmation{number}@email.com',
+                        subject='Booking successful', html_body='<p></p>')
+            for number in range(options['confirmations'])
+        ], batch_size=500)
+
+        emails = OutboxEmail.objects.filter(idempotency_key__startswith='benchmark:')
+        with FakePostmarkServer(rate_limit=options['provider_rate']) as server, \
+                override_settings(POSTMARK_API_URL=server.url):
+            start = timezone.now()
+            started = time.perf_counter()
+            workers = [threading.Thread(target=self.work, args=(emails, options['batch_size']))
+                       for number in range(options['workers'])]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            duration = time.perf_counter() - started
+
+        sent = list(emails.values_list('kind', 'sent_at', 'attempts'))
+        attempts = sum(row[2] for row in sent) / len(sent)
+        lags = {}
+        for kind, sent_at, _ in sent:
+            lags.setdefault(kind, []).append((sent_at - start).total_seconds())
+        confirm = lags.get('booking_successful', [0])
+        remind = lags.get('booking_reminder', [0])
+        self.stdout.write(
+            f'{name:<10} {duration:>8.2f} {len(sent) / duration:>9.0f} '
+            f'{server.throttled_requests:>8} {attempts:>9.2f} '
+            f'{statistics.median(confirm):>9.2f}/{max(confirm):<8.2f} '
+            f'{statistics.median(remind):>8.2f}/{max(remind):<8.2f}')
+
+    def work(self, emails, batch_size):
+        try:
+            while emails.filter(status=OutboxEmail.PENDING).exists():
+                try:
+                    if not drain_outbox(batch_size=batch_size):
+                        # the emails left are backing off or claimed by other workers
+                        time.sleep(0.05)
+                except OperationalError:
+                    # sqlite allows a single writer, wait for the others
+                    time.sleep(0.05)
+        finally:
+            connection.close()
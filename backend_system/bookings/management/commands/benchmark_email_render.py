@@ -0,0 +1,70 @@
+"""
+Time rendering the travel reminders of --rows bookings. Loading the bookings as flat rows
+is compared with loading model instances with select_related, then the rows are rendered
+with the compiled reminder template, HTML and plain text.
+All data created is rolled back.
+"""
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from authentication.models import User
+from bookings.email_templates import BOOKING_REMINDER, booking_rows, row_values
+from bookings.emails import booking_reminder_emails
+from bookings.models import Booking
+from flights.models import Flight, Location
+
+
+class Command(BaseCommand):
+    help = __doc__
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, dest='rows', default=100000)
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        # no reminders are scheduled for the bookings of the benchmark
+        with transaction.atomic(), override_settings(BOOKING_REMINDERS_ENABLED=False):
+            self.seed(rows)
+            bookings = Booking.objects.filter(flight=self.flight)
+
+            self.stdout.write(f'{rows} reminders')
+            self.stdout.write(f'{"":<22} {"seconds":>8} {"rows/s":>10}')
+            self.report('load models', rows, lambda: list(bookings.select_related(
+                'booked_by', 'origin', 'destination', 'flight', 'seat')))
+            flat_rows = self.report('load flat rows', rows, lambda: list(booking_rows(bookings)))
+            values = self.report('row values', rows, lambda: list(map(row_values, flat_rows)))
+            self.report('render html and text', rows,
+                        lambda: [BOOKING_REMINDER.render(row) for row in values])
+            emails = self.report('outbox emails', rows, lambda: booking_reminder_emails(bookings))
+            if len(emails) != rows:
+                self.stderr.write(f'Only {len(emails)} reminders were rendered.')
+            transaction.set_rollback(True)
+
+    def seed(self, rows):
+        password = make_password('benchmark')
+        users = User.objects.bulk_create([
+            User(email=f'render.benchmark{number}@andela.com', first_name='traveller',
+                 password=password)
+            for number in range(rows)
+        ], batch_size=500)
+        origin = Location.objects.create(country='Kenya', city='Nairobi', airport='JKIA')
+        destination = Location.objects.create(country='France', city='Paris', airport='Gaulle')
+        self.flight = Flight.objects.create(
+            name='RENDER BENCHMARK', origin=origin, destination=destination,
+            created_by=users[0], departure_time=timezone.now() + timezone.timedelta(days=1))
+        Booking.objects.bulk_create([
+            Booking(booked_by=user, origin=origin, destination=destination, flight=self.flight)
+            for user in users
+        ], batch_size=500)
+
+    def report(self, name, rows, run):
+        start = time.perf_counter()
+        result = run()
+        duration = time.perf_counter() - start
+        self.stdout.write(f'{name:<22} {duration:>8.2f} {rows / duration:>10.0f}')
+        return result
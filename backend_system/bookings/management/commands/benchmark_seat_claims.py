@@ -0,0 +1,83 @@
+"""
+Stress seat claiming with concurrent threads booking the seats of a flight and report the
+successful bookings per second. Fails if any seat ends up with more than one live booking.
+All data created by the benchmark is deleted afterwards.
+"""
+import string
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, transaction
+from django.db.models import Count
+
+from authentication.models import User
+from bookings.models import Booking
+from flights.models import Flight, Seat
+
+
+class Command(BaseCommand):
+    help = __doc__
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, dest='threads', default=16)
+        parser.add_argument('--rows', type=int, dest='rows', default=30)
+        parser.add_argument('--letters', type=int, dest='letters', default=6)
+
+    def handle(self, *args, **options):
+        user = User.objects.create_user(
+            email='claims.benchmark@email.com', password='benchmark')
+        flight = Flight.objects.create(name='CLAIMS BENCHMARK', created_by=user)
+        Seat.objects.bulk_create([
+            Seat(flight=flight, row=row, letter=letter)
+            for row in range(1, options['rows'] + 1)
+            for letter in string.ascii_uppercase[:options['letters']]])
+        seat_ids = list(Seat.objects.filter(flight=flight).values_list('pk', flat=True))
+        try:
+            results = []
+            barrier = threading.Barrier(options['threads'])
+            workers = [
+                threading.Thread(target=self.worker, args=(barrier, user, flight, seat_ids, results))
+                for _ in range(options['threads'])]
+            start = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            duration = time.perf_counter() - start
+
+            double_booked = Booking.objects.filter(flight=flight).values('seat').annotate(
+                bookings=Count('id')).filter(bookings__gt=1).count()
+            self.stdout.write(f'{len(results)} attempts by {options["threads"]} threads, '
+                              f'{results.count(True)} bookings in {duration:.2f}s, '
+                              f'{results.count(True) / duration:.1f} bookings/s')
+            if double_booked or results.count(True) != len(seat_ids):
+                raise CommandError(f'{double_booked} seats were double booked.')
+        finally:
+            Booking.objects.filter(flight=flight).hard_delete()
+            Seat.objects.filter(flight=flight).hard_delete()
+            Flight.objects_with_deleted.filter(pk=flight.pk).hard_delete()
+            user.auth_token.delete()
+            user.hard_delete()
+
+    def worker(self, barrier, user, flight, seat_ids, results):
+        barrier.wait()
+        try:
+            # every thread tries every seat so each seat is contended by all threads
+            for seat_id in seat_ids:
+                results.append(self.book(user, flight, seat_id))
+        finally:
+            connection.close()
+
+    def book(self, user, flight, seat_id):
+        while True:
+            try:
+                with transaction.atomic():
+                    seat = Seat.objects.get(pk=seat_id)
+                    if not seat.claim():
+                        return False
+                    Booking.objects.create(booked_by=user, flight=flight, seat=seat)
+                return True
+            except OperationalError:
+                # retry when the database is locked by another writer
+                time.sleep(0.001)
@@ -0,0 +1,20 @@
+"""
+Schedule the travel reminders of every booking that has not departed yet, replacing any
+scheduled before. Run once when reminders are first scheduled per booking, or to recover
+the schedule after redis lost its data.
+"""
+from django.core.management.base import BaseCommand
+
+from bookings.jobs import schedule_upcoming_reminders
+
+
+class Command(BaseCommand):
+    help = __doc__
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, dest='chunk_size', default=None,
+                            help='Bookings scheduled by each job, REMINDER_CHUNK_SIZE by default.')
+
+    def handle(self, *args, **options):
+        chunks = schedule_upcoming_reminders(chunk_size=options['chunk_size'])
+        self.stdout.write(f'Queued {chunks} reminder scheduling jobs.')
@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-18 06:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='booking',
+            constraint=models.UniqueConstraint(condition=models.Q(deleted_at=None), fields=('seat',), name='unique_live_booking_per_seat'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-18 06:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0002_unique_live_booking_per_seat'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(condition=models.Q(deleted_at=None), fields=['created_at', 'id'], name='booking_created_idx'),
+        ),
+    ]
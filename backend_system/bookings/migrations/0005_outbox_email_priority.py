@@ -0,0 +1,32 @@
+# Generated by Django 2.2.28 on 2026-10-18 06:43
+
+from django.db import migrations, models
+
+
+def reminders_to_bulk(apps, schema_editor):
+    OutboxEmail = apps.get_model('bookings', 'OutboxEmail')
+    OutboxEmail.objects.filter(kind='booking_reminder').update(priority=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0004_outbox_email'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='outboxemail',
+            name='outbox_pending_idx',
+        ),
+        migrations.AddField(
+            model_name='outboxemail',
+            name='priority',
+            field=models.SmallIntegerField(choices=[(0, 'Transactional'), (1, 'Bulk')], default=0),
+        ),
+        migrations.RunPython(reminders_to_bulk, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='outboxemail',
+            index=models.Index(condition=models.Q(status='pending'), fields=['priority', 'available_at'], name='outbox_pending_idx'),
+        ),
+    ]
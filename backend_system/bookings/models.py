@@ -1,5 +1,8 @@
 from django.db import models
-from common.models import SoftDeleteModel
+from django.utils import timezone
+
+from bookings import reminders
+from common.models import BaseModel, SoftDeleteModel
 
 
 class Booking(SoftDeleteModel):
@@ -18,3 +21,83 @@ class Booking(SoftDeleteModel):
     seat = models.ForeignKey(
         'flights.Seat', null=True, blank=True,
         related_name='booking', on_delete=models.DO_NOTHING)
+
+    class Meta:
+        constraints = [
+            # a seat can only be held by one booking that has not been deleted
+            models.UniqueConstraint(
+                fields=['seat'], condition=models.Q(deleted_at=None),
+                name='unique_live_booking_per_seat'),
+        ]
+        indexes = [
+            # keyset pagination of the bookings list
+            models.Index(fields=['created_at', 'id'], name='booking_created_idx',
+                         condition=models.Q(deleted_at=None)),
+        ]
+
+    # fields the reminder of a booking depends on, see bookings.reminders
+    REMINDER_FIELDS = ('flight_id', 'travel_date', 'deleted_at')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_reminder_state = instance.reminder_state()
+        return instance
+
+    def reminder_state(self):
+        # read from __dict__ so deferred fields are not loaded
+        return tuple(self.__dict__.get(field) for field in self.REMINDER_FIELDS)
+
+    def save(self, *args, **kwargs):
+        state = self.reminder_state()
+        super().save(*args, **kwargs)
+        if state == getattr(self, '_loaded_reminder_state', None):
+            return
+        self._loaded_reminder_state = state
+        if self.deleted_at:
+            reminders.on_commit_cancel([self.pk])
+        else:
+            reminders.on_commit_schedule([self.pk])
+
+    def restore(self):
+        super().restore()
+        self._loaded_reminder_state = self.reminder_state()
+        reminders.on_commit_schedule([self.pk])
+
+
+class OutboxEmail(BaseModel):
+    """
+    Email written in the transaction of the change it reports and sent by a worker after
+    commit, see bookings.outbox.
+        idempotency_key: identifies the email, an email is only written and sent once per key.
+        available_at: when the email may next be claimed for sending.
+        priority: emails of a lower priority are sent first, TRANSACTIONAL before BULK.
+    """
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUSES = ((PENDING, 'Pending'), (SENT, 'Sent'), (FAILED, 'Failed'))
+    TRANSACTIONAL = 0
+    BULK = 1
+    PRIORITIES = ((TRANSACTIONAL, 'Transactional'), (BULK, 'Bulk'))
+
+    idempotency_key = models.CharField(max_length=255, unique=True)
+    kind = models.CharField(max_length=60)
+    to = models.EmailField()
+    subject = models.CharField(max_length=255)
+    html_body = models.TextField()
+    text_body = models.TextField(blank=True)
+    status = models.CharField(max_length=20, choices=STATUSES, default=PENDING)
+    priority = models.SmallIntegerField(choices=PRIORITIES, default=TRANSACTIONAL)
+    attempts = models.IntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    message_id = models.CharField(max_length=255, null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            # pending emails in the order they are sent
+            models.Index(fields=['priority', 'available_at'], name='outbox_pending_idx',
+                         condition=models.Q(status='pending')),
+        ]
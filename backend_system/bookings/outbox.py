@@ -0,0 +1,184 @@
+"""
+Transactional email outbox.
+
+Emails are written to OutboxEmail in the transaction of the booking they report, so no
+HTTP call to Postmark runs inside a request transaction. After commit a worker drains the
+outbox with Postmark's batch API, marking each email sent or scheduling a retry with
+exponential backoff until OUTBOX_MAX_ATTEMPTS.
+Workers send at most EMAIL_SEND_RATE emails per second between them, taken from a token
+bucket in redis, and claim transactional emails before bulk ones such as reminders.
+Emails are claimed with a lease, an email whose worker died is sent again once the lease
+runs out, so delivery is at least once with one outbox row per idempotency key.
+"""
+import logging
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+from postmarker.core import PostmarkClient
+
+from bookings.models import OutboxEmail
+from common.rate_limit import get_token_bucket
+
+logger = logging.getLogger(__name__)
+
+_clients = {}
+
+
+class OutboxPostmarkClient(PostmarkClient):
+    """PostmarkClient calling settings.POSTMARK_API_URL, e.g. a local fake server in tests."""
+
+    def __init__(self, api_url, **kwargs):
+        self.api_url = api_url
+        super().__init__(**kwargs)
+
+    def call(self, method, endpoint, token_type='server', data=None, **kwargs):
+        headers = {'X-Postmark-Server-Token': self.server_token}
+        return self._call(method, self.api_url, endpoint, data, headers, **kwargs)
+
+
+def get_postmark_client():
+    """Client per token and url, kept for the process so its HTTP connections are reused."""
+    key = (settings.POSTMARK_TOKEN, settings.POSTMARK_API_URL)
+    if key not in _clients:
+        _clients[key] = OutboxPostmarkClient(
+            api_url=settings.POSTMARK_API_URL, server_token=settings.POSTMARK_TOKEN,
+            timeout=settings.POSTMARK_TIMEOUT)
+    return _clients[key]
+
+
+def schedule_drain():
+    # imported here as bookings.jobs imports the emails that import this module
+    from bookings.jobs import drain_outbox_job
+
+    try:
+        drain_outbox_job.delay()
+    except Exception:
+        # runs after commit, the booking is saved and the drain_outbox cron sends the email
+        logger.exception('Scheduling the outbox drain failed')
+
+
+def get_send_bucket():
+    return get_token_bucket('postmark', settings.EMAIL_SEND_RATE, settings.EMAIL_SEND_BURST)
+
+
+def enqueue_email(idempotency_key, kind, to, subject, html_body, text_body='',
+                  priority=OutboxEmail.TRANSACTIONAL):
+    """
+    Write an email to the outbox, it is sent after the current transaction commits.
+    An email already written with idempotency_key is not written again.
+    """
+    email, created = OutboxEmail.objects.get_or_create(
+        idempotency_key=idempotency_key,
+        defaults={'kind': kind, 'to': to, 'subject': subject, 'html_body': html_body,
+                  'text_body': text_body, 'priority': priority})
+    if created:
+        transaction.on_commit(schedule_drain)
+    return email
+
+
+def count_due_emails(limit):
+    """Number of emails that may be sent now, counting no further than limit."""
+    return OutboxEmail.objects.filter(
+        status=OutboxEmail.PENDING, available_at__lte=timezone.now())[:limit].count()
+
+
+def claim_emails(batch_size):
+    """Lease up to batch_size due emails to this worker, most urgent first, and return them."""
+    now = timezone.now()
+    with transaction.atomic():
+        queryset = OutboxEmail.objects.filter(
+            status=OutboxEmail.PENDING, available_at__lte=now).order_by('priority', 'available_at')
+        if connection.features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True)
+        ids = list(queryset.values_list('id', flat=True)[:batch_size])
+        OutboxEmail.objects.filter(id__in=ids).update(
+            attempts=F('attempts') + 1,
+            available_at=now + timezone.timedelta(seconds=settings.OUTBOX_LEASE_SECONDS))
+    return list(OutboxEmail.objects.filter(id__in=ids).order_by('priority', 'available_at'))
+
+
+def message(email):
+    return {
+        'From': settings.POSTMARK_SENDER_EMAIL,
+        'To': email.to,
+        'Subject': email.subject,
+        'HtmlBody': email.html_body,
+        'TextBody': email.text_body or None,
+        'Tag': email.kind,
+        'Metadata': {'idempotency_key': email.idempotency_key},
+    }
+
+
+def send_emails(emails):
+    """Send emails in one batch request and record the result of each."""
+    try:
+        results = get_postmark_client().emails.send_batch(*[message(email) for email in emails])
+    except Exception as error:
+        logger.exception('Sending a batch of %s emails failed', len(emails))
+        results = [{'ErrorCode': -1, 'Message': str(error)}] * len(emails)
+
+    now = timezone.now()
+    for email, result in zip(emails, results):
+        if result.get('ErrorCode') == 0:
+            email.status = OutboxEmail.SENT
+            email.sent_at = now
+            email.message_id = result.get('MessageID')
+            email.last_error = ''
+        else:
+            email.last_error = f'{result.get("ErrorCode")}: {result.get("Message", "")}'
+            if email.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+                email.status = OutboxEmail.FAILED
+            else:
+                delay = settings.OUTBOX_RETRY_SECONDS * 2 ** (email.attempts - 1)
+                email.available_at = now + timezone.timedelta(seconds=delay)
+    OutboxEmail.objects.bulk_update(
+        emails, ['status', 'sent_at', 'message_id', 'last_error', 'available_at'])
+    return sum(email.status == OutboxEmail.SENT for email in emails)
+
+
+def drain_outbox(batch_size=None):
+    """
+    Send the due emails of the outbox batch by batch, returns the number sent.
+    Each batch waits for its tokens of the shared send rate before its emails are claimed,
+    so the lease only runs while they are sent however long other workers keep the bucket
+    empty. Batches are no larger than EMAIL_SEND_BURST.
+    """
+    batch_size = min(batch_size or settings.POSTMARK_BATCH_SIZE, settings.EMAIL_SEND_BURST)
+    bucket = get_send_bucket()
+    sent = 0
+    while True:
+        due = count_due_emails(batch_size)
+        if not due:
+            return sent
+        # another worker may claim some of the due emails meanwhile, their tokens are lost
+        emails = claim_emails(bucket.acquire(due))
+        if not emails:
+            return sent
+        sent += send_emails(emails)
+        if due < batch_size:
+            return sent
+
+
+def outbox_metrics():
+    """
+    Depth and lag of the pending emails per priority: depth counts pending emails, due
+    those that may be sent now and lag_seconds is how long the oldest due email has waited.
+    """
+    now = timezone.now()
+    due = Q(available_at__lte=now)
+    rows = OutboxEmail.objects.filter(status=OutboxEmail.PENDING).values('priority').annotate(
+        depth=Count('id'), due=Count('id', filter=due),
+        oldest_due=Min('available_at', filter=due)).order_by('priority')
+    rows = {row['priority']: row for row in rows}
+    metrics = {}
+    for priority, name in OutboxEmail.PRIORITIES:
+        row = rows.get(priority, {'depth': 0, 'due': 0, 'oldest_due': None})
+        metrics[name.lower()] = {
+            'depth': row['depth'],
+            'due': row['due'],
+            'lag_seconds': round((now - row['oldest_due']).total_seconds(), 3)
+            if row['oldest_due'] else 0,
+        }
+    return metrics
@@ -0,0 +1,113 @@
+"""
+Travel reminders scheduled per booking.
+
+Each booking gets one job scheduled with the JOB_BACKEND, with an id derived from the
+booking, due BOOKING_REMINDER_HOURS before the departure of its flight, or the start of its
+travel date when it has no flight with a departure time. Scheduling a booking again
+replaces its job, so bookings are rescheduled whenever their flight, travel date or
+departure changes and their job is cancelled when they are deleted. Changes are applied
+after the transaction commits, reminders whose scheduling failed then are scheduled again by
+the hourly reconcile_reminders job.
+"""
+import datetime
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from common.job_backends import get_job_backend
+
+# a reminder found this much before its time was moved by a change, its new job sends it
+EARLY_TOLERANCE = datetime.timedelta(minutes=5)
+
+logger = logging.getLogger(__name__)
+
+
+def reminder_job_id(booking_id):
+    return f'booking-reminder:{booking_id}'
+
+
+def departure_from(flight_departure_time, travel_date):
+    """Departure of a booking from its flight's departure_time and its travel_date."""
+    if flight_departure_time:
+        return flight_departure_time
+    if travel_date:
+        return timezone.make_aware(datetime.datetime.combine(travel_date, datetime.time.min))
+    return None
+
+
+def departure_time(booking):
+    """Time the booking departs at, None if it has no flight departure nor travel date."""
+    return departure_from(
+        booking.flight.departure_time if booking.flight_id else None, booking.travel_date)
+
+
+def reminder_time(booking):
+    """Time the reminder of booking is due, None if there is nothing left to remind."""
+    departure = departure_time(booking)
+    if departure is None or departure <= timezone.now():
+        return None
+    return departure - datetime.timedelta(hours=settings.BOOKING_REMINDER_HOURS)
+
+
+def is_due(booking):
+    remind_at = reminder_time(booking)
+    return remind_at is not None and remind_at <= timezone.now() + EARLY_TOLERANCE
+
+
+def schedule_reminder(booking, backend=None):
+    """Schedule the reminder of booking, replacing the one scheduled before."""
+    # imported here as bookings.jobs imports the emails that import this module
+    from bookings.jobs import send_booking_reminder_job
+
+    backend = backend or get_job_backend()
+    job_id = reminder_job_id(booking.id)
+    remind_at = reminder_time(booking)
+    if booking.deleted_at or remind_at is None:
+        backend.cancel([job_id])
+        return None
+    # a reminder due in the past, e.g. of a booking made the day before its flight,
+    # is sent right away
+    return backend.enqueue_at(
+        max(remind_at, timezone.now()), send_booking_reminder_job, str(booking.id),
+        job_id=job_id)
+
+
+def cancel_reminders(booking_ids, backend=None):
+    """Cancel the reminders of booking_ids with a single request."""
+    booking_ids = list(booking_ids)
+    if not booking_ids:
+        return
+    backend = backend or get_job_backend()
+    backend.cancel([reminder_job_id(booking_id) for booking_id in booking_ids])
+
+
+def after_commit(func, booking_ids):
+    """Call func with booking_ids once the current transaction commits, logging failures."""
+    def run():
+        try:
+            func(booking_ids)
+        except Exception:
+            # the bookings are saved, reconcile_reminders schedules missed reminders and
+            # reminder jobs skip bookings deleted since
+            logger.exception('%s of %s bookings failed', func.__name__, len(booking_ids))
+
+    transaction.on_commit(run)
+
+
+def on_commit_schedule(booking_ids):
+    """Schedule the reminders of booking_ids again once the current transaction commits."""
+    # imported here as bookings.jobs imports the emails that import this module
+    from bookings.jobs import schedule_booking_reminders
+
+    if settings.BOOKING_REMINDERS_ENABLED:
+        booking_ids = [str(booking_id) for booking_id in booking_ids]
+        after_commit(schedule_booking_reminders, booking_ids)
+
+
+def on_commit_cancel(booking_ids):
+    """Cancel the reminders of booking_ids once the current transaction commits."""
+    if settings.BOOKING_REMINDERS_ENABLED:
+        booking_ids = list(booking_ids)
+        after_commit(cancel_reminders, booking_ids)
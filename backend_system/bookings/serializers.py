@@ -1,21 +1,61 @@
+from django.conf import settings
 from django.db import transaction
+from django.utils import timezone
 
 from rest_framework import serializers
 
 from authentication.models import User
 from authentication.serializers import BasicUserSerializer
+from bookings import reminders
 from bookings.models import Booking
 from bookings.emails import send_booking_successful_email
-from bookings.jobs import travel_date_reminder_job
+from flights.holds import (
+    hold_seat,
+    is_held_by_other,
+    release_seat_hold,
+    release_seat_holds,
+    seat_holder,
+    seat_holders,
+)
 from flights.models import Flight, Location, Seat
 from flights.serializers import (
     FlightSerializer,
     FlightSeatsViewSerializer,
     LocationSlimSerializer,
     SeatSlimSerializer,
+    validate_without_seat_inventory,
 )
 
 
+def reserve_seat(seat, user, *holders):
+    """
+    Settle competing requests for a seat in the cache before any database work.
+    Fails if the seat is held by someone other than user or holders, otherwise holds the
+    seat for user unless one of them already holds it.
+    """
+    if is_held_by_other(seat, user, *holders):
+        raise serializers.ValidationError('Seat is held by another user.')
+    if seat_holder(seat) is None and not hold_seat(seat, user):
+        raise serializers.ValidationError('Seat is held by another user.')
+
+
+def claim_seat(seat):
+    """Book seat for a new booking, the transaction is rolled back if it was taken."""
+    if seat:
+        if not seat.claim():
+            raise serializers.ValidationError('Invalid seat choice.')
+        release_seat_hold(seat)
+
+
+def swap_seat(old_seat, new_seat):
+    """Move an existing booking to new_seat, releasing the seat it held."""
+    if old_seat != new_seat:
+        if not Seat.swap(old_seat, new_seat):
+            raise serializers.ValidationError('Invalid seat choice.')
+        if new_seat:
+            release_seat_hold(new_seat)
+
+
 class BookingViewSerializer(serializers.ModelSerializer):
     booked_by = BasicUserSerializer(read_only=True)
     origin = serializers.SlugRelatedField(
@@ -28,6 +68,9 @@ class BookingViewSerializer(serializers.ModelSerializer):
     flight = FlightSerializer(read_only=True)
     seat = FlightSeatsViewSerializer(allow_null=True, default=None)
 
+    select_related_fields = ('booked_by', 'origin', 'destination', 'flight__origin',
+                             'flight__destination', 'seat')
+
     class Meta:
         model = Booking
         fields = ('id', 'booked_by', 'origin', 'destination', 'travel_date',
@@ -45,6 +88,8 @@ class BookingCreateSerializer(serializers.ModelSerializer):
         many=False, slug_field='name', allow_null=True, required=False)
     seat = SeatSlimSerializer(allow_null=True, default=None)
 
+    select_related_fields = ('booked_by', 'origin', 'destination', 'flight', 'seat')
+
     class Meta:
         model = Booking
         fields = ('id', 'booked_by', 'origin', 'destination', 'travel_date',
@@ -101,6 +146,7 @@ class BookingCreateSerializer(serializers.ModelSerializer):
         viable_flights = Flight.objects.filter(
             origin=attrs.get('origin'), destination=attrs.get('destination'))
         if flight:
+            validate_without_seat_inventory(flight)
             if flight not in viable_flights:
                 raise serializers.ValidationError(
                     'Invalid flight choosen for booking information; origin/destination, given.')
@@ -117,30 +163,17 @@ class BookingCreateSerializer(serializers.ModelSerializer):
             except Seat.objects.DoesNotExist:
                 raise serializers.ValidationError(
                     'Invalid seat choice.')
-        if attrs['seat']:
-            if self.context['request']._request.method == 'POST':
-                viable_seats = Seat.objects.filter(
-                    flight=flight, class_group=attrs['seat'].class_group).exclude(booked=True)
-                if attrs['seat'] not in viable_seats:
-                    raise serializers.ValidationError(
-                        'Invalid seat choice.')
-            if self.context['request']._request.method == 'PUT':
-                if self.instance.seat and (self.instance.seat != attrs['seat']):
-                    viable_seats = Seat.objects.filter(
-                        flight=flight, class_group=attrs['seat'].class_group).exclude(booked=True)
-                    if attrs['seat'] not in viable_seats:
-                        raise serializers.ValidationError('Invalid seat choice.')
-                    # set initially booked seat to not booked
-                    self.instance.seat.booked = False
-                    self.instance.seat.save()
-            # set seat to booked
-            attrs['seat'].booked = True
-            attrs['seat'].save()
+        # fail early on seats known to be booked or held, the seat is only claimed on save
+        if attrs['seat'] and (not self.instance or self.instance.seat != attrs['seat']):
+            if attrs['seat'].booked:
+                raise serializers.ValidationError('Invalid seat choice.')
+            reserve_seat(attrs['seat'], self.context['request'].user)
         return attrs
 
     @transaction.atomic
     def create(self, validated_data):
         user = self.context['request'].user
+        claim_seat(validated_data.get('seat'))
         booking = Booking.objects.create(
             booked_by=user,
             **validated_data
@@ -150,6 +183,7 @@ class BookingCreateSerializer(serializers.ModelSerializer):
 
     @transaction.atomic
     def update(self, instance, validated_data):
+        swap_seat(instance.seat, validated_data.get('seat'))
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
 
@@ -161,6 +195,8 @@ class FlightBookingsSerializer(serializers.ModelSerializer):
     booked_by = BasicUserSerializer(read_only=False)
     seat = FlightSeatsViewSerializer(allow_null=True, default=None)
 
+    select_related_fields = ('booked_by', 'seat')
+
     class Meta:
         model = Booking
         fields = ('id', 'booked_by', 'seat', 'created_at', 'updated_at')
@@ -173,6 +209,7 @@ class FlightBookingsSerializer(serializers.ModelSerializer):
         return internal_value
 
     def validate(self, attrs):
+        validate_without_seat_inventory(self.context['flight'])
         seat_data = attrs.get('seat')
         booked_by_data = attrs.get('booked_by')
 
@@ -192,52 +229,142 @@ class FlightBookingsSerializer(serializers.ModelSerializer):
             except Seat.objects.DoesNotExist:
                 raise serializers.ValidationError(
                     'Invalid seat choice.')
-        if attrs['seat']:
-            if self.context['request']._request.method == 'POST':
-                viable_seats = Seat.objects.filter(
-                    flight=self.context['flight'],
-                    class_group=attrs['seat'].class_group).exclude(booked=True)
-                if attrs['seat'] not in viable_seats:
-                    raise serializers.ValidationError(
-                        'Invalid seat choice.')
-            elif self.context['request']._request.method == 'PUT':
-                if self.instance.seat and (self.instance.seat != attrs['seat']):
-                    viable_seats = Seat.objects.filter(
-                        flight=self.context['flight'],
-                        class_group=attrs['seat'].class_group).exclude(booked=True)
-                    if attrs['seat'] not in viable_seats:
-                        raise serializers.ValidationError('Invalid seat choice.')
+        # fail early on seats known to be booked or held, the seat is only claimed on save
+        if attrs['seat'] and (not self.instance or self.instance.seat != attrs['seat']):
+            if attrs['seat'].booked:
+                raise serializers.ValidationError('Invalid seat choice.')
+            booked_by = attrs.get('booked_by') or getattr(self.instance, 'booked_by', None)
+            holders = [user for user in (booked_by, self.context['request'].user) if user]
+            reserve_seat(attrs['seat'], *holders)
         return attrs
 
     @transaction.atomic
     def create(self, validated_data):
         flight = self.context['flight']
+        claim_seat(validated_data.get('seat'))
         booking = Booking.objects.create(
             flight=flight,
             origin=flight.origin,
             destination=flight.destination,
             **validated_data
         )
-        if booking.seat:
-            # set seat to booked
-            booking.seat.booked = True
-            booking.seat.save()
-        travel_date_reminder_job.delay(booking)
         return booking
 
     @transaction.atomic
     def update(self, instance, validated_data):
-        if instance.seat and (validated_data.get('seat') != instance.seat):
-            # set initially booked seat to not booked
-            self.instance.seat.booked = False
-            self.instance.seat.save()
-
+        swap_seat(instance.seat, validated_data.get('seat'))
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
 
         instance.save()
-        if instance.seat:
-            # set seat to booked
-            instance.seat.booked = True
-            instance.seat.save()
         return instance
+
+
+class GroupSeatSerializer(serializers.Serializer):
+    row = serializers.IntegerField()
+    letter = serializers.CharField(max_length=1)
+
+
+class GroupPassengerSerializer(serializers.Serializer):
+    email = serializers.EmailField()
+    seat = GroupSeatSerializer(allow_null=True, default=None)
+
+
+class GroupBookingSerializer(serializers.Serializer):
+    """
+    Book a group of passengers on the flight of the context, all or nothing. The users and
+    the seats of the group are looked up with one query each, the seats are locked and
+    claimed together and the bookings inserted at once. Errors are reported per passenger,
+    in the order of passengers.
+    """
+    passengers = GroupPassengerSerializer(many=True, allow_empty=False)
+
+    def validate_passengers(self, passengers):
+        if len(passengers) > settings.GROUP_BOOKING_MAX_PASSENGERS:
+            raise serializers.ValidationError(
+                f'Ensure a group has no more than {settings.GROUP_BOOKING_MAX_PASSENGERS} '
+                f'passengers.')
+        return passengers
+
+    def validate(self, attrs):
+        validate_without_seat_inventory(self.context['flight'])
+        passengers = attrs['passengers']
+        users = {user.email: user for user in User.objects.filter(
+            email__in={passenger['email'] for passenger in passengers})}
+        positions = {(passenger['seat']['row'], passenger['seat']['letter'].upper())
+                     for passenger in passengers if passenger['seat']}
+        seats = {}
+        if positions:
+            seats = {(seat.row, seat.letter): seat for seat in Seat.objects.filter(
+                flight=self.context['flight'], row__in={row for row, _ in positions},
+                letter__in={letter for _, letter in positions})}
+        holders = seat_holders(seats.values())
+
+        errors = []
+        user_ids = set()
+        seat_ids = set()
+        for passenger in passengers:
+            error = {}
+            user = users.get(passenger['email'])
+            if user is None:
+                error['email'] = ['Make sure the user you are trying to book for is maintained '
+                                  'in the system.']
+            elif user.pk in user_ids:
+                error['email'] = ['Passenger is listed more than once.']
+            else:
+                user_ids.add(user.pk)
+
+            seat = None
+            if passenger['seat']:
+                seat = seats.get(
+                    (passenger['seat']['row'], passenger['seat']['letter'].upper()))
+                allowed_holders = {str(self.context['request'].user.pk)}
+                if user is not None:
+                    allowed_holders.add(str(user.pk))
+                if seat is None or seat.booked:
+                    error['seat'] = ['Invalid seat choice.']
+                elif seat.pk in seat_ids:
+                    error['seat'] = ['Seat is chosen for more than one passenger.']
+                elif holders.get(seat.pk) not in allowed_holders | {None}:
+                    error['seat'] = ['Seat is held by another user.']
+                else:
+                    seat_ids.add(seat.pk)
+            passenger['user'] = user
+            passenger['seat'] = seat
+            errors.append(error)
+        if any(errors):
+            raise serializers.ValidationError({'passengers': errors})
+        return attrs
+
+    @transaction.atomic
+    def create(self, validated_data):
+        flight = self.context['flight']
+        passengers = validated_data['passengers']
+        seats = [passenger['seat'] for passenger in passengers if passenger['seat']]
+        if seats:
+            # locked in primary key order like Seat.swap, so concurrent groups can not
+            # deadlock, then claimed with one conditional UPDATE
+            seat_ids = [seat.pk for seat in seats]
+            taken = {pk for pk, booked in Seat.objects.select_for_update().filter(
+                pk__in=seat_ids).order_by('pk').values_list('pk', 'booked') if booked}
+            if not taken and Seat.objects.filter(pk__in=seat_ids, booked=False).update(
+                    booked=True, updated_at=timezone.now()) != len(seats):
+                # databases without row locks, the seats taken are not known
+                taken = set(seat_ids)
+            if taken:
+                raise serializers.ValidationError({'passengers': [
+                    {'seat': ['Invalid seat choice.']}
+                    if passenger['seat'] and passenger['seat'].pk in taken else {}
+                    for passenger in passengers
+                ]})
+            for seat in seats:
+                seat.booked = True
+        bookings = Booking.objects.bulk_create([
+            Booking(booked_by=passenger['user'], seat=passenger['seat'], flight=flight,
+                    origin_id=flight.origin_id, destination_id=flight.destination_id)
+            for passenger in passengers
+        ])
+        release_seat_holds(seats)
+        # bulk_create skips Booking.save, which schedules the reminder of a new booking
+        reminders.on_commit_schedule([booking.pk for booking in bookings])
+        return bookings
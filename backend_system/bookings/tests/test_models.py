@@ -1,7 +1,23 @@
-from django.test import TestCase
+import json
+import threading
+import time
+from unittest import mock
+
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 
 from authentication.models import User
-from bookings.models import Booking
+from bookings import jobs, outbox, reminders
+from bookings.email_templates import (
+    Template, booking_rows, escape_html, instance_row, is_allowed_recipient)
+from bookings.emails import (
+    booking_reminder_emails, booking_successful_emails, send_booking_successful_email)
+from bookings.fake_postmark import FakePostmarkServer
+from bookings.models import Booking, OutboxEmail
+from bookings.serializers import FlightBookingsSerializer
+from common.models import Job
 from flights.models import Location, Flight, Seat
 
 
@@ -42,3 +58,421 @@ class FlightTestCase(TestCase):
         self.assertEqual(Booking.objects.all().count(), 0)
         self.assertEqual(Booking.objects_with_deleted.all().count(), 1)
         self.assertIsNotNone(Booking.objects_with_deleted.get(pk=self.booking.pk).deleted_at)
+
+    def test_one_live_booking_per_seat(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Booking.objects.create(booked_by=self.user, flight=self.flight, seat=self.seat)
+        # the seat can be booked again once the booking holding it is deleted
+        self.booking.delete()
+        Booking.objects.create(booked_by=self.user, flight=self.flight, seat=self.seat)
+        self.assertEqual(Booking.objects.filter(seat=self.seat).count(), 1)
+
+
+class SeatClaimStressTestCase(TransactionTestCase):
+    """Many threads booking the few seats of a flight at the same time."""
+    threads = 8
+    attempts_per_thread = 10
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='flightsystem@email.com', password='flightpassword')
+        self.flight = Flight.objects.create(
+            name='FLIGHT1',
+            gate='G20',
+            created_by=self.user
+        )
+        self.seats = [Seat.objects.create(letter=letter, row='1', flight=self.flight)
+                      for letter in 'ABCD']
+
+    def book(self, seat_pk):
+        """Try to book a seat, returns False if another thread booked it first."""
+        while True:
+            try:
+                with transaction.atomic():
+                    seat = Seat.objects.get(pk=seat_pk)
+                    if not seat.claim():
+                        return False
+                    Booking.objects.create(booked_by=self.user, flight=self.flight, seat=seat)
+                return True
+            except OperationalError:
+                # retry when the database is locked by another writer
+                time.sleep(0.001)
+
+    def worker(self, barrier, results):
+        barrier.wait()
+        try:
+            for attempt in range(self.attempts_per_thread):
+                results.append(self.book(self.seats[attempt % len(self.seats)].pk))
+        finally:
+            connection.close()
+
+    def test_concurrent_claims_never_double_book(self):
+        results = []
+        barrier = threading.Barrier(self.threads)
+        workers = [threading.Thread(target=self.worker, args=(barrier, results))
+                   for _ in range(self.threads)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        duration = time.perf_counter() - start
+        bookings_per_second = results.count(True) / duration
+
+        self.assertEqual(len(results), self.threads * self.attempts_per_thread)
+        self.assertEqual(results.count(True), len(self.seats))
+        self.assertGreater(bookings_per_second, 0)
+        for seat in self.seats:
+            self.assertEqual(Booking.objects.filter(seat=seat).count(), 1)
+            seat.refresh_from_db()
+            self.assertTrue(seat.booked)
+
+
+@override_settings(OUTBOX_MAX_ATTEMPTS=3, OUTBOX_RETRY_SECONDS=60)
+class OutboxTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='traveller@andela.com', password='flightpassword')
+        self.origin = Location.objects.create(country='Kenya', city='Nairobi', airport='JKIA')
+        self.destination = Location.objects.create(
+            country='France', city='Paris', airport='Gaulle')
+        self.flight = Flight.objects.create(name='OUTBOX1', created_by=self.user)
+
+    def book(self, email):
+        user = User.objects.create_user(email=email, password='flightpassword')
+        booking = Booking.objects.create(
+            booked_by=user, flight=self.flight, origin=self.origin, destination=self.destination)
+        send_booking_successful_email(booking)
+        return booking
+
+    def drain(self, server, **kwargs):
+        with override_settings(POSTMARK_API_URL=server.url):
+            return outbox.drain_outbox(**kwargs)
+
+    def make_due(self):
+        OutboxEmail.objects.update(available_at=timezone.now())
+
+    def test_booking_email_is_written_to_the_outbox(self):
+        with FakePostmarkServer() as server:
+            booking = self.book('first@andela.com')
+            self.book('other@email.com')
+            self.assertEqual(server.requests, [])
+        email = OutboxEmail.objects.get()
+        self.assertEqual(email.idempotency_key, f'booking-successful:{booking.id}')
+        self.assertEqual(email.to, 'first@andela.com')
+        self.assertEqual(email.status, OutboxEmail.PENDING)
+
+    def test_email_is_enqueued_once_per_idempotency_key(self):
+        booking = self.book('first@andela.com')
+        send_booking_successful_email(booking)
+        self.assertEqual(OutboxEmail.objects.count(), 1)
+
+    def test_drain_sends_emails_in_batches(self):
+        for number in range(5):
+            self.book(f'traveller{number}@andela.com')
+        with FakePostmarkServer() as server:
+            self.assertEqual(self.drain(server, batch_size=2), 5)
+        self.assertEqual(len(server.requests), 3)
+        self.assertTrue(all(path == '/email/batch' for path, _ in server.requests))
+        self.assertEqual(len(server.messages), 5)
+        self.assertEqual(OutboxEmail.objects.filter(status=OutboxEmail.SENT).count(), 5)
+        self.assertFalse(OutboxEmail.objects.filter(message_id=None).exists())
+        # sent emails are not sent again
+        with FakePostmarkServer() as server:
+            self.assertEqual(self.drain(server), 0)
+        self.assertEqual(server.requests, [])
+
+    def test_rejected_email_is_retried_with_backoff_until_failed(self):
+        self.book('first@andela.com')
+        self.book('rejected@andela.com')
+        delays = []
+        with FakePostmarkServer(fail_addresses=['rejected@andela.com']) as server:
+            for attempt in range(3):
+                start = timezone.now()
+                self.drain(server)
+                email = OutboxEmail.objects.get(to='rejected@andela.com')
+                delays.append(round((email.available_at - start).total_seconds() / 60))
+                self.make_due()
+        self.assertEqual(len(server.messages), 1)
+        self.assertEqual(len(server.requests), 3)
+        self.assertEqual(email.status, OutboxEmail.FAILED)
+        self.assertEqual(email.attempts, 3)
+        self.assertTrue(email.last_error.startswith('300:'))
+        # one and two minutes, the third attempt is the last
+        self.assertEqual(delays[:2], [1, 2])
+
+    def test_failed_request_retries_every_email(self):
+        self.book('first@andela.com')
+        self.book('second@andela.com')
+        with FakePostmarkServer(fail_requests=1) as server:
+            self.assertEqual(self.drain(server), 0)
+            self.assertEqual(
+                OutboxEmail.objects.filter(status=OutboxEmail.PENDING, attempts=1).count(), 2)
+            # not due before the backoff runs out
+            self.assertEqual(self.drain(server), 0)
+            self.make_due()
+            self.assertEqual(self.drain(server), 2)
+        self.assertEqual(len(server.messages), 2)
+
+    def test_transactional_emails_are_claimed_first(self):
+        reminder = outbox.enqueue_email(
+            idempotency_key='reminder', kind='booking_reminder', to='first@andela.com',
+            subject='Reminder', html_body='', priority=OutboxEmail.BULK)
+        booking = self.book('second@andela.com')
+        self.assertEqual([email.idempotency_key for email in outbox.claim_emails(1)],
+                         [f'booking-successful:{booking.id}'])
+        self.assertEqual(outbox.claim_emails(1), [reminder])
+
+    @override_settings(EMAIL_SEND_RATE=1000, EMAIL_SEND_BURST=2)
+    def test_drain_waits_for_the_send_rate(self):
+        for number in range(5):
+            self.book(f'traveller{number}@andela.com')
+        bucket = outbox.get_send_bucket()
+        with FakePostmarkServer() as server, \
+                mock.patch.object(bucket, 'acquire', wraps=bucket.acquire) as acquire:
+            # batches are no larger than the burst of the send rate
+            self.assertEqual(self.drain(server, batch_size=10), 5)
+        self.assertEqual([call[0][0] for call in acquire.call_args_list], [2, 2, 1])
+
+    def test_send_rate_is_waited_for_before_claiming(self):
+        self.book('first@andela.com')
+        self.book('second@andela.com')
+        bucket = outbox.get_send_bucket()
+
+        def acquire(count):
+            # the lease of the emails does not run while the worker waits for tokens
+            self.assertFalse(OutboxEmail.objects.filter(attempts__gt=0).exists())
+            return count
+        with FakePostmarkServer() as server, \
+                mock.patch.object(bucket, 'acquire', side_effect=acquire) as patched:
+            self.assertEqual(self.drain(server), 2)
+        patched.assert_called_once_with(2)
+
+    def test_claimed_email_is_leased(self):
+        self.book('first@andela.com')
+        self.assertEqual(len(outbox.claim_emails(10)), 1)
+        # a second worker does not get the email while the lease runs
+        self.assertEqual(outbox.claim_emails(10), [])
+
+
+class EmailTemplateTestCase(TestCase):
+    def setUp(self):
+        self.origin = Location.objects.create(country='Kenya', city='Nairobi', airport='JKIA')
+        self.destination = Location.objects.create(
+            country='France', city='Paris', airport='Gaulle')
+        staff = User.objects.create_user(email='staff@andela.com', password='flightpassword')
+        self.flight = Flight.objects.create(
+            name='TEMPLATE1', origin=self.origin, destination=self.destination,
+            created_by=staff, departure_time=timezone.now() + timezone.timedelta(days=1))
+        for number in range(5):
+            user = User.objects.create_user(
+                email=f'traveller{number}@andela.com', password='flightpassword',
+                first_name='<b>ann</b>')
+            Booking.objects.create(
+                booked_by=user, origin=self.origin, destination=self.destination,
+                flight=self.flight, seat=Seat.objects.create(
+                    flight=self.flight, row=number + 1, letter='C'))
+        Booking.objects.create(
+            booked_by=User.objects.create_user(email='other@email.com', password='password'),
+            origin=self.origin, destination=self.destination, flight=self.flight)
+
+    def test_batch_is_rendered_from_one_query(self):
+        with self.assertNumQueries(1):
+            emails = booking_successful_emails(Booking.objects.all())
+        # the booking of a user outside the allowed domains gets no email
+        self.assertEqual(len(emails), 5)
+        self.assertEqual({email['kind'] for email in emails}, {'booking_successful'})
+
+    def test_html_is_escaped_and_text_is_plain(self):
+        booking = Booking.objects.get(seat__row=1)
+        email, = booking_successful_emails(Booking.objects.filter(pk=booking.pk))
+        self.assertIn('Hello &lt;B&gt;Ann&lt;/B&gt;', email['html_body'])
+        self.assertIn('<p> <b style="font-size:15px;">Seat: </b> 1C, Economy</p>',
+                      email['html_body'])
+        self.assertIn(f'Ticket Number: {booking.id}\n', email['text_body'])
+        self.assertIn('Hello <B>Ann</B>,', email['text_body'])
+        self.assertIn('From: Jkia, Nairobi, Kenya', email['text_body'])
+
+    def test_loaded_booking_is_rendered_without_reading_it_again(self):
+        booking = Booking.objects.select_related(
+            'booked_by', 'origin', 'destination', 'flight', 'seat').get(seat__row=1)
+        self.assertEqual(instance_row(booking),
+                         booking_rows(Booking.objects.filter(pk=booking.pk)).get())
+        with CaptureQueriesContext(connection) as queries:
+            send_booking_successful_email(booking)
+        self.assertFalse([query for query in queries if 'bookings_booking' in query['sql']])
+        self.assertEqual(OutboxEmail.objects.get().to, booking.booked_by.email)
+
+    def test_template_is_split_into_text_and_fields(self):
+        template = Template('{{name}}: {name}', escape_html)
+        self.assertEqual(template.fields, ('name',))
+        self.assertEqual(template.render({'name': '<b>'}), '{name}: &lt;b&gt;')
+        with self.assertRaises(ValueError):
+            Template('{name!r}', escape_html)
+
+    def test_reminder_is_keyed_by_departure(self):
+        emails = booking_reminder_emails(Booking.objects.filter(seat__row=1))
+        self.assertEqual(len(emails), 1)
+        self.assertTrue(emails[0]['idempotency_key'].endswith(
+            self.flight.departure_time.isoformat()))
+        self.assertIn(f'{self.flight.departure_time:%Y-%m-%d %H:%M}', emails[0]['text_body'])
+        # nothing to remind without a departure
+        Booking.objects.update(flight=None)
+        self.assertEqual(booking_reminder_emails(Booking.objects.all()), [])
+
+    def test_allowed_recipients(self):
+        self.assertTrue(is_allowed_recipient('traveller@ANDELA.com'))
+        self.assertFalse(is_allowed_recipient('traveller@andelaxcom'))
+        self.assertFalse(is_allowed_recipient('traveller@email.com'))
+        with override_settings(EMAIL_ALLOWED_DOMAINS=['email.com']):
+            self.assertTrue(is_allowed_recipient('traveller@email.com'))
+            self.assertFalse(is_allowed_recipient('traveller@andela.com'))
+
+
+class BookingReminderTestCase(TestCase):
+    def setUp(self):
+        # enabled here as the conftest fixture disables reminders after class overrides,
+        # reminders are scheduled in the Job table
+        enabled = override_settings(BOOKING_REMINDERS_ENABLED=True, BOOKING_REMINDER_HOURS=24,
+                                    JOB_BACKEND='database')
+        enabled.enable()
+        self.addCleanup(enabled.disable)
+        patches = [
+            # run commit callbacks right away, test transactions never commit
+            mock.patch.object(reminders, 'transaction', mock.Mock(on_commit=lambda func: func())),
+            # run scheduling jobs in process
+            mock.patch.object(jobs.schedule_reminders_job, 'delay',
+                              side_effect=jobs.schedule_reminders_job),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        self.now = timezone.now()
+        self.user = User.objects.create_user(
+            email='traveller@andela.com', password='flightpassword')
+        self.origin = Location.objects.create(country='Kenya', city='Nairobi', airport='JKIA')
+        self.destination = Location.objects.create(
+            country='France', city='Paris', airport='Gaulle')
+        self.flight = self.create_flight('REMINDER1', days=3)
+        self.booking = self.book(self.flight)
+
+    def create_flight(self, name, **delta):
+        return Flight.objects.create(
+            name=name, origin=self.origin, destination=self.destination, created_by=self.user,
+            departure_time=self.now + timezone.timedelta(**delta))
+
+    def book(self, flight):
+        return Booking.objects.create(
+            booked_by=self.user, origin=self.origin, destination=self.destination,
+            flight=flight)
+
+    def scheduled_jobs(self):
+        return set(Job.objects.filter(status=Job.PENDING).values_list('key', flat=True))
+
+    def scheduled_time(self, booking):
+        return Job.objects.get(key=reminders.reminder_job_id(booking.id)).run_at
+
+    def test_reminder_is_scheduled_before_departure(self):
+        self.assertEqual(self.scheduled_time(self.booking),
+                         self.flight.departure_time - timezone.timedelta(hours=24))
+        job = Job.objects.get(key=reminders.reminder_job_id(self.booking.id))
+        self.assertEqual(job.func, 'bookings.jobs.send_booking_reminder_job')
+        self.assertEqual(job.queue, 'bulk')
+        self.assertEqual(json.loads(job.args), [str(self.booking.id)])
+
+    def test_flight_booking_schedules_its_reminder(self):
+        serializer = FlightBookingsSerializer(
+            data={'booked_by': {
+                'email': self.user.email, 'first_name': 'Jane', 'last_name': 'Doe'}},
+            context={'flight': self.flight, 'request': mock.Mock(user=self.user)})
+        serializer.is_valid(raise_exception=True)
+        booking = serializer.save()
+        job = Job.objects.get(key=reminders.reminder_job_id(booking.id))
+        self.assertEqual(job.func, 'bookings.jobs.send_booking_reminder_job')
+        self.assertEqual(json.loads(job.args), [str(booking.id)])
+
+    def test_reminder_is_due_now_for_a_close_departure(self):
+        booking = self.book(self.create_flight('REMINDER2', hours=2))
+        self.assertLessEqual(self.scheduled_time(booking), timezone.now())
+
+    def test_booking_without_departure_is_scheduled_on_its_travel_date(self):
+        booking = Booking.objects.create(
+            booked_by=self.user, travel_date=(self.now + timezone.timedelta(days=5)).date())
+        self.assertEqual(self.scheduled_time(booking).date(),
+                         (self.now + timezone.timedelta(days=4)).date())
+        booking.travel_date = None
+        booking.save()
+        self.assertNotIn(reminders.reminder_job_id(booking.id), self.scheduled_jobs())
+
+    def test_reminder_is_rescheduled_when_the_booking_changes(self):
+        flight = self.create_flight('REMINDER2', days=6)
+        self.booking.flight = flight
+        self.booking.save()
+        self.assertEqual(self.scheduled_time(self.booking),
+                         flight.departure_time - timezone.timedelta(hours=24))
+        # saving other fields schedules nothing
+        with mock.patch.object(reminders, 'schedule_reminder') as schedule_reminder:
+            booking = Booking.objects.get(pk=self.booking.pk)
+            booking.origin = self.destination
+            booking.save()
+        schedule_reminder.assert_not_called()
+
+    def test_reminders_are_rescheduled_when_the_departure_changes(self):
+        other = self.book(self.flight)
+        flight = Flight.objects.get(pk=self.flight.pk)
+        flight.departure_time = self.now + timezone.timedelta(days=10)
+        flight.save()
+        for booking in (self.booking, other):
+            self.assertEqual(self.scheduled_time(booking),
+                             flight.departure_time - timezone.timedelta(hours=24))
+
+    def test_reminder_is_cancelled_on_delete_and_scheduled_on_restore(self):
+        job_id = reminders.reminder_job_id(self.booking.id)
+        self.booking.delete()
+        self.assertNotIn(job_id, self.scheduled_jobs())
+        self.booking.restore()
+        self.assertIn(job_id, self.scheduled_jobs())
+
+    def test_reminders_are_cancelled_with_their_flight(self):
+        other = self.book(self.flight)
+        self.flight.delete()
+        self.assertEqual(self.scheduled_jobs(), set())
+        self.flight.restore()
+        self.assertEqual(self.scheduled_jobs(), {
+            reminders.reminder_job_id(self.booking.id), reminders.reminder_job_id(other.id)})
+
+    def test_scheduling_fans_out_chunks_of_ids(self):
+        booking_ids = [self.book(self.flight).id for number in range(4)]
+        jobs.schedule_reminders_job.delay.reset_mock()
+        self.assertEqual(jobs.schedule_booking_reminders(booking_ids, chunk_size=3), 2)
+        self.assertEqual(jobs.schedule_reminders_job.delay.call_count, 2)
+        self.assertEqual(len(jobs.schedule_reminders_job.delay.call_args_list[0][0][0]), 3)
+
+    def test_failed_scheduling_is_reconciled(self):
+        failing = mock.patch.object(
+            jobs.schedule_reminders_job, 'delay', side_effect=ConnectionError)
+        with failing, self.assertLogs('bookings.reminders', 'ERROR'):
+            booking = self.book(self.create_flight('REMINDER2', hours=25))
+        self.assertNotIn(reminders.reminder_job_id(booking.id), self.scheduled_jobs())
+        Job.objects.all().delete()
+        self.assertEqual(jobs.reconcile_reminders(), 1)
+        # only the reminder due within REMINDER_RECONCILE_HOURS is scheduled again
+        self.assertEqual(self.scheduled_jobs(), {reminders.reminder_job_id(booking.id)})
+        self.assertEqual(self.scheduled_time(booking),
+                         booking.flight.departure_time - timezone.timedelta(hours=24))
+
+    def test_due_reminder_is_sent_once(self):
+        booking = self.book(self.create_flight('REMINDER2', hours=20))
+        self.assertTrue(jobs.send_booking_reminder_job(str(booking.id)))
+        self.assertTrue(jobs.send_booking_reminder_job(str(booking.id)))
+        email = OutboxEmail.objects.get(kind='booking_reminder')
+        self.assertEqual(email.to, 'traveller@andela.com')
+
+    def test_stale_reminder_is_skipped(self):
+        # a reminder queued before the flight was moved later
+        self.assertFalse(jobs.send_booking_reminder_job(str(self.booking.id)))
+        booking = self.book(self.create_flight('REMINDER2', hours=20))
+        booking.delete()
+        self.assertFalse(jobs.send_booking_reminder_job(str(booking.id)))
+        self.assertFalse(OutboxEmail.objects.exists())
@@ -1,11 +1,20 @@
+import base64
 import datetime
+from unittest import mock
 
+from django.db import connection
 from django.shortcuts import reverse
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 
+from rest_framework.exceptions import ValidationError
 from rest_framework.test import APITestCase
 
 from authentication.models import User
-from bookings.models import Booking
+from bookings.models import Booking, OutboxEmail
+from bookings.serializers import GroupBookingSerializer
+from common import views
+from flights.holds import hold_seat, seat_holder
 from flights.models import Location, Flight, Seat
 
 
@@ -67,6 +76,20 @@ class BookingsViewSetTestCase(APITestCase):
         self.assertEqual(booking.booked_by, self.normal_user)
         self.assertEqual(booking.flight, self.flight)
 
+    @override_settings(EMAIL_ALLOWED_DOMAINS=['email.com'])
+    def test_booking_is_created_when_the_outbox_drain_cannot_be_scheduled(self):
+        """Test a failing enqueue after commit does not fail the booking."""
+        self.client.force_authenticate(user=self.normal_user)
+        run_on_commit = mock.patch(
+            'bookings.outbox.transaction.on_commit', side_effect=lambda func: func())
+        with run_on_commit, mock.patch(
+                'bookings.jobs.drain_outbox_job.delay', side_effect=ConnectionError):
+            response = self.client.post(
+                reverse('bookings:booking-list'), data=self.data, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Booking.objects.filter(id=response.data['id']).exists())
+        self.assertTrue(OutboxEmail.objects.filter(to=self.normal_user.email).exists())
+
     def test_user_can_make_booking_without_specifying_flight(self):
         """Test user can make reservation."""
         self.data.pop('flight')
@@ -136,6 +159,58 @@ class BookingsViewSetTestCase(APITestCase):
             self.assertEqual(response4.status_code, 200)
             self.assertEqual(response4.data['total_count'], 3)
 
+    def test_view_all_bookings_query_count_does_not_grow_with_page(self):
+        """Test listing bookings runs the same number of queries for any page size."""
+        for row in range(2, 14):
+            seat = Seat.objects.create(letter='A', row=row, flight=self.flight)
+            Booking.objects.create(
+                booked_by=self.normal_user, origin=self.location2, destination=self.location1,
+                travel_date=datetime.date(2019, 6, 30), flight=self.flight, seat=seat)
+        self.url = reverse('bookings:booking-list')
+        self.client.force_authenticate(user=self.staff_user)
+        with CaptureQueriesContext(connection) as small:
+            response = self.client.get(self.url + '?page-size=2')
+            self.assertEqual(len(response.data['results']), 2)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(self.url + '?page-size=12')
+            self.assertEqual(len(response.data['results']), 12)
+        self.assertEqual(len(small), len(large))
+
+    def test_view_all_bookings_by_cursor(self):
+        """Test bookings are paged with next and previous cursors."""
+        bookings = [
+            Booking.objects.create(booked_by=self.normal_user, flight=self.flight)
+            for _ in range(5)]
+        expected = [str(booking.id) for booking in sorted(
+            bookings, key=lambda booking: (booking.created_at, booking.id))]
+        self.client.force_authenticate(user=self.staff_user)
+        url = reverse('bookings:booking-list') + '?page-size=2'
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['total_count'], 5)
+            self.assertEqual(response.data['total_pages'], 3)
+            pages.append([booking['id'] for booking in response.data['results']])
+            url = response.data['next']
+        self.assertEqual(pages, [expected[:2], expected[2:4], expected[4:]])
+
+        with self.subTest('Test previous cursor returns the earlier page'):
+            response = self.client.get(response.data['previous'])
+            self.assertEqual([booking['id'] for booking in response.data['results']],
+                             expected[2:4])
+            response = self.client.get(response.data['previous'])
+            self.assertEqual([booking['id'] for booking in response.data['results']],
+                             expected[:2])
+            self.assertIsNone(response.data['previous'])
+
+        with self.subTest('Test invalid cursor'):
+            response = self.client.get(reverse('bookings:booking-list') + '?cursor=invalid')
+            self.assertEqual(response.status_code, 404)
+            cursor = base64.urlsafe_b64encode(b'{"v":["today","1"],"r":false}').decode()
+            response = self.client.get(reverse('bookings:booking-list') + '?cursor=' + cursor)
+            self.assertEqual(response.status_code, 404)
+
     def test_retrieve_booking(self):
         """Test can retrieve booking."""
         self.url = reverse('bookings:booking-list')
@@ -191,6 +266,42 @@ class BookingsViewSetTestCase(APITestCase):
         self.assertEqual(self.seat1.booked, False)
         self.assertEqual(self.seat2.booked, True)
 
+    def test_user_cannot_book_seat_held_by_another_user(self):
+        """Test seat holds of other users are honored when booking."""
+        hold_url = reverse('flights:flight-seat-hold',
+                           kwargs={'flight_pk': self.flight.id, 'pk': self.seat1.id})
+        self.client.force_authenticate(user=self.other_normal_user)
+        self.assertEqual(self.client.post(hold_url, data={}, format='json').status_code, 200)
+
+        self.data['seat'] = {'row': 1, 'letter': 'A'}
+        self.url = reverse('bookings:booking-list')
+        self.client.force_authenticate(user=self.normal_user)
+        response = self.client.post(self.url, data=self.data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Seat is held by another user.', str(response.data))
+        self.seat1.refresh_from_db()
+        self.assertFalse(self.seat1.booked)
+
+        # the user holding the seat can book it
+        self.client.force_authenticate(user=self.other_normal_user)
+        response = self.client.post(self.url, data=self.data, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.seat1.refresh_from_db()
+        self.assertTrue(self.seat1.booked)
+
+    def test_user_cannot_book_booked_seat(self):
+        """Test a booked seat can only be booked once."""
+        self.data['seat'] = {'row': 1, 'letter': 'A'}
+        self.url = reverse('bookings:booking-list')
+        self.client.force_authenticate(user=self.normal_user)
+        response = self.client.post(self.url, data=self.data, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.client.force_authenticate(user=self.other_normal_user)
+        response = self.client.post(self.url, data=self.data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Invalid seat choice.', str(response.data))
+        self.assertEqual(Booking.objects.filter(seat=self.seat1).count(), 1)
+
     def test_view_bookings_per_travel_date(self):
         """Test view bookings per travel date"""
         self.url = reverse('bookings:booking-list')
@@ -218,6 +329,110 @@ class BookingsViewSetTestCase(APITestCase):
         self.assertEqual(response4.data['total_count'], 1)
         self.assertEqual(response4.data['results'][0]['travel_date'], '2019-07-01')
 
+    def test_booking_is_created_once_per_idempotency_key(self):
+        """Test a retried booking returns the first response without booking again."""
+        url = reverse('bookings:booking-list')
+        self.client.force_authenticate(user=self.normal_user)
+        response1 = self.client.post(url, data=self.data, format='json',
+                                     HTTP_IDEMPOTENCY_KEY='booking-retry')
+        self.assertEqual(response1.status_code, 201)
+        response2 = self.client.post(url, data=self.data, format='json',
+                                     HTTP_IDEMPOTENCY_KEY='booking-retry')
+        self.assertEqual(response2.status_code, 201)
+        self.assertEqual(response2.data, response1.data)
+        self.assertEqual(response2['Idempotent-Replayed'], 'true')
+        self.assertEqual(Booking.objects.count(), 1)
+
+        with self.subTest('Test the key is scoped to the user.'):
+            self.client.force_authenticate(user=self.other_normal_user)
+            response = self.client.post(url, data=self.data, format='json',
+                                        HTTP_IDEMPOTENCY_KEY='booking-retry')
+            self.assertEqual(response.status_code, 201)
+            self.assertNotEqual(response.data['id'], response1.data['id'])
+
+        with self.subTest('Test the key can not be reused for another booking.'):
+            self.client.force_authenticate(user=self.normal_user)
+            self.data.pop('flight')
+            response = self.client.post(url, data=self.data, format='json',
+                                        HTTP_IDEMPOTENCY_KEY='booking-retry')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(Booking.objects.count(), 2)
+
+    def test_failed_booking_is_not_replayed(self):
+        """Test a key whose booking failed can be retried."""
+        url = reverse('bookings:booking-list')
+        self.client.force_authenticate(user=self.normal_user)
+        self.data['travel_date'] = '2019-06-10'
+        response = self.client.post(url, data=self.data, format='json',
+                                    HTTP_IDEMPOTENCY_KEY='booking-retry')
+        self.assertEqual(response.status_code, 400)
+        self.data['travel_date'] = '2019-06-30'
+        response = self.client.post(url, data=self.data, format='json',
+                                    HTTP_IDEMPOTENCY_KEY='booking-retry')
+        self.assertEqual(response.status_code, 201)
+
+    def test_duplicate_booking_waits_for_the_request_in_flight(self):
+        """Test a duplicate sent while the first request runs returns its response."""
+        url = reverse('bookings:booking-list')
+        self.client.force_authenticate(user=self.normal_user)
+        response1 = self.client.post(url, data=self.data, format='json',
+                                     HTTP_IDEMPOTENCY_KEY='booking-retry')
+        get = views.cache.get
+        lookups = []
+
+        def get_response(key, *args):
+            # the first request is still running when the duplicate first looks
+            if key.startswith('idempotency:response:'):
+                lookups.append(key)
+                if len(lookups) == 1:
+                    return None
+            return get(key, *args)
+
+        with mock.patch.object(views.cache, 'add', return_value=False), \
+                mock.patch.object(views.cache, 'get', side_effect=get_response), \
+                mock.patch.object(views.time, 'sleep') as sleep:
+            response2 = self.client.post(url, data=self.data, format='json',
+                                         HTTP_IDEMPOTENCY_KEY='booking-retry')
+        sleep.assert_called_once()
+        self.assertEqual(response2.status_code, 201)
+        self.assertEqual(response2.data['id'], response1.data['id'])
+
+        with self.subTest('Test the duplicate gives up after IDEMPOTENCY_WAIT_SECONDS.'):
+            with override_settings(IDEMPOTENCY_WAIT_SECONDS=0), \
+                    mock.patch.object(views.cache, 'add', return_value=False), \
+                    mock.patch.object(views.cache, 'get', return_value=None):
+                response = self.client.post(url, data=self.data, format='json',
+                                            HTTP_IDEMPOTENCY_KEY='booking-retry')
+            self.assertEqual(response.status_code, 409)
+            self.assertEqual(response.data['error'], 'IdempotencyKeyInUse')
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_outbox_metrics(self):
+        """Test staff can view the depth and lag of the email outbox."""
+        url = reverse('bookings:outbox-metrics')
+        now = datetime.datetime.now(datetime.timezone.utc)
+        for number, priority in enumerate([OutboxEmail.TRANSACTIONAL, OutboxEmail.BULK,
+                                           OutboxEmail.BULK]):
+            OutboxEmail.objects.create(
+                idempotency_key=f'metrics:{number}', kind='metrics', to='normal@email.com',
+                subject='Metrics', html_body='', priority=priority,
+                available_at=now - datetime.timedelta(minutes=number))
+        OutboxEmail.objects.create(
+            idempotency_key='metrics:later', kind='metrics', to='normal@email.com',
+            subject='Metrics', html_body='', priority=OutboxEmail.BULK,
+            available_at=now + datetime.timedelta(minutes=5))
+
+        self.client.force_authenticate(user=self.normal_user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.force_authenticate(user=self.staff_user)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['transactional']['depth'], 1)
+        self.assertEqual(response.data['bulk']['depth'], 3)
+        self.assertEqual(response.data['bulk']['due'], 2)
+        self.assertGreaterEqual(response.data['bulk']['lag_seconds'], 120)
+
 
 class FlightBookingsViewsetTestCase(APITestCase):
     """Test specific flight BookingsViewset TestCase."""
@@ -297,3 +512,112 @@ class FlightBookingsViewsetTestCase(APITestCase):
         booking2.refresh_from_db()
         self.assertEqual(booking1.flight, self.flight)
         self.assertIsNone(booking2.flight)
+
+    def test_list_flight_bookings_query_count_does_not_grow_with_page(self):
+        """Test listing a flight's bookings runs the same number of queries for any page size."""
+        for row in range(2, 14):
+            seat = Seat.objects.create(letter='A', row=row, flight=self.flight)
+            Booking.objects.create(booked_by=self.normal_user, flight=self.flight, seat=seat)
+        url = reverse('bookings:flight-bookings-list', kwargs={'flight_pk': self.flight.pk})
+        self.client.force_authenticate(user=self.staff_user)
+        with CaptureQueriesContext(connection) as small:
+            response = self.client.get(url + '?page-size=2')
+            self.assertEqual(len(response.data['results']), 2)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(url + '?page-size=12')
+            self.assertEqual(len(response.data['results']), 12)
+        self.assertEqual(len(small), len(large))
+
+    def book_group(self, passengers):
+        url = reverse('bookings:flight-bookings-group', kwargs={'flight_pk': self.flight.pk})
+        return self.client.post(url, data={'passengers': passengers}, format='json')
+
+    def test_book_group(self):
+        """Test staff can book a group of passengers and seats at once."""
+        users = [User.objects.create_user(email=f'group{number}@email.com',
+                                          password='flightpassword') for number in range(3)]
+        seats = [self.seat1] + [Seat.objects.create(letter=letter, row='1', flight=self.flight)
+                                for letter in 'BC']
+        passengers = [{'email': user.email, 'seat': {'row': seat.row, 'letter': seat.letter}}
+                      for user, seat in zip(users, seats)]
+        passengers.append({'email': self.normal_user.email, 'seat': None})
+
+        self.client.force_authenticate(user=self.normal_user)
+        self.assertEqual(self.book_group(passengers).status_code, 403)
+
+        self.client.force_authenticate(user=self.staff_user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.book_group(passengers)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([booking['booked_by']['email'] for booking in response.data],
+                         [passenger['email'] for passenger in passengers])
+        self.assertEqual(response.data[0]['seat']['seat'], '1A')
+        self.assertEqual(Booking.objects.filter(flight=self.flight).count(), 4)
+        self.assertFalse(Seat.objects.filter(flight=self.flight, booked=False).exists())
+
+        # the queries do not grow with the group
+        Booking.objects.all().delete()
+        Seat.objects.update(booked=False)
+        more_users = [User.objects.create_user(email=f'more{number}@email.com',
+                                               password='flightpassword') for number in range(6)]
+        more_seats = [Seat.objects.create(letter=letter, row='2', flight=self.flight)
+                      for letter in 'ABCDEF']
+        passengers.extend({'email': user.email, 'seat': {'row': 2, 'letter': seat.letter}}
+                          for user, seat in zip(more_users, more_seats))
+        with CaptureQueriesContext(connection) as more_queries:
+            self.assertEqual(self.book_group(passengers).status_code, 201)
+        self.assertEqual(len(more_queries), len(queries))
+
+    def test_book_group_is_all_or_nothing(self):
+        """Test a group with invalid passengers reports each of them and books nobody."""
+        self.seat1.claim()
+        seat2 = Seat.objects.create(letter='B', row='1', flight=self.flight)
+        passengers = [
+            {'email': self.normal_user.email, 'seat': {'row': 1, 'letter': 'b'}},
+            {'email': 'unknown@email.com', 'seat': None},
+            {'email': self.other_normal_user.email, 'seat': {'row': 1, 'letter': 'A'}},
+            {'email': self.staff_user.email, 'seat': {'row': 1, 'letter': 'B'}},
+            {'email': self.normal_user.email, 'seat': {'row': 9, 'letter': 'A'}},
+        ]
+        self.client.force_authenticate(user=self.staff_user)
+        response = self.book_group(passengers)
+        self.assertEqual(response.status_code, 400)
+        errors = response.data['error_description']['passengers']
+        self.assertEqual(errors[0], {})
+        self.assertIn('maintained in the system', str(errors[1]['email']))
+        self.assertEqual(errors[2], {'seat': ['Invalid seat choice.']})
+        self.assertEqual(errors[3], {'seat': ['Seat is chosen for more than one passenger.']})
+        self.assertEqual(errors[4], {'email': ['Passenger is listed more than once.'],
+                                     'seat': ['Invalid seat choice.']})
+        self.assertFalse(Booking.objects.exists())
+        seat2.refresh_from_db()
+        self.assertFalse(seat2.booked)
+
+        with self.subTest('Test a seat taken while the group is booked books nobody.'):
+            request = mock.Mock(user=self.staff_user)
+            serializer = GroupBookingSerializer(data={'passengers': [
+                {'email': self.other_normal_user.email, 'seat': None},
+                {'email': self.normal_user.email, 'seat': {'row': 1, 'letter': 'B'}},
+            ]}, context={'flight': self.flight, 'request': request})
+            self.assertTrue(serializer.is_valid())
+            seat2.claim()
+            with self.assertRaises(ValidationError) as error:
+                serializer.save()
+            self.assertEqual(error.exception.detail['passengers'][1],
+                             {'seat': ['Invalid seat choice.']})
+            self.assertFalse(Booking.objects.exists())
+
+    def test_book_group_seat_held_by_another_user(self):
+        """Test a group can not book a seat another user holds."""
+        hold_seat(self.seat1, self.other_normal_user)
+        self.client.force_authenticate(user=self.staff_user)
+        response = self.book_group([{'email': self.normal_user.email,
+                                     'seat': {'row': 1, 'letter': 'A'}}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error_description']['passengers'][0],
+                         {'seat': ['Seat is held by another user.']})
+        # the passenger's own hold is released once booked
+        response = self.book_group([{'email': self.other_normal_user.email,
+                                     'seat': {'row': 1, 'letter': 'A'}}])
+        self.assertEqual(response.status_code, 201)
+        self.assertIsNone(seat_holder(self.seat1))
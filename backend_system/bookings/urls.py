@@ -15,4 +15,5 @@ urlpatterns = [
         actions={'post': 'create', 'get': 'list'}), name='booking-list'),
     url(r'^bookings/(?P<pk>[a-f0-9-]+)/$', views.BookingViewset.as_view(
         actions={'get': 'retrieve', 'put': 'update', 'delete': 'destroy'}), name='booking-detail'),
+    url(r'^outbox-metrics/$', views.OutboxMetricsView.as_view(), name='outbox-metrics'),
 ]
@@ -1,26 +1,35 @@
 from datetime import datetime
 
+from django.shortcuts import get_object_or_404
+
 from rest_framework.exceptions import NotFound
 from rest_framework.decorators import list_route
 from rest_framework import viewsets
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.views import APIView
 
 from bookings.models import Booking
+from bookings.outbox import outbox_metrics
 from bookings.serializers import (
     BookingCreateSerializer,
     BookingViewSerializer,
     FlightBookingsSerializer,
+    GroupBookingSerializer,
 )
+from common.pagination import EstimatedCountKeysetPaginator
 from common.permissions import IsAuthenticatedUser
+from common.views import EagerLoadingMixin, IdempotentCreateMixin
 from flights.models import Flight, Seat
 from flights.permissions import FlightsPermissions
 
 
-class BookingViewset(viewsets.ModelViewSet):
+class BookingViewset(IdempotentCreateMixin, EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = Booking.objects.all()
     permission_classes = (IsAuthenticatedUser,)
     serializer_class = BookingCreateSerializer
+    pagination_class = EstimatedCountKeysetPaginator
 
     def get_queryset(self):
         travel_date = self.request.query_params.get('travel_date', None)
@@ -39,7 +48,7 @@ class BookingViewset(viewsets.ModelViewSet):
         return BookingViewSerializer
 
 
-class FlightBookingsViewset(viewsets.ModelViewSet):
+class FlightBookingsViewset(IdempotentCreateMixin, EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = Booking.objects.all()
     permission_classes = (FlightsPermissions,)
     serializer_class = FlightBookingsSerializer
@@ -55,10 +64,20 @@ class FlightBookingsViewset(viewsets.ModelViewSet):
     def get_serializer_context(self):
         """Serializer context."""
         context = super().get_serializer_context()
-        flight = Flight.objects.get(id=self.kwargs['flight_pk'])
+        flight = get_object_or_404(Flight, id=self.kwargs['flight_pk'])
         context['flight'] = flight
         return context
 
+    @list_route(methods=['POST'], permission_classes=[FlightsPermissions], url_path='group')
+    def group(self, request, *args, **kwargs):
+        """Book a list of passengers and their seats on the flight in one transaction."""
+        serializer = GroupBookingSerializer(
+            data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        bookings = serializer.save()
+        return Response(data=FlightBookingsSerializer(bookings, many=True).data,
+                        status=status.HTTP_201_CREATED)
+
     @list_route(methods=['POST'], permission_classes=[FlightsPermissions],
                 url_path='assign-flight-to-bookings')
     def assign_flight_to_bookings(self, request, *args, **kwargs):
@@ -77,3 +96,11 @@ class FlightBookingsViewset(viewsets.ModelViewSet):
             # send user email notifying them to select seats
         message = {'message': 'Flight assigned to first bookings based on number of seats.'}
         return Response(data=message, status=status.HTTP_200_OK)
+
+
+class OutboxMetricsView(APIView):
+    """Depth and lag of the email outbox per priority, for monitoring."""
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(data=outbox_metrics(), status=status.HTTP_200_OK)
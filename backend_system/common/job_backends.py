@@ -0,0 +1,221 @@
+"""
+Job backends, where jobs are queued and scheduled.
+
+JOB_BACKEND picks the backend: 'rq' keeps jobs in redis for the rq workers and
+rq-scheduler, 'database' keeps them in the Job table so small deployments and CI run
+without redis. Both queue a job on the queue RQ_JOB_ROUTES gives its function.
+
+Database workers, see the dbworker command, claim due jobs in batches with
+SELECT ... FOR UPDATE SKIP LOCKED, so workers never wait on each other's rows, and run them
+in their own process. A claimed job is leased for JOB_LEASE_SECONDS, the job of a worker
+that died is claimed again once its lease runs out, up to JOB_MAX_ATTEMPTS times.
+The RQ_CRON_JOBS are queued by the database workers too: each cron job's next tick is
+written with a key made of the function and the tick time, so however many workers poll
+a tick runs once. Arguments of database jobs are stored as JSON.
+"""
+import datetime
+import json
+import socket
+import traceback
+import uuid
+
+import django_rq
+from croniter import croniter
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from django_rq import get_scheduler
+from rq import Worker
+
+from common.models import Job
+from common.queues import DEFAULT, QUEUES, job_path, route
+
+
+class RQBackend:
+    """Jobs in redis, run by the rqworkers command and scheduled by rqscheduler."""
+
+    def enqueue(self, func, *args, **kwargs):
+        return django_rq.get_queue(route(func)).enqueue(func, *args, **kwargs)
+
+    def enqueue_at(self, scheduled_time, func, *args, job_id=None):
+        """Queue func at scheduled_time, replacing the job scheduled before with job_id."""
+        # scheduled jobs are moved to the queue of their scheduler when due
+        return get_scheduler(route(func)).enqueue_at(scheduled_time, func, *args, job_id=job_id)
+
+    def cancel(self, job_ids):
+        """Cancel the scheduled jobs of job_ids with a single request."""
+        # the schedulers of every queue share their sorted set of scheduled jobs
+        scheduler = get_scheduler(DEFAULT)
+        scheduler.connection.zrem(scheduler.scheduled_jobs_key, *job_ids)
+
+    def queue_metrics(self):
+        # rq stores naive utc times
+        now = datetime.datetime.utcnow()
+        metrics = {}
+        for name in settings.RQ_QUEUES:
+            queue = django_rq.get_queue(name)
+            head = queue.get_job_ids(0, 1)
+            job = queue.fetch_job(head[0]) if head else None
+            wait = (now - job.enqueued_at).total_seconds() if job and job.enqueued_at else 0
+            metrics[name] = {
+                'depth': queue.count,
+                'workers': len(Worker.all(queue=queue)),
+                'wait_seconds': round(max(wait, 0), 3),
+            }
+        return metrics
+
+
+class DatabaseBackend:
+    """Jobs in the Job table, run and scheduled by the dbworker command."""
+
+    def job(self, func, args, kwargs, run_at=None):
+        return Job(
+            queue=route(func), func=job_path(func), args=json.dumps(list(args)),
+            kwargs=json.dumps(kwargs), run_at=run_at or timezone.now())
+
+    def enqueue(self, func, *args, **kwargs):
+        job = self.job(func, args, kwargs)
+        job.save(force_insert=True)
+        return job
+
+    def enqueue_at(self, scheduled_time, func, *args, job_id=None):
+        """Queue func at scheduled_time, replacing the job scheduled before with job_id."""
+        job = self.job(func, args, {}, run_at=scheduled_time)
+        if job_id is None:
+            job.save(force_insert=True)
+            return job
+        job, _ = Job.objects.update_or_create(key=job_id, defaults={
+            'queue': job.queue, 'func': job.func, 'args': job.args, 'kwargs': job.kwargs,
+            'run_at': job.run_at, 'status': Job.PENDING, 'attempts': 0, 'claimed_by': '',
+            'locked_until': None, 'finished_at': None, 'last_error': ''})
+        return job
+
+    def cancel(self, job_ids):
+        """Cancel the scheduled jobs of job_ids that have not started."""
+        Job.objects.filter(key__in=list(job_ids), status=Job.PENDING).delete()
+
+    def queue_metrics(self):
+        now = timezone.now()
+        rows = Job.objects.filter(status=Job.PENDING, run_at__lte=now).values('queue').annotate(
+            depth=Count('id'), oldest=Min('run_at')).order_by('queue')
+        rows = {row['queue']: row for row in rows}
+        workers = Job.objects.filter(status=Job.RUNNING, locked_until__gt=now).values(
+            'queue').annotate(workers=Count('claimed_by', distinct=True)).order_by('queue')
+        workers = {row['queue']: row['workers'] for row in workers}
+        metrics = {}
+        for name in settings.RQ_QUEUES:
+            row = rows.get(name, {'depth': 0, 'oldest': None})
+            metrics[name] = {
+                'depth': row['depth'],
+                # workers running a job of the queue, idle database workers are not known
+                'workers': workers.get(name, 0),
+                'wait_seconds': round((now - row['oldest']).total_seconds(), 3)
+                if row['oldest'] else 0,
+            }
+        return metrics
+
+
+BACKENDS = {
+    'rq': RQBackend,
+    'database': DatabaseBackend,
+}
+
+
+def get_job_backend():
+    try:
+        return BACKENDS[settings.JOB_BACKEND]()
+    except KeyError:
+        raise ImproperlyConfigured(
+            f'JOB_BACKEND should be one of {", ".join(BACKENDS)}, not {settings.JOB_BACKEND}')
+
+
+def worker_name():
+    return f'{socket.gethostname()}.{uuid.uuid4().hex[:8]}'
+
+
+def claim_jobs(worker, queues, batch_size):
+    """
+    Lease up to batch_size due jobs of queues to worker, taking from the queues in order,
+    and return them. Jobs whose lease ran out are claimed again.
+    """
+    now = timezone.now()
+    due = Q(status=Job.PENDING, run_at__lte=now) | Q(status=Job.RUNNING, locked_until__lte=now)
+    ids = []
+    with transaction.atomic():
+        for queue in queues:
+            if len(ids) >= batch_size:
+                break
+            queryset = Job.objects.filter(due, queue=queue).order_by('run_at')
+            if connection.features.has_select_for_update_skip_locked:
+                queryset = queryset.select_for_update(skip_locked=True)
+            ids.extend(queryset.values_list('id', flat=True)[:batch_size - len(ids)])
+        # due again as databases without row locks, e.g. sqlite, may let two workers
+        # select the same jobs, only one of them updates each
+        Job.objects.filter(due, id__in=ids).update(
+            status=Job.RUNNING, attempts=F('attempts') + 1, claimed_by=worker,
+            locked_until=now + timezone.timedelta(seconds=settings.JOB_LEASE_SECONDS))
+    jobs = {job.id: job for job in Job.objects.filter(
+        id__in=ids, claimed_by=worker, status=Job.RUNNING)}
+    return [jobs[job_id] for job_id in ids if job_id in jobs]
+
+
+def run_job(job):
+    """Run a claimed job and record its result, returns whether it finished."""
+    if job.attempts > settings.JOB_MAX_ATTEMPTS:
+        job.status = Job.FAILED
+        job.last_error = f'Lease ran out {job.attempts - 1} times'
+    else:
+        try:
+            import_string(job.func)(*json.loads(job.args), **json.loads(job.kwargs))
+        except Exception:
+            job.status = Job.FAILED
+            job.last_error = traceback.format_exc()
+        else:
+            job.status = Job.FINISHED
+            job.last_error = ''
+    job.finished_at = timezone.now()
+    job.locked_until = None
+    # a job scheduled again while it ran is pending again and left as it is
+    Job.objects.filter(id=job.id, status=Job.RUNNING, claimed_by=job.claimed_by).update(
+        status=job.status, finished_at=job.finished_at, locked_until=None,
+        last_error=job.last_error)
+    return job.status == Job.FINISHED
+
+
+def cron_job_key(func, tick):
+    return f'cron:{func}:{tick.isoformat()}'
+
+
+def enqueue_cron_jobs(cron_jobs=None, now=None):
+    """
+    Queue the next tick of each of cron_jobs, RQ_CRON_JOBS by default, unless already
+    queued. Ticks missed while no worker ran are skipped like rq-scheduler does.
+    """
+    cron_jobs = settings.RQ_CRON_JOBS if cron_jobs is None else cron_jobs
+    now = now or timezone.now()
+    jobs = []
+    for cron_job in cron_jobs:
+        func = cron_job['func']
+        if not isinstance(func, str):
+            func = job_path(func)
+        tick = croniter(cron_job['cron_string'], now).get_next(datetime.datetime)
+        jobs.append(Job(
+            queue=cron_job.get('queue_name') or route(import_string(func)), func=func,
+            args=json.dumps(list(cron_job.get('args') or [])),
+            kwargs=json.dumps(cron_job.get('kwargs') or {}),
+            key=cron_job_key(func, tick), run_at=tick))
+    Job.objects.bulk_create(jobs, ignore_conflicts=True)
+    return jobs
+
+
+def delete_finished_jobs():
+    """Delete the jobs finished more than JOB_RESULT_TTL seconds ago, failed ones are kept."""
+    finished_before = timezone.now() - timezone.timedelta(seconds=settings.JOB_RESULT_TTL)
+    return Job.objects.filter(status=Job.FINISHED, finished_at__lt=finished_before).delete()[0]
+
+
+def default_queues():
+    return [queue for queue in QUEUES if queue in settings.RQ_QUEUES]
@@ -0,0 +1,85 @@
+"""
+Compare the job throughput of the database job backend with the rq backend.
+--jobs jobs each reading a row from the database are queued on --queue with each backend,
+then drained by --workers burst workers: dbworker processes for the database backend and
+an rqworkers pool for rq. The rq backend is skipped when redis can not be reached.
+Run it against idle workers, jobs already queued on --queue are run too.
+"""
+import subprocess
+import sys
+import time
+
+import django_rq
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from redis.exceptions import ConnectionError
+
+from common.job_backends import get_job_backend
+from common.management.commands.benchmark_workers import benchmark_job
+from common.models import Job
+from common.queues import job_path
+
+
+class Command(BaseCommand):
+    help = __doc__
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jobs', type=int, dest='jobs', default=2000)
+        parser.add_argument('--workers', type=int, dest='workers', default=4)
+        parser.add_argument('--batch-size', type=int, dest='batch_size', default=20)
+        parser.add_argument('--queue', dest='queue', default='default')
+        parser.add_argument('--backends', nargs='+', dest='backends',
+                            choices=['database', 'rq'], default=['database', 'rq'])
+
+    def handle(self, *args, **options):
+        self.options = options
+        manage = [sys.executable, sys.argv[0]]
+        runs = {
+            'database': [manage + ['dbworker', '--burst', '--batch-size',
+                                   str(options['batch_size']), options['queue']]
+                         for number in range(options['workers'])],
+            'rq': [manage + ['rqworkers', '--burst', '--concurrency',
+                             str(options['workers']), options['queue']]],
+        }
+        self.stdout.write(f'{options["jobs"]} jobs, {options["workers"]} workers')
+        self.stdout.write(f'{"":<10} {"queue jobs/s":>12} {"seconds":>8} {"jobs/s":>8}')
+        for name in options['backends']:
+            if name == 'rq' and not self.redis_available():
+                self.stderr.write('Skipping rq, redis can not be reached.')
+                continue
+            with override_settings(JOB_BACKEND=name, RQ_JOB_ROUTES={
+                    job_path(benchmark_job): options['queue']}):
+                self.run(name, runs[name])
+
+    def redis_available(self):
+        try:
+            return django_rq.get_connection(self.options['queue']).ping()
+        except ConnectionError:
+            return False
+
+    def left(self, name):
+        if name == 'rq':
+            return django_rq.get_queue(self.options['queue']).count
+        return Job.objects.filter(func=job_path(benchmark_job), status=Job.PENDING).count()
+
+    def run(self, name, commands):
+        jobs = self.options['jobs']
+        backend = get_job_backend()
+        start = time.perf_counter()
+        for number in range(jobs):
+            backend.enqueue(benchmark_job)
+        queue_rate = jobs / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        processes = [subprocess.Popen(command, stdout=subprocess.DEVNULL,
+                                      stderr=subprocess.DEVNULL) for command in commands]
+        for process in processes:
+            process.wait()
+        duration = time.perf_counter() - start
+        left = self.left(name)
+        self.stdout.write(f'{name:<10} {queue_rate:>12.0f} {duration:>8.2f} '
+                          f'{(jobs - left) / duration:>8.0f}')
+        if left:
+            self.stderr.write(f'{left} jobs were left on the queue.')
+        if name == 'database':
+            Job.objects.filter(func=job_path(benchmark_job)).delete()
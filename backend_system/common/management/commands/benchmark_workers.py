@@ -0,0 +1,53 @@
+"""
+Compare the job throughput of the rqworkers pools with stock rqworker processes.
+--jobs jobs each reading a row from the database are enqueued on --queue and drained by
+--workers burst workers of each kind. Run it against an idle redis, jobs already queued on
+--queue are run too.
+"""
+import subprocess
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+from django_rq import get_queue
+
+from authentication.models import User
+
+
+def benchmark_job():
+    return User.objects.exists()
+
+
+class Command(BaseCommand):
+    help = __doc__
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jobs', type=int, dest='jobs', default=2000)
+        parser.add_argument('--workers', type=int, dest='workers', default=4)
+        parser.add_argument('--queue', dest='queue', default='bulk')
+
+    def handle(self, *args, **options):
+        manage = [sys.executable, sys.argv[0]]
+        runs = [
+            ('rqworker', [manage + ['rqworker', '--burst', options['queue']]
+                          for number in range(options['workers'])]),
+            ('rqworkers', [manage + ['rqworkers', '--burst', '--concurrency',
+                                     str(options['workers']), options['queue']]]),
+        ]
+        self.stdout.write(f'{options["jobs"]} jobs, {options["workers"]} workers')
+        self.stdout.write(f'{"":<12} {"seconds":>8} {"jobs/s":>8}')
+        for name, commands in runs:
+            queue = get_queue(options['queue'])
+            for number in range(options['jobs']):
+                queue.enqueue(benchmark_job)
+            start = time.perf_counter()
+            processes = [subprocess.Popen(command, stdout=subprocess.DEVNULL,
+                                          stderr=subprocess.DEVNULL) for command in commands]
+            for process in processes:
+                process.wait()
+            duration = time.perf_counter() - start
+            left = queue.count
+            self.stdout.write(f'{name:<12} {duration:>8.2f} '
+                              f'{(options["jobs"] - left) / duration:>8.0f}')
+            if left:
+                self.stderr.write(f'{left} jobs were left on the queue.')
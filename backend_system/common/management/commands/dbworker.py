@@ -0,0 +1,81 @@
+"""
+Run the jobs of the database job backend, JOB_BACKEND = 'database', on the given queues,
+all queues by default, taken in the order of common.queues.QUEUES.
+The worker claims JOB_BATCH_SIZE due jobs at a time and runs them in its own process, and
+queues the RQ_CRON_JOBS in place of rqscheduler. Start as many workers as needed, they
+never claim the same job. Stopping the command stops the worker after its current batch.
+"""
+import logging
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+
+from common.job_backends import (
+    claim_jobs, default_queues, delete_finished_jobs, enqueue_cron_jobs, run_job, worker_name)
+from common.workers import close_unusable_connections
+
+logger = logging.getLogger(__name__)
+
+# cron ticks are at least a minute apart, polling more often queues every tick
+CRON_SECONDS = 30
+CLEANUP_SECONDS = 60
+
+
+class Command(BaseCommand):
+    help = __doc__
+
+    def add_arguments(self, parser):
+        parser.add_argument('queues', nargs='*', help='Queues to run the jobs of.')
+        parser.add_argument('--batch-size', type=int, dest='batch_size',
+                            default=settings.JOB_BATCH_SIZE)
+        parser.add_argument('--interval', type=float, dest='interval', default=1,
+                            help='Seconds to wait for jobs when none are due.')
+        parser.add_argument('--burst', action='store_true', dest='burst',
+                            help='Stop once no job is due, cron jobs are not queued.')
+
+    def handle(self, *args, **options):
+        queues = options['queues'] or default_queues()
+        unknown = set(queues) - set(settings.RQ_QUEUES)
+        if unknown:
+            raise CommandError(f'Unknown queues: {", ".join(sorted(unknown))}')
+
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        worker = worker_name()
+        self.stdout.write(f'Worker {worker} running jobs of {", ".join(queues)}')
+        next_cron = next_cleanup = 0
+        finished = failed = 0
+        while not self.stopping:
+            try:
+                if not options['burst'] and time.monotonic() >= next_cron:
+                    enqueue_cron_jobs()
+                    next_cron = time.monotonic() + CRON_SECONDS
+                if time.monotonic() >= next_cleanup:
+                    delete_finished_jobs()
+                    next_cleanup = time.monotonic() + CLEANUP_SECONDS
+                jobs = claim_jobs(worker, queues, options['batch_size'])
+                for job in jobs:
+                    close_unusable_connections()
+                    if run_job(job):
+                        finished += 1
+                    else:
+                        failed += 1
+                        logger.error('Job %s %s failed: %s', job.id, job.func, job.last_error)
+            except DatabaseError:
+                # e.g. a lost connection or a locked sqlite database, jobs whose result was
+                # not saved run again once their lease runs out
+                logger.warning('Worker %s could not reach the database', worker, exc_info=True)
+                close_unusable_connections()
+                jobs = []
+            if not jobs:
+                if options['burst']:
+                    break
+                time.sleep(options['interval'])
+        self.stdout.write(f'Worker {worker} stopped, {finished} jobs finished, {failed} failed')
+
+    def stop(self, signum, frame):
+        self.stopping = True
@@ -1,15 +1,23 @@
 """
 Custom rqscheduler command based on how django_rq runs rqscheduler jobs
 https://github.com/rq/django-rq/blob/master/django_rq/management/commands/rqscheduler.py
+
+Several schedulers may run for failover, only the leader registers the RQ_CRON_JOBS and
+queues due jobs, see common.scheduler.
 """
 from importlib import import_module
 import logging
 import os
+import signal
+import time
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+
+from django_rq import get_connection, get_queue
 
-from django_rq import get_scheduler
+from common.queues import route
+from common.scheduler import LeaderScheduler
 
 
 logger = logging.getLogger(__name__)
@@ -30,12 +38,50 @@ class Command(BaseCommand):
         parser.add_argument('args', nargs='*')
 
     def handle(self, *args, **options):
+        heartbeat = settings.RQ_SCHEDULER_HEARTBEAT_SECONDS
+        # a standby waits a heartbeat for the lease, redis_lock refuses to wait longer
+        # than the lease lasts
+        if not 1 <= heartbeat < settings.RQ_SCHEDULER_LEASE_SECONDS:
+            raise CommandError('RQ_SCHEDULER_HEARTBEAT_SECONDS should be at least 1 and '
+                               'shorter than RQ_SCHEDULER_LEASE_SECONDS.')
         pid = options.get('pid')
         if pid:
             with open(os.path.expanduser(pid), "w") as fp:
                 fp.write(str(os.getpid()))
 
-        scheduler = get_scheduler(name=options.get('queue'), interval=options.get('interval'))
+        scheduler = self.get_scheduler(options.get('queue'), options.get('interval'))
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        next_run = 0
+        try:
+            while not self.stopping:
+                was_leader = scheduler.is_leader
+                # a standby waits here for the lease, up to a heartbeat
+                if not scheduler.elect(timeout=heartbeat):
+                    continue
+                if not was_leader:
+                    self.register_cron_jobs(scheduler)
+                    next_run = 0
+                if time.monotonic() >= next_run:
+                    scheduler.enqueue_jobs()
+                    next_run = time.monotonic() + options.get('interval')
+                time.sleep(min(heartbeat, max(next_run - time.monotonic(), 0)))
+        finally:
+            scheduler.step_down()
+
+    def get_scheduler(self, queue_name, interval):
+        # without a queue of its own the scheduler queues each job on the queue it was
+        # scheduled for, django_rq's get_scheduler would queue every job on queue_name
+        return LeaderScheduler(
+            queue_name=queue_name, interval=interval, job_class=get_queue(queue_name).job_class,
+            connection=get_connection(queue_name))
+
+    def stop(self, signum, frame):
+        self.stopping = True
+
+    def register_cron_jobs(self, scheduler):
         cron_jobs = getattr(settings, 'RQ_CRON_JOBS')
 
         scheduled_job_ids = []
@@ -47,12 +93,19 @@ class Command(BaseCommand):
                 mod = import_module(module)
                 cron_job['func'] = getattr(mod, attribute)
 
-            job_id = f'{cron_job['func'].__module__}.{cron_job['func'].__name__}'
+            job_id = f'{cron_job["func"].__module__}.{cron_job["func"].__name__}'
             scheduled_job_ids.append(job_id)
+            queue_name = cron_job.get('queue_name', route(cron_job['func']))
 
             if job_id in scheduler:
-                # dequeue job if it had been initially queued
+                # registered by a previous leader, kept unless it changed so a tick due
+                # during the failover is still queued
                 job = scheduler.job_class.fetch(job_id, connection=scheduler.connection)
+                if (job.meta.get('cron_string') == cron_job['cron_string'] and
+                        job.origin == queue_name and
+                        list(job.args) == list(cron_job.get('args') or []) and
+                        job.kwargs == (cron_job.get('kwargs') or {})):
+                    continue
                 scheduler.cancel(job)
 
             logger.info(f'Scheduling job {job_id} with schedule {cron_job["cron_string"]}')
@@ -62,15 +115,14 @@ class Command(BaseCommand):
                 args=cron_job.get('args'),
                 kwargs=cron_job.get('kwargs'),
                 repeat=cron_job.get('repeat'),
-                queue_name=cron_job.get('queue_name', 'default'),
+                queue_name=queue_name,
                 id=job_id,
             )
-        # cancel all jobs that are not in the settings file currently
+        # cancel all cron jobs that are not in the settings file currently, jobs scheduled
+        # once such as booking reminders are left alone
         bad_cron_jobs = [
             job for job in scheduler.get_jobs()
-            if job.id not in scheduled_job_ids
+            if job.id not in scheduled_job_ids and 'cron_string' in job.meta
         ]
         for job in bad_cron_jobs:
             scheduler.cancel(job)
-
-        scheduler.run()
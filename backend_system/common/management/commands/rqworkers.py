@@ -0,0 +1,105 @@
+"""
+Start the worker pools of the job queues, RQ_WORKER_CONCURRENCY workers per queue, each
+serving that queue only so a busy queue never holds up the others.
+Django is loaded once and every worker is forked from this process. Workers run their jobs
+without forking and keep their database connections between jobs, see common.workers. A
+worker stopping after RQ_WORKER_MAX_JOBS jobs or RQ_WORKER_MAX_MEMORY MB is replaced.
+Stopping the command stops the workers after their current job.
+"""
+import os
+import signal
+import sys
+import time
+import traceback
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django_rq import get_queue
+
+from common.queues import QUEUES
+from common.workers import PoolWorker
+
+# a worker exiting sooner than this after its start is restarted after a pause
+MIN_WORKER_SECONDS = 1
+
+
+class Command(BaseCommand):
+    help = __doc__
+
+    def add_arguments(self, parser):
+        parser.add_argument('queues', nargs='*',
+                            help='Queues to start the pools of, all queues by default.')
+        parser.add_argument('--concurrency', type=int, dest='concurrency', default=None,
+                            help='Workers per queue in place of RQ_WORKER_CONCURRENCY.')
+        parser.add_argument('--max-jobs', type=int, dest='max_jobs',
+                            default=settings.RQ_WORKER_MAX_JOBS)
+        parser.add_argument('--max-memory', type=int, dest='max_memory',
+                            default=settings.RQ_WORKER_MAX_MEMORY, help='In MB.')
+        parser.add_argument('--burst', action='store_true', dest='burst',
+                            help='Workers stop once their queue is empty and are not replaced.')
+
+    def handle(self, *args, **options):
+        queues = options['queues'] or [queue for queue in QUEUES if queue in settings.RQ_QUEUES]
+        unknown = set(queues) - set(settings.RQ_QUEUES)
+        if unknown:
+            raise CommandError(f'Unknown queues: {", ".join(sorted(unknown))}')
+
+        self.options = options
+        self.stopping = False
+        # pid: (queue, start time) of the running workers
+        self.workers = {}
+        # workers open their own connections
+        connections.close_all()
+        for queue in queues:
+            concurrency = options['concurrency'] or settings.RQ_WORKER_CONCURRENCY.get(queue, 1)
+            self.stdout.write(f'Starting {concurrency} workers of queue {queue}')
+            for number in range(concurrency):
+                self.start_worker(queue)
+
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        while self.workers:
+            pid, status = os.wait()
+            if pid not in self.workers:
+                continue
+            queue, started = self.workers.pop(pid)
+            if self.stopping or options['burst']:
+                continue
+            if time.monotonic() - started < MIN_WORKER_SECONDS:
+                self.stderr.write(f'Worker {pid} of queue {queue} exited on start')
+                time.sleep(MIN_WORKER_SECONDS)
+            self.start_worker(queue)
+
+    def start_worker(self, queue):
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = (queue, time.monotonic())
+            return
+        # worker process
+        code = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            rq_queue = get_queue(queue)
+            worker = PoolWorker(
+                [rq_queue], connection=rq_queue.connection, max_jobs=self.options['max_jobs'],
+                max_memory=self.options['max_memory'])
+            worker.work(burst=self.options['burst'])
+        except BaseException:
+            code = 1
+            traceback.print_exc()
+        finally:
+            connections.close_all()
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+
+    def stop(self, signum, frame):
+        # workers finish their current job on SIGTERM
+        self.stopping = True
+        for pid in self.workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
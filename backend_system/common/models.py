@@ -2,8 +2,10 @@ import datetime
 import pytz
 import uuid
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 from django.db.models.signals import post_delete, pre_delete
+from django.utils import timezone
 
 
 class BaseModel(models.Model):
@@ -31,12 +33,19 @@ class SoftDeleteQuerySet(models.QuerySet):
     def deleted(self):
         return self.exclude(deleted_at=None)
 
+    def delete_cascade(self, deleted_at=None):
+        return soft_delete_cascade(self, deleted_at=deleted_at)
+
+    def restore_cascade(self):
+        return restore_cascade(self)
+
 
 class SoftDeleteManager(models.Manager):
     queryset_class = SoftDeleteQuerySet
 
     def __init__(self, *args, **kwargs):
         self.with_deleted = kwargs.pop('with_deleted', False)
+        self.queryset_class = kwargs.pop('queryset_class', self.queryset_class)
         super(SoftDeleteManager, self).__init__(*args, **kwargs)
 
     def get_queryset(self):
@@ -62,3 +71,101 @@ class SoftDeleteModel(BaseModel):
 
     def hard_delete(self):
         super(SoftDeleteModel, self).delete()
+
+    def restore(self):
+        restore_cascade(type(self).objects_with_deleted.filter(pk=self.pk))
+        self.deleted_at = None
+
+
+def _cascade(queryset, select, path=()):
+    """
+    Return queryset and the querysets of the soft delete rows pointing at it, following
+    reverse foreign keys and one to ones. Dependents come first so that every queryset is
+    run before the rows its subquery selects on are updated.
+        select: narrows the rows of a dependent queryset, called with the queryset and
+                the name of its field pointing at the parent.
+    """
+    model = queryset.model
+    path = path + (model,)
+    querysets = []
+    for rel in model._meta.related_objects:
+        related_model = rel.related_model
+        if (rel.many_to_many or related_model in path or
+                not issubclass(related_model, SoftDeleteModel)):
+            continue
+        related = related_model.objects_with_deleted.filter(
+            **{f'{rel.field.name}__in': queryset.values('pk')})
+        querysets.extend(_cascade(select(related, rel.field.name), select, path))
+    querysets.append(queryset)
+    return querysets
+
+
+def _update_cascade(querysets, **values):
+    counts = {}
+    with transaction.atomic():
+        for queryset in querysets:
+            label = queryset.model._meta.label
+            counts[label] = counts.get(label, 0) + queryset.update(**values)
+    return sum(counts.values()), counts
+
+
+def soft_delete_cascade(queryset, deleted_at=None):
+    """
+    Soft delete the rows of queryset and every soft delete row depending on them with one
+    UPDATE per relation, all sharing one deleted_at. Rows deleted earlier keep their
+    deleted_at. Returns the number of rows deleted and the count per model like
+    QuerySet.delete.
+    """
+    deleted_at = deleted_at or datetime.datetime.now(pytz.UTC)
+    querysets = _cascade(queryset.filter(deleted_at=None),
+                         lambda related, field: related.filter(deleted_at=None))
+    return _update_cascade(querysets, deleted_at=deleted_at)
+
+
+def restore_cascade(queryset):
+    """
+    Restore the deleted rows of queryset and the rows deleted along with them by
+    soft_delete_cascade, those sharing the deleted_at of the row they point at.
+    queryset should come from objects_with_deleted.
+    """
+    querysets = _cascade(
+        queryset.exclude(deleted_at=None),
+        lambda related, field: related.filter(deleted_at=F(f'{field}__deleted_at')))
+    return _update_cascade(querysets, deleted_at=None)
+
+
+class Job(BaseModel):
+    """A job of the database job backend, see common.job_backends."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FINISHED = 'finished'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (FINISHED, 'Finished'),
+        (FAILED, 'Failed'),
+    )
+
+    queue = models.CharField(max_length=50)
+    # dotted path of the job function, called with the JSON encoded args and kwargs
+    func = models.CharField(max_length=255)
+    args = models.TextField(default='[]')
+    kwargs = models.TextField(default='{}')
+    # id of a scheduled job or cron tick, scheduling a key again replaces its job
+    key = models.CharField(max_length=255, unique=True, blank=True, null=True)
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    claimed_by = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            # jobs of a queue in the order they are claimed
+            models.Index(fields=['queue', 'run_at'], name='job_pending_idx',
+                         condition=models.Q(status='pending')),
+            models.Index(fields=['status', 'locked_until'], name='job_status_idx'),
+        ]
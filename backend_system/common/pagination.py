@@ -1,5 +1,16 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import datetime
+import json
+import math
+
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.models import Q
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class CustomPaginator(PageNumberPagination):
@@ -17,3 +28,152 @@ class CustomPaginator(PageNumberPagination):
 
     def get_paginated_response(self, data):
         return Response(self.build_response_data(data))
+
+
+class KeysetPaginator(BasePagination):
+    """
+    Paginate with opaque cursors holding the ordering values of the last row served, so a
+    page is an index range scan whatever its depth instead of an OFFSET scan.
+    Ordering fields must not be null and the last one must be unique; a viewset may set
+    keyset_ordering to order by other fields than (created_at, id).
+    Responses keep the CustomPaginator envelope with next and previous links added.
+    """
+    page_size = CustomPaginator.page_size
+    page_size_query_param = CustomPaginator.page_size_query_param
+    max_page_size = CustomPaginator.max_page_size
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    ordering = ('created_at', 'id')
+    # estimate total_count from the planner statistics instead of a COUNT(*)
+    estimate_count = False
+    # estimates below this are replaced by an exact count, small counts are cheap
+    exact_count_below = 1000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = tuple(getattr(view, 'keyset_ordering', self.ordering))
+        self.total_count = self.get_count(queryset)
+        values, reverse = self.decode_cursor(request)
+
+        ordering = self.ordering if not reverse else tuple(
+            self.flip(field) for field in self.ordering)
+        queryset = queryset.order_by(*ordering)
+        try:
+            if values is not None:
+                queryset = queryset.filter(self.after(ordering, values))
+            rows = list(queryset[:self.page_size + 1])
+        except (ValidationError, ValueError):
+            # cursor values that do not fit the ordering fields
+            raise NotFound(self.invalid_cursor_message)
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        self.next_values = self.previous_values = None
+        if rows and (has_more or reverse):
+            self.next_values = self.row_values(rows[-1])
+        if rows and (has_more if reverse else values is not None):
+            self.previous_values = self.row_values(rows[0])
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+            if page_size > 0:
+                return min(page_size, self.max_page_size)
+        except (KeyError, ValueError):
+            pass
+        return self.page_size
+
+    def get_count(self, queryset):
+        if self.estimate_count:
+            estimate = self.estimated_count(queryset)
+            if estimate is not None and estimate >= self.exact_count_below:
+                return estimate
+        return queryset.count()
+
+    def estimated_count(self, queryset):
+        """Row estimate of the planner for queryset, None where the database has none."""
+        if connection.vendor != 'postgresql':
+            return None
+        sql, params = queryset.order_by().values('pk').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+    @staticmethod
+    def flip(field):
+        return field[1:] if field.startswith('-') else '-' + field
+
+    @staticmethod
+    def after(ordering, values):
+        """Filter for the rows that come after values in ordering."""
+        condition = Q()
+        for position in reversed(range(len(ordering))):
+            field = ordering[position].lstrip('-')
+            lookup = 'lt' if ordering[position].startswith('-') else 'gt'
+            greater = Q(**{f'{field}__{lookup}': values[position]})
+            condition = greater if not condition else greater | (
+                Q(**{field: values[position]}) & condition)
+        return condition
+
+    def row_values(self, row):
+        values = []
+        for field in self.ordering:
+            value = getattr(row, field.lstrip('-'))
+            if isinstance(value, (datetime.date, datetime.datetime)):
+                value = value.isoformat()
+            values.append(str(value))
+        return values
+
+    def encode_cursor(self, values, reverse):
+        cursor = json.dumps({'v': values, 'r': reverse}, separators=(',', ':'))
+        cursor = base64.urlsafe_b64encode(cursor.encode()).decode()
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+            values, reverse = cursor['v'], bool(cursor['r'])
+        except (TypeError, ValueError, KeyError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    def get_next_link(self):
+        if self.next_values is None:
+            return None
+        return self.encode_cursor(self.next_values, False)
+
+    def get_previous_link(self):
+        if self.previous_values is None:
+            return None
+        return self.encode_cursor(self.previous_values, True)
+
+    def build_response_data(self, data):
+        return {
+            'total_count': self.total_count,
+            'total_pages': max(1, math.ceil(self.total_count / self.page_size)),
+            'page_size': self.page_size,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+
+    def get_paginated_response(self, data):
+        return Response(self.build_response_data(data))
+
+
+class EstimatedCountKeysetPaginator(KeysetPaginator):
+    """KeysetPaginator whose total_count of large results is a planner estimate."""
+    estimate_count = True
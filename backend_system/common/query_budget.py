@@ -0,0 +1,235 @@
+"""
+Query budget harness.
+
+Calls every GET endpoint of the API with seeded data at two sizes, as a staff user and as a
+regular user, and records the number of queries and the SQL time of each call. An endpoint fails when its queries grow with the size
+of the data or go over its budget, which catches per row queries added to serializers.
+
+Endpoints are discovered from the root urlconf; the url kwargs and query params of each are
+declared in URL_KWARGS and QUERY_PARAMS below, an endpoint without kwargs fails until they
+are declared.
+"""
+import json
+import time
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import NoReverseMatch, get_resolver, reverse
+from django.utils import timezone
+
+from authentication.models import User
+from bookings.models import Booking
+from flights.inventory import SeatMap
+from flights.models import Flight, LayoutSeat, Location, Seat, SeatInventory, SeatLayout
+
+# queries allowed for a call, endpoints not listed get DEFAULT_BUDGET
+DEFAULT_BUDGET = 2
+BUDGETS = {
+    'bookings:flight-bookings-detail': 3,
+    'bookings:flight-bookings-list': 4,
+    'flights:flight-search': 4,
+    'flights:flight-seat-detail': 3,
+    'flights:flight-seat-list': 5,
+}
+
+URL_KWARGS = {
+    'authentication:user-detail': lambda seed: {'pk': seed['user'].pk},
+    'bookings:booking-detail': lambda seed: {'pk': seed['booking'].pk},
+    'bookings:flight-bookings-list': lambda seed: {'flight_pk': seed['flight'].pk},
+    'bookings:flight-bookings-detail': lambda seed: {
+        'flight_pk': seed['flight'].pk, 'pk': seed['booking'].pk},
+    'flights:destination-detail': lambda seed: {'pk': seed['location'].pk},
+    'flights:flight-detail': lambda seed: {'pk': seed['flight'].pk},
+    'flights:flight-seat-list': lambda seed: {'flight_pk': seed['flight'].pk},
+    'flights:flight-seat-adjacent': lambda seed: {'flight_pk': seed['flight'].pk},
+    'flights:flight-seat-detail': lambda seed: {
+        'flight_pk': seed['flight'].pk, 'pk': seed['seat'].pk},
+    'flights:flight-seat-inventory': lambda seed: {'flight_pk': seed['inventory_flight'].pk},
+    'flights:seat-layout-detail': lambda seed: {'pk': seed['layout'].pk},
+}
+
+QUERY_PARAMS = {
+    'flights:flight-search': lambda seed: {
+        'origin': seed['location'].pk, 'destination': seed['other_location'].pk},
+    'flights:flight-seat-adjacent': lambda seed: {'seats': 2},
+}
+
+# every endpoint is called as each of these, a regular user gets the serializers and querysets
+# scoped to them
+ROLES = ('staff', 'regular')
+
+# endpoints a regular user is expected to be refused
+STAFF_ONLY = {'bookings:outbox-metrics'}
+
+# endpoints that read no data from the database, name: reason
+UNMEASURED = {
+    'common:queue-metrics': 'reads the job queues from redis',
+}
+
+# list endpoints are called with the largest page so every seeded row is serialized
+PAGE_SIZE = 100
+
+
+def get_endpoints(urlconf=None):
+    """Return the names of the API endpoints of urlconf that answer GET requests."""
+    endpoints = []
+
+    def walk(patterns, namespace):
+        for pattern in patterns:
+            if hasattr(pattern, 'url_patterns'):
+                walk(pattern.url_patterns,
+                     ':'.join(filter(None, [namespace, pattern.namespace])))
+                continue
+            view = getattr(pattern.callback, 'cls', None)
+            if view is None or not pattern.name:
+                # not a rest framework view e.g. the admin
+                continue
+            # viewsets map methods to actions, plain api views implement the method
+            actions = getattr(pattern.callback, 'actions', None)
+            if actions is None and hasattr(view, 'get') or actions and 'get' in actions:
+                endpoints.append(':'.join(filter(None, [namespace, pattern.name])))
+
+    walk(get_resolver(urlconf).url_patterns, None)
+    return sorted(set(endpoints) - set(UNMEASURED))
+
+
+def seed(size, seed_data=None):
+    """
+    Add size users, flights, seats, bookings and seat layouts to the database, the bookings
+    are all booked by the regular user the endpoints are called as.
+    Returns the objects the endpoints are called with, passing them back in seed_data adds
+    rows to the same flight and layout.
+    """
+    if seed_data is None:
+        staff = User.objects.create_superuser(
+            email='query.budget@email.com', password='querybudget')
+        passenger = User.objects.create_user(
+            email='query.budget.passenger@email.com', password='querybudget')
+        location = Location.objects.create(country='Kenya', city='Nairobi', airport='JKIA')
+        other_location = Location.objects.create(
+            country='France', city='Paris', airport='Gaulle')
+        flight = Flight.objects.create(
+            name='QUERYBUDGET', origin=location, destination=other_location,
+            created_by=staff, departure_time=timezone.now())
+        inventory_flight = Flight.objects.create(name='QUERYBUDGET INVENTORY', created_by=staff)
+        seat_map = SeatMap(rows=0, letters='ABCDEF', bands=[])
+        seed_data = {
+            'staff': staff, 'regular': passenger, 'location': location, 'other_location': other_location,
+            'flight': flight, 'inventory_flight': inventory_flight, 'seat_map': seat_map,
+            'layout': SeatLayout.objects.create(name='QUERYBUDGET'), 'count': 0}
+        inventory = SeatInventory(flight=inventory_flight)
+        inventory.seat_map = seat_map
+        inventory.save()
+
+    first = seed_data['count'] + 1
+    flight = seed_data['flight']
+    for number in range(first, first + size):
+        user = User.objects.create_user(
+            email=f'query.budget{number}@email.com', password='querybudget')
+        Flight.objects.create(
+            name=f'QUERYBUDGET {number}', origin=seed_data['location'],
+            destination=seed_data['other_location'], created_by=seed_data['staff'],
+            departure_time=flight.departure_time)
+        seat = Seat.objects.create(flight=flight, row=number, letter='A')
+        booking = Booking.objects.create(
+            booked_by=seed_data['regular'], origin=seed_data['location'],
+            destination=seed_data['other_location'], travel_date=flight.departure_time,
+            flight=flight, seat=seat)
+        LayoutSeat.objects.create(
+            layout=seed_data['layout'], row=number, letter='A', class_group='Economy')
+        seed_data.setdefault('user', user)
+        seed_data.setdefault('seat', seat)
+        seed_data.setdefault('booking', booking)
+
+    seat_map = seed_data['seat_map']
+    seat_map.rows = first + size - 1
+    seat_map.bands = [('Economy', 1, seat_map.rows)]
+    for number in range(first, first + size):
+        seat_map.add(number, 'A', booked=number % 2 == 0)
+    inventory = SeatInventory.objects.get(flight=seed_data['inventory_flight'])
+    inventory.seat_map = seat_map
+    inventory.save()
+    seed_data['count'] += size
+    return seed_data
+
+
+def measure(client, path, params=None):
+    """Call path and return the response status, number of queries and SQL time in ms."""
+    durations = []
+
+    def timer(execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            durations.append(time.perf_counter() - start)
+
+    with CaptureQueriesContext(connection) as queries, connection.execute_wrapper(timer):
+        response = client.get(path, params or {})
+    return response.status_code, len(queries), round(sum(durations) * 1000, 3)
+
+
+def run(client, sizes=(2, 12), urlconf=None):
+    """
+    Seed the database at each of sizes and call every endpoint as each of ROLES.
+    Returns the report, a dict of endpoint name to its measurements per role and failures.
+    """
+    seed_data = None
+    seeded = 0
+    report = {}
+    endpoints = get_endpoints(urlconf)
+    for size in sorted(sizes):
+        seed_data = seed(size - seeded, seed_data)
+        seeded = size
+        for role in ROLES:
+            client.force_authenticate(user=seed_data[role])
+            for name in endpoints:
+                entry = report.setdefault(name, {
+                    'budget': BUDGETS.get(name, DEFAULT_BUDGET), 'failures': []})
+                measurements = entry.setdefault(
+                    role, {'status': {}, 'queries': {}, 'sql_time_ms': {}})
+                try:
+                    path = reverse(
+                        name, kwargs=URL_KWARGS.get(name, lambda seed: None)(seed_data))
+                except NoReverseMatch:
+                    if not entry['failures']:
+                        entry['failures'].append('No url kwargs declared in URL_KWARGS.')
+                    continue
+                params = dict(QUERY_PARAMS.get(name, lambda seed: {})(seed_data),
+                              **{'page-size': PAGE_SIZE})
+                status, queries, sql_time = measure(client, path, params)
+                measurements['status'][size] = status
+                measurements['queries'][size] = queries
+                measurements['sql_time_ms'][size] = sql_time
+
+    for name, entry in report.items():
+        for role in ROLES:
+            measurements = entry[role]
+            expected = 403 if role == 'regular' and name in STAFF_ONLY else 200
+            for size, status in measurements['status'].items():
+                if status != expected:
+                    entry['failures'].append(
+                        f'Responded {status} to the {role} user with {size} rows seeded.')
+            counts = [measurements['queries'][size] for size in sorted(measurements['queries'])]
+            if counts and counts[-1] > counts[0]:
+                entry['failures'].append(
+                    f'Queries of the {role} user grew from {counts[0]} to {counts[-1]} with '
+                    f'the data size.')
+            if counts and max(counts) > entry['budget']:
+                entry['failures'].append(
+                    f'Ran {max(counts)} queries for the {role} user, over its budget of '
+                    f'{entry["budget"]}.')
+    return report
+
+
+def failures(report):
+    """Return 'endpoint: failure' lines of a report."""
+    return [f'{name}: {failure}' for name, entry in sorted(report.items())
+            for failure in entry['failures']]
+
+
+def write_report(report, path):
+    """Write a report as sorted json so reports of two releases can be diffed."""
+    with open(path, 'w') as report_file:
+        json.dump(report, report_file, indent=2, sort_keys=True, default=str)
+        report_file.write('\n')
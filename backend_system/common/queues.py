@@ -0,0 +1,51 @@
+"""
+Job queues and their routing.
+
+Jobs go to one of the RQ_QUEUES: HIGH for work a user waits on such as booking emails,
+DEFAULT and BULK for fan-outs such as travel reminders, so a large fan-out never delays a
+confirmation. Each queue is served by its own pool of RQ_WORKER_CONCURRENCY workers, see
+the rqworkers command. A job's queue is looked up in RQ_JOB_ROUTES by the dotted path of
+its function, unrouted jobs go to DEFAULT. Jobs are queued with the JOB_BACKEND, see
+common.job_backends.
+"""
+from django.conf import settings
+
+HIGH = 'high'
+DEFAULT = 'default'
+BULK = 'bulk'
+# in the order workers serving several queues take jobs from them
+QUEUES = (HIGH, DEFAULT, BULK)
+
+
+def job_path(func):
+    return f'{func.__module__}.{func.__name__}'
+
+
+def route(func):
+    """Name of the queue jobs of func are enqueued on."""
+    return settings.RQ_JOB_ROUTES.get(job_path(func), DEFAULT)
+
+
+def routed_job(func):
+    """
+    Give func a delay method queueing it with the JOB_BACKEND on the queue RQ_JOB_ROUTES
+    gives it, like django_rq's job decorator.
+    """
+    def delay(*args, **kwargs):
+        # imported here as the backends import the Job model
+        from common.job_backends import get_job_backend
+
+        return get_job_backend().enqueue(func, *args, **kwargs)
+
+    func.delay = delay
+    return func
+
+
+def queue_metrics():
+    """
+    Depth, workers and wait of each queue, wait_seconds is how long the job at the head of
+    the queue has been waiting for a worker.
+    """
+    from common.job_backends import get_job_backend
+
+    return get_job_backend().queue_metrics()
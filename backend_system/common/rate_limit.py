@@ -0,0 +1,102 @@
+"""
+Token buckets limiting the rate of calls to external services.
+
+A bucket holds up to capacity tokens and is refilled with rate tokens per second, a call
+takes a token per unit of work. RedisTokenBucket keeps the bucket in redis so every worker
+shares it, LocalTokenBucket keeps it in the process for caches without redis, e.g. tests.
+"""
+import threading
+import time
+
+from django_redis import get_redis_connection
+
+# refill and take tokens in one step, using the redis clock so workers agree on the time
+TAKE_SCRIPT = """
+if redis.replicate_commands then redis.replicate_commands() end
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local granted = math.min(requested, math.floor(tokens))
+tokens = tokens - granted
+redis.call('HMSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+local wait = 0
+if granted < requested then
+    wait = (math.min(requested - granted, capacity) - tokens) / rate
+end
+return {granted, tostring(wait)}
+"""
+
+
+class TokenBucket:
+    def __init__(self, name, rate, capacity):
+        self.name = name
+        self.rate = float(rate)
+        self.capacity = int(capacity)
+
+    def take(self, count):
+        """Take up to count tokens, returns the number taken and seconds until the rest."""
+        raise NotImplementedError
+
+    def acquire(self, count):
+        """Take count tokens, at most capacity, waiting for the bucket to refill."""
+        count = min(count, self.capacity)
+        taken = 0
+        while True:
+            granted, wait = self.take(count - taken)
+            taken += granted
+            if taken >= count:
+                return taken
+            time.sleep(wait)
+
+
+class RedisTokenBucket(TokenBucket):
+    def __init__(self, name, rate, capacity, connection):
+        super().__init__(name, rate, capacity)
+        self.key = f'token-bucket:{name}'
+        self.script = connection.register_script(TAKE_SCRIPT)
+
+    def take(self, count):
+        granted, wait = self.script(keys=[self.key], args=[self.rate, self.capacity, count])
+        return int(granted), float(wait)
+
+
+class LocalTokenBucket(TokenBucket):
+    def __init__(self, name, rate, capacity):
+        super().__init__(name, rate, capacity)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self, count):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            granted = min(count, int(self.tokens))
+            self.tokens -= granted
+            wait = 0.0
+            if granted < count:
+                wait = (min(count - granted, self.capacity) - self.tokens) / self.rate
+            return granted, wait
+
+
+_local_buckets = {}
+
+
+def get_token_bucket(name, rate, capacity):
+    """Bucket shared through the redis of the default cache, or by the process without it."""
+    try:
+        return RedisTokenBucket(name, rate, capacity, get_redis_connection('default'))
+    except NotImplementedError:
+        # the default cache is not redis
+        key = (name, rate, capacity)
+        if key not in _local_buckets:
+            _local_buckets[key] = LocalTokenBucket(name, rate, capacity)
+        return _local_buckets[key]
@@ -0,0 +1,106 @@
+"""
+Leader-elected rq-scheduler of the rqscheduler command.
+
+Any number of rqscheduler processes may run, one of them leads and queues the scheduled
+jobs, the others stand by. The leader holds a redis lock for RQ_SCHEDULER_LEASE_SECONDS
+and renews it every RQ_SCHEDULER_HEARTBEAT_SECONDS, a standby waiting on the lock takes
+over as soon as the leader releases it on shutdown or its lease runs out.
+Each run of a scheduled job, a cron tick or a one-off job such as a booking reminder, is
+claimed with SET NX on a key made of the job id and its scheduled time before it is queued,
+by a script that also checks the scheduler still leads. A scheduler that lost its lease
+without noticing, e.g. after a long pause, queues nothing, and a new leader never queues a
+run its predecessor queued.
+"""
+import logging
+import os
+import socket
+
+import redis_lock
+from django.conf import settings
+from django_rq.queues import DjangoScheduler
+from rq_scheduler.utils import to_unix
+
+logger = logging.getLogger(__name__)
+
+# redis_lock keeps the lock in lock:<name>
+LEADER_LOCK = 'rq:scheduler:leader'
+# long enough for every scheduler to have moved past a run it was about to queue
+RUN_KEY_SECONDS = 600
+
+# 1 when the run is claimed, 0 when it was claimed before, -1 when the caller does not lead
+CLAIM_RUN_SCRIPT = """
+if redis.call('get', KEYS[1]) ~= ARGV[1] then
+    return -1
+end
+if redis.call('set', KEYS[2], ARGV[1], 'NX', 'EX', ARGV[2]) then
+    return 1
+end
+return 0
+"""
+
+
+class LeaderScheduler(DjangoScheduler):
+    def __init__(self, *args, leader_id=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.leader_id = leader_id or f'{socket.gethostname()}.{os.getpid()}'
+        self.lease = redis_lock.Lock(
+            self.connection, LEADER_LOCK, expire=settings.RQ_SCHEDULER_LEASE_SECONDS,
+            id=self.leader_id)
+        self.claim_run_script = self.connection.register_script(CLAIM_RUN_SCRIPT)
+        self.is_leader = False
+
+    def elect(self, timeout):
+        """
+        Renew the lease of the leader or wait up to timeout seconds to take it, returns
+        whether this scheduler leads.
+        """
+        if self.is_leader:
+            try:
+                self.lease.extend()
+            except redis_lock.NotAcquired:
+                logger.warning('Scheduler %s lost its lease', self.leader_id)
+                self.is_leader = False
+        if not self.is_leader:
+            self.is_leader = self.lease.acquire(timeout=timeout)
+            if self.is_leader:
+                logger.info('Scheduler %s leads', self.leader_id)
+                self.register_birth()
+        return self.is_leader
+
+    def step_down(self):
+        """Release the lease so a standby takes over right away."""
+        if self.is_leader:
+            self.is_leader = False
+            self.register_death()
+            try:
+                self.lease.release()
+            except redis_lock.NotAcquired:
+                pass
+
+    def register_birth(self):
+        # the lease keeps a single leader, the scheduler key of a leader that died may not
+        # have expired yet
+        self.connection.delete(self.scheduler_key)
+        super().register_birth()
+
+    def claim_run(self, job, scheduled_time):
+        """Claim the run of job at scheduled_time, returns 1, 0 or -1 like the script."""
+        return self.claim_run_script(
+            keys=[f'lock:{LEADER_LOCK}',
+                  f'{self.scheduled_jobs_key}:run:{job.id}:{to_unix(scheduled_time)}'],
+            args=[self.leader_id, RUN_KEY_SECONDS])
+
+    def enqueue_jobs(self):
+        """Queue the due jobs whose run this scheduler claims, while it leads."""
+        jobs = []
+        for job, scheduled_time in self.get_jobs_to_queue(with_times=True):
+            claimed = self.claim_run(job, scheduled_time)
+            if claimed < 0:
+                logger.warning('Scheduler %s no longer leads', self.leader_id)
+                self.is_leader = False
+                break
+            if claimed:
+                self.enqueue_job(job)
+                jobs.append(job)
+        self.connection.expire(self.scheduler_key, int(self._interval) + 10)
+        return jobs
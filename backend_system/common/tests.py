@@ -1,3 +1,357 @@
-from django.test import TestCase
+import datetime
+import io
+import json
+import os
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.shortcuts import reverse
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+import redis
+import redis_lock
+from authentication.jobs import delete_expired_tokens
+from authentication.models import User
+from bookings import jobs, outbox
+from bookings.fake_postmark import FakePostmarkServer
+from bookings.models import OutboxEmail
+from common import job_backends, queues, query_budget
+from common.models import Job
+from common.management.commands import rqscheduler
+from common.scheduler import LEADER_LOCK, LeaderScheduler
+from common.workers import PoolWorker
+from common.rate_limit import LocalTokenBucket, get_token_bucket
+
+
+class QueryBudgetTestCase(APITestCase):
+    """Test every GET endpoint against its query budget."""
+
+    def test_endpoints_within_query_budget(self):
+        """Test endpoint queries do not grow with the data and stay within budget."""
+        self.maxDiff = None
+        report = query_budget.run(self.client)
+        path = os.getenv('QUERY_REPORT')
+        if path:
+            query_budget.write_report(report, path)
+        self.assertIn('flights:flight-list', report)
+        self.assertEqual(report['bookings:outbox-metrics']['regular']['status'],
+                         {2: 403, 12: 403})
+        self.assertEqual(query_budget.failures(report), [])
+
+
+class TokenBucketTestCase(SimpleTestCase):
+    def test_take_up_to_the_tokens_left(self):
+        bucket = LocalTokenBucket('test', rate=100, capacity=10)
+        granted, wait = bucket.take(15)
+        self.assertEqual(granted, 10)
+        self.assertAlmostEqual(wait, 0.05, places=2)
+        self.assertEqual(bucket.take(1)[0], 0)
+
+    def test_acquire_waits_for_the_refill(self):
+        bucket = LocalTokenBucket('test', rate=100, capacity=10)
+        bucket.take(10)
+        start = time.monotonic()
+        # capped at the capacity of the bucket
+        self.assertEqual(bucket.acquire(20), 10)
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    def test_bucket_is_shared_without_redis(self):
+        # tests run on a local memory cache
+        bucket = get_token_bucket('test', 10, 5)
+        self.assertIsInstance(bucket, LocalTokenBucket)
+        self.assertIs(get_token_bucket('test', 10, 5), bucket)
+
+
+class QueuesTestCase(APITestCase):
+    def test_jobs_are_routed_by_path(self):
+        self.assertEqual(queues.route(jobs.drain_outbox_job), queues.HIGH)
+        self.assertEqual(queues.route(jobs.schedule_reminders_job), queues.BULK)
+        with override_settings(RQ_JOB_ROUTES={}):
+            self.assertEqual(queues.route(jobs.drain_outbox_job), queues.DEFAULT)
+
+    def test_jobs_are_queued_on_their_routed_queue(self):
+        scheduler = rqscheduler.Command().get_scheduler('default', 60)
+        for queue_name in (queues.HIGH, queues.BULK):
+            self.assertEqual(scheduler.get_queue_for_job(mock.Mock(origin=queue_name)).name,
+                             queue_name)
+
+    def test_queue_metrics(self):
+        now = datetime.datetime.utcnow()
+        waiting = mock.Mock(enqueued_at=now - datetime.timedelta(seconds=30))
+        fake_queues = {
+            name: mock.Mock(count=count, get_job_ids=mock.Mock(return_value=job_ids),
+                            fetch_job=mock.Mock(return_value=waiting))
+            for name, count, job_ids in [('high', 0, []), ('default', 0, []),
+                                         ('bulk', 12, ['job'])]
+        }
+        url = reverse('common:queue-metrics')
+        get_queue = mock.patch.object(
+            job_backends.django_rq, 'get_queue', side_effect=fake_queues.get)
+        with override_settings(JOB_BACKEND='rq'), get_queue, \
+                mock.patch.object(job_backends.Worker, 'all', return_value=[mock.Mock()]):
+            self.client.force_authenticate(user=User.objects.create_user(
+                email='normal@email.com', password='flightpassword'))
+            self.assertEqual(self.client.get(url).status_code, 403)
+
+            self.client.force_authenticate(user=User.objects.create_superuser(
+                email='staff@email.com', password='flightpassword'))
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['high'], {'depth': 0, 'workers': 1, 'wait_seconds': 0})
+        self.assertEqual(response.data['bulk']['depth'], 12)
+        self.assertGreaterEqual(response.data['bulk']['wait_seconds'], 30)
+
+
+class PoolWorkerTestCase(SimpleTestCase):
+    def worker(self, **kwargs):
+        # no redis command is sent before the worker starts
+        return PoolWorker(['bulk'], connection=mock.Mock(), **kwargs)
+
+    def test_recycle_after_max_jobs(self):
+        worker = self.worker(max_jobs=2)
+        worker.jobs_run = 1
+        self.assertIsNone(worker.recycle_reason())
+        worker.jobs_run = 2
+        self.assertEqual(worker.recycle_reason(), '2 jobs')
+
+    def test_recycle_after_max_memory(self):
+        worker = self.worker(max_memory=100)
+        with mock.patch('common.workers.memory_mb', return_value=99):
+            self.assertIsNone(worker.recycle_reason())
+        with mock.patch('common.workers.memory_mb', return_value=120):
+            self.assertEqual(worker.recycle_reason(), 'growing to 120 MB')
+
+    def test_worker_stops_after_recycling_job(self):
+        worker = self.worker(max_jobs=1)
+        with mock.patch('rq.SimpleWorker.perform_job', return_value=True):
+            self.assertTrue(worker.perform_job(mock.Mock(), mock.Mock()))
+        self.assertTrue(worker._stop_requested)
+
+
+@override_settings(JOB_BACKEND='database', JOB_MAX_ATTEMPTS=2)
+class DatabaseBackendTestCase(TestCase):
+    func = 'authentication.jobs.delete_expired_tokens'
+
+    def setUp(self):
+        self.backend = job_backends.get_job_backend()
+        self.now = timezone.now()
+
+    def test_delay_queues_on_the_routed_queue(self):
+        job = jobs.schedule_reminders_job.delay(['booking'])
+        self.assertEqual(job.queue, queues.BULK)
+        self.assertEqual(job.func, 'bookings.jobs.schedule_reminders_job')
+        self.assertEqual(json.loads(job.args), [['booking']])
+
+    def test_claimed_jobs_run_once(self):
+        queued = self.backend.enqueue(delete_expired_tokens, batch_size=10)
+        self.backend.enqueue_at(self.now + timezone.timedelta(hours=1), delete_expired_tokens)
+        claimed = job_backends.claim_jobs('worker', job_backends.default_queues(), 10)
+        self.assertEqual([job.id for job in claimed], [queued.id])
+        self.assertEqual(job_backends.claim_jobs('other', job_backends.default_queues(), 10), [])
+        with mock.patch(self.func) as delete:
+            self.assertTrue(job_backends.run_job(claimed[0]))
+        delete.assert_called_once_with(batch_size=10)
+        self.assertEqual(Job.objects.get(id=queued.id).status, Job.FINISHED)
+
+    def test_queues_are_claimed_in_order(self):
+        bulk = self.backend.enqueue(jobs.schedule_reminders_job, [])
+        high = self.backend.enqueue(jobs.drain_outbox_job)
+        claimed = job_backends.claim_jobs('worker', job_backends.default_queues(), 1)
+        self.assertEqual([job.id for job in claimed], [high.id])
+        claimed = job_backends.claim_jobs('worker', [queues.HIGH], 1)
+        self.assertEqual(claimed, [])
+        self.assertEqual(job_backends.claim_jobs('worker', [queues.BULK], 1)[0].id, bulk.id)
+
+    def test_failed_job_records_its_error(self):
+        job = self.backend.enqueue(jobs.drain_outbox_job)
+        [job] = job_backends.claim_jobs('worker', [queues.HIGH], 1)
+        with mock.patch('bookings.jobs.drain_outbox_job', side_effect=ValueError('no outbox')):
+            self.assertFalse(job_backends.run_job(job))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIn('ValueError: no outbox', job.last_error)
+
+    def test_job_is_claimed_again_when_its_lease_runs_out(self):
+        job = self.backend.enqueue(jobs.drain_outbox_job)
+        for attempt in (1, 2, 3):
+            [job] = job_backends.claim_jobs('worker', [queues.HIGH], 1)
+            self.assertEqual(job.attempts, attempt)
+            Job.objects.filter(id=job.id).update(locked_until=self.now)
+        # past JOB_MAX_ATTEMPTS the job is failed without running
+        with mock.patch('bookings.jobs.drain_outbox_job') as drain_outbox_job:
+            self.assertFalse(job_backends.run_job(job))
+        drain_outbox_job.assert_not_called()
+
+    def test_scheduled_job_is_replaced_and_cancelled(self):
+        later = self.now + timezone.timedelta(hours=2)
+        self.backend.enqueue_at(self.now, jobs.send_booking_reminder_job, 'booking', job_id='key')
+        self.backend.enqueue_at(later, jobs.send_booking_reminder_job, 'booking', job_id='key')
+        self.assertEqual(Job.objects.get(key='key').run_at, later)
+        self.backend.cancel(['key'])
+        self.assertFalse(Job.objects.exists())
+
+    def test_cron_ticks_are_queued_once(self):
+        cron_jobs = [
+            {'cron_string': '*/15 * * * *', 'func': self.func},
+            {'cron_string': '* * * * *', 'func': 'bookings.outbox.drain_outbox',
+             'kwargs': {'batch_size': 10}},
+        ]
+        now = datetime.datetime(2019, 5, 15, 18, 41, 30, tzinfo=datetime.timezone.utc)
+        for worker in range(3):
+            job_backends.enqueue_cron_jobs(cron_jobs, now=now)
+        ticks = {job.func: job for job in Job.objects.all()}
+        self.assertEqual(len(ticks), 2)
+        self.assertEqual(ticks[self.func].run_at, now.replace(minute=45, second=0))
+        self.assertEqual(ticks[self.func].queue, queues.BULK)
+        self.assertEqual(ticks['bookings.outbox.drain_outbox'].run_at,
+                         now.replace(minute=42, second=0))
+        self.assertEqual(json.loads(ticks['bookings.outbox.drain_outbox'].kwargs),
+                         {'batch_size': 10})
+
+    def test_burst_worker_runs_due_jobs(self):
+        for number in range(3):
+            jobs.drain_outbox_job.delay()
+        with mock.patch('bookings.jobs.drain_outbox') as drain_outbox:
+            call_command('dbworker', '--burst', '--batch-size', '2', stdout=io.StringIO())
+        self.assertEqual(drain_outbox.call_count, 3)
+        self.assertEqual(Job.objects.filter(status=Job.FINISHED).count(), 3)
+
+    @mock.patch.object(redis.StrictRedis, 'execute_command', side_effect=redis.ConnectionError)
+    def test_burst_worker_drains_the_outbox_without_redis(self, execute_command):
+        # the cache used by default with JOB_BACKEND=database
+        with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+                'LOCATION': 'cache_table'}}):
+            call_command('createcachetable', stdout=io.StringIO())
+            email = outbox.enqueue_email(
+                idempotency_key='email', kind='booking_successful', to='traveller@andela.com',
+                subject='Booked', html_body='<p>Booked</p>')
+            jobs.drain_outbox_job.delay()
+            self.assertIsInstance(outbox.get_send_bucket(), LocalTokenBucket)
+            with FakePostmarkServer() as server, \
+                    override_settings(POSTMARK_API_URL=server.url):
+                call_command('dbworker', '--burst', stdout=io.StringIO())
+        self.assertEqual(len(server.messages), 1)
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboxEmail.SENT)
+        self.assertEqual(Job.objects.get().status, Job.FINISHED)
+        execute_command.assert_not_called()
+
+    def test_queue_metrics(self):
+        job = jobs.drain_outbox_job.delay()
+        Job.objects.filter(id=job.id).update(run_at=self.now - timezone.timedelta(seconds=30))
+        jobs.schedule_reminders_job.delay([])
+        job_backends.claim_jobs('worker', [queues.BULK], 1)
+        metrics = queues.queue_metrics()
+        self.assertEqual(metrics['high']['depth'], 1)
+        self.assertGreaterEqual(metrics['high']['wait_seconds'], 30)
+        self.assertEqual(metrics['bulk'], {'depth': 0, 'workers': 1, 'wait_seconds': 0})
+
+
+class LeaderSchedulerTestCase(SimpleTestCase):
+    def setUp(self):
+        # no redis command is sent by the tests
+        self.scheduler = LeaderScheduler(
+            connection=mock.MagicMock(spec=redis.StrictRedis), leader_id='scheduler-1')
+        self.scheduler.lease = mock.Mock()
+
+    def test_standby_leads_once_it_takes_the_lease(self):
+        self.scheduler.lease.acquire.return_value = False
+        self.assertFalse(self.scheduler.elect(timeout=5))
+        self.scheduler.lease.acquire.assert_called_once_with(timeout=5)
+        self.scheduler.lease.acquire.return_value = True
+        self.assertTrue(self.scheduler.elect(timeout=5))
+        # the leader renews its lease
+        self.assertTrue(self.scheduler.elect(timeout=5))
+        self.scheduler.lease.extend.assert_called_once_with()
+        self.scheduler.step_down()
+        self.assertFalse(self.scheduler.is_leader)
+        self.scheduler.lease.release.assert_called_once_with()
+
+    def test_leader_losing_its_lease_stands_by(self):
+        self.scheduler.is_leader = True
+        self.scheduler.lease.extend.side_effect = redis_lock.NotAcquired
+        self.scheduler.lease.acquire.return_value = False
+        self.assertFalse(self.scheduler.elect(timeout=5))
+
+    @override_settings(RQ_SCHEDULER_LEASE_SECONDS=5, RQ_SCHEDULER_HEARTBEAT_SECONDS=5)
+    def test_heartbeat_shorter_than_the_lease_is_required(self):
+        with self.assertRaises(CommandError):
+            call_command('rqscheduler')
+
+    def test_runs_are_queued_once(self):
+        scheduled_time = datetime.datetime(2019, 5, 15, 18, 45)
+        due = [(mock.Mock(id=job_id), scheduled_time) for job_id in ('queued', 'claimed', 'late')]
+        self.scheduler.is_leader = True
+        # claimed by this scheduler, claimed before and claimed after losing the lease
+        self.scheduler.claim_run_script = mock.Mock(side_effect=[1, 0, -1])
+        with mock.patch.object(self.scheduler, 'get_jobs_to_queue', return_value=due), \
+                mock.patch.object(self.scheduler, 'enqueue_job') as enqueue_job:
+            self.assertEqual(self.scheduler.enqueue_jobs(), [due[0][0]])
+        enqueue_job.assert_called_once_with(due[0][0])
+        self.assertFalse(self.scheduler.is_leader)
+        keys = self.scheduler.claim_run_script.call_args_list[0][1]['keys']
+        self.assertEqual(keys, [f'lock:{LEADER_LOCK}',
+                                'rq:scheduler:scheduled_jobs:run:queued:1557945900'])
+
+
+class RedisLeaderSchedulerTestCase(SimpleTestCase):
+    """LeaderScheduler against the redis server of the rq queues, on a database of its own."""
+    db = 15
+
+    def setUp(self):
+        self.connection = redis.StrictRedis.from_url(settings.RQ_CONNECTION['URL'], db=self.db)
+        try:
+            self.connection.ping()
+        except redis.ConnectionError:
+            self.skipTest('redis can not be reached')
+        self.connection.flushdb()
+        self.addCleanup(self.connection.flushdb)
+        self.leader = LeaderScheduler(connection=self.connection, leader_id='scheduler-1')
+        self.standby = LeaderScheduler(connection=self.connection, leader_id='scheduler-2')
+
+    def test_one_scheduler_leads_until_it_steps_down(self):
+        self.assertTrue(self.leader.elect(timeout=1))
+        self.assertFalse(self.standby.elect(timeout=1))
+        # the leader renews its lease
+        self.assertTrue(self.leader.elect(timeout=1))
+        self.assertEqual(self.connection.get(f'lock:{LEADER_LOCK}'), b'scheduler-1')
+        self.leader.step_down()
+        self.assertTrue(self.standby.elect(timeout=1))
+        self.assertFalse(self.leader.elect(timeout=1))
+
+    def test_leader_whose_lease_ran_out_stands_by(self):
+        self.assertTrue(self.leader.elect(timeout=1))
+        self.connection.delete(f'lock:{LEADER_LOCK}')
+        self.assertTrue(self.standby.elect(timeout=1))
+        self.assertFalse(self.leader.elect(timeout=1))
+        self.assertFalse(self.leader.is_leader)
+
+    def test_run_is_claimed_once_by_the_leader(self):
+        job = mock.Mock(id='job')
+        scheduled_time = datetime.datetime(2019, 5, 15, 18, 45)
+        self.assertEqual(self.leader.claim_run(job, scheduled_time), -1)
+        self.leader.elect(timeout=1)
+        self.assertEqual(self.standby.claim_run(job, scheduled_time), -1)
+        self.assertEqual(self.leader.claim_run(job, scheduled_time), 1)
+        self.assertEqual(self.leader.claim_run(job, scheduled_time), 0)
+        # a new leader does not claim the run again
+        self.leader.step_down()
+        self.standby.elect(timeout=1)
+        self.assertEqual(self.standby.claim_run(job, scheduled_time), 0)
+        self.assertEqual(self.standby.claim_run(job, scheduled_time.replace(minute=46)), 1)
+
+    def test_due_job_is_queued_on_its_queue(self):
+        self.leader.elect(timeout=1)
+        # jobs are scheduled by a scheduler of their queue, as RQBackend does
+        job = LeaderScheduler(queue_name=queues.BULK, connection=self.connection).enqueue_at(
+            timezone.now() - timezone.timedelta(seconds=1), delete_expired_tokens)
+        self.assertEqual(self.leader.enqueue_jobs(), [job])
+        bulk = self.leader.get_queue_for_job(job)
+        self.assertEqual(bulk.name, queues.BULK)
+        self.assertEqual(bulk.job_ids, [job.id])
+        self.assertEqual(self.standby.enqueue_jobs(), [])
@@ -0,0 +1,8 @@
+from django.conf.urls import url
+
+from common import views
+
+
+urlpatterns = [
+    url(r'^queue-metrics/$', views.QueueMetricsView.as_view(), name='queue-metrics'),
+]
@@ -1,3 +1,109 @@
-from django.shortcuts import render
+import hashlib
+import json
+import time
 
-# Create your views here.
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from common.queues import queue_metrics
+
+
+class EagerLoadingMixin(object):
+    """
+    Eager load the relations the serializer used by the current action renders.
+    Serializers declare them in select_related_fields and prefetch_related_fields so that
+    a page of results runs the same number of queries whatever its size.
+    """
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        serializer_class = self.get_serializer_class()
+        select_related_fields = getattr(serializer_class, 'select_related_fields', ())
+        prefetch_related_fields = getattr(serializer_class, 'prefetch_related_fields', ())
+        if select_related_fields:
+            queryset = queryset.select_related(*select_related_fields)
+        if prefetch_related_fields:
+            queryset = queryset.prefetch_related(*prefetch_related_fields)
+        return queryset
+
+
+class IdempotencyKeyInUse(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'A request with this Idempotency-Key is still being processed.'
+    default_code = 'idempotency_key_in_use'
+
+
+class IdempotentCreateMixin(object):
+    """
+    Create once per Idempotency-Key header, so clients may retry a create that timed out.
+    The first successful response of a user's key is cached for IDEMPOTENCY_KEY_TTL seconds
+    and returned to the requests repeating the key without running the create again. A
+    request arriving while the first one runs waits up to IDEMPOTENCY_WAIT_SECONDS for its
+    response. Failed creates are not cached, the key may be retried.
+    """
+    idempotency_header = 'HTTP_IDEMPOTENCY_KEY'
+
+    def create(self, request, *args, **kwargs):
+        key = request.META.get(self.idempotency_header)
+        if not key:
+            return super().create(request, *args, **kwargs)
+        if len(key) > 255:
+            raise ValidationError({'Idempotency-Key': 'Ensure this header has no more than 255 '
+                                                      'characters.'})
+        scope = hashlib.sha256(f'{request.user.pk}:{request.path}:{key}'.encode()).hexdigest()
+        response_key = f'idempotency:response:{scope}'
+        lock_key = f'idempotency:lock:{scope}'
+        fingerprint = hashlib.sha256(
+            json.dumps(request.data, sort_keys=True, default=str).encode()).hexdigest()
+
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+        delay = 0.05
+        while True:
+            stored = cache.get(response_key)
+            if stored is not None:
+                return self.replay(stored, fingerprint)
+            if cache.add(lock_key, fingerprint, settings.IDEMPOTENCY_LOCK_SECONDS):
+                # the first request may have finished between the two lookups
+                stored = cache.get(response_key)
+                if stored is None:
+                    break
+                cache.delete(lock_key)
+                return self.replay(stored, fingerprint)
+            if time.monotonic() >= deadline:
+                raise IdempotencyKeyInUse()
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+        try:
+            response = super().create(request, *args, **kwargs)
+            if status.is_success(response.status_code):
+                cache.set(response_key, {
+                    'fingerprint': fingerprint,
+                    'status': response.status_code,
+                    'data': response.data,
+                    'headers': dict(response.items()),
+                }, settings.IDEMPOTENCY_KEY_TTL)
+        finally:
+            cache.delete(lock_key)
+        return response
+
+    def replay(self, stored, fingerprint):
+        if stored['fingerprint'] != fingerprint:
+            raise ValidationError({'Idempotency-Key': 'This key was used with a different '
+                                                      'request.'})
+        headers = {name: value for name, value in stored['headers'].items()
+                   if name.lower() != 'content-type'}
+        headers['Idempotent-Replayed'] = 'true'
+        return Response(data=stored['data'], status=stored['status'], headers=headers)
+
+
+class QueueMetricsView(APIView):
+    """Depth, workers and wait time of each job queue, for monitoring."""
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(data=queue_metrics(), status=status.HTTP_200_OK)
@@ -0,0 +1,59 @@
+"""
+Long-lived rq workers of the rqworkers command.
+
+rq's Worker forks a work horse per job, which then opens its own database connection.
+PoolWorker runs its jobs in its own process instead, so the modules and database
+connections loaded by one job are reused by the next. A worker asks to stop once it has run
+max_jobs jobs or grown past max_memory MB, and the supervisor forks a fresh one in its place.
+"""
+import resource
+
+from django.db import connections
+from rq import SimpleWorker
+
+
+def memory_mb():
+    """Resident memory of this process in MB."""
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+        return pages * resource.getpagesize() / (1024 * 1024)
+    except (OSError, IndexError, ValueError):
+        # no procfs, the peak memory of the process in KB instead
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def close_unusable_connections():
+    """Drop database connections broken since the last job, they reconnect when used."""
+    for connection in connections.all():
+        if connection.connection is not None and not connection.is_usable():
+            connection.close()
+
+
+class PoolWorker(SimpleWorker):
+    def __init__(self, *args, max_jobs=None, max_memory=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_jobs = max_jobs
+        self.max_memory = max_memory
+        self.jobs_run = 0
+
+    def perform_job(self, job, queue, heartbeat_ttl=None):
+        close_unusable_connections()
+        try:
+            return super().perform_job(job, queue, heartbeat_ttl=heartbeat_ttl)
+        finally:
+            self.jobs_run += 1
+            reason = self.recycle_reason()
+            if reason:
+                self.log.info('Worker %s recycling after %s', self.name, reason)
+                # leaves the work loop before the next job
+                self._stop_requested = True
+
+    def recycle_reason(self):
+        if self.max_jobs and self.jobs_run >= self.max_jobs:
+            return f'{self.jobs_run} jobs'
+        if self.max_memory:
+            memory = memory_mb()
+            if memory >= self.max_memory:
+                return f'growing to {memory:.0f} MB'
+        return None
@@ -31,11 +31,12 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django_extensions',
+    # ahead of django_rq so manage.py rqscheduler runs the command in common
+    'common',
     'django_rq',
     'rest_framework',
     'authentication',
     'bookings',
-    'common',
     'flights',
 ]
 
@@ -50,13 +51,21 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# signed access and refresh tokens verified without database access, opt in
+SIGNED_TOKENS_ENABLED = env.bool('SIGNED_TOKENS_ENABLED', False)
+SIGNED_TOKEN_SECRET = env.str('SIGNED_TOKEN_SECRET', SECRET_KEY)
+# revoked access tokens are rejected through the cache, a cache losing keys lets them through
+# until they expire
+SIGNED_TOKEN_ACCESS_MINUTES = env.int('SIGNED_TOKEN_ACCESS_MINUTES', 5)
+SIGNED_TOKEN_REFRESH_HOURS = env.int('SIGNED_TOKEN_REFRESH_HOURS', 24)
+
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': (
         'rest_framework.renderers.JSONRenderer',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'authentication.backends.CustomTokenAuthentication',
-    ),
+    ) + (('authentication.backends.SignedTokenAuthentication',) if SIGNED_TOKENS_ENABLED else ()),
     'DEFAULT_PAGINATION_CLASS': 'common.pagination.CustomPaginator',
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -67,23 +76,73 @@ REST_FRAMEWORK = {
 ROOT_URLCONF = 'config.urls'
 
 # rq settings
+RQ_CONNECTION = {
+    'HOST': env.str('DJANGO_RQ_HOST', 'localhost'),
+    'PORT': env.str('DJANGO_RQ_PORT', 6379),
+    'URL': os.getenv('REDISTOGO_URL', 'redis://localhost:6379'),
+    'DB': env.str('DJANGO_RQ_DB', 0),
+    'PASSWORD': env.str('DJANGO_RQ_PASSWORD', ''),
+    'DEFAULT_TIMEOUT': 600,
+}
+# see common.queues
 RQ_QUEUES = {
-    'default': {
-        'HOST': env.str('DJANGO_RQ_HOST', 'localhost'),
-        'PORT': env.str('DJANGO_RQ_PORT', 6379),
-        'URL': os.getenv('REDISTOGO_URL', 'redis://localhost:6379'),
-        'DB': env.str('DJANGO_RQ_DB', 0),
-        'PASSWORD': env.str('DJANGO_RQ_PASSWORD', ''),
-        'DEFAULT_TIMEOUT': 600,
-    },
+    'high': dict(RQ_CONNECTION),
+    'default': dict(RQ_CONNECTION),
+    'bulk': dict(RQ_CONNECTION),
+}
+# queue of each job function, jobs not listed go to default
+RQ_JOB_ROUTES = {
+    'bookings.jobs.drain_outbox_job': 'high',
+    'bookings.outbox.drain_outbox': 'high',
+    'bookings.jobs.schedule_reminders_job': 'bulk',
+    'bookings.jobs.send_booking_reminder_job': 'bulk',
+    'bookings.jobs.reconcile_reminders': 'bulk',
+    'authentication.jobs.delete_expired_tokens': 'bulk',
+}
+# worker processes started per queue by the rqworkers command
+RQ_WORKER_CONCURRENCY = {
+    'high': env.int('RQ_HIGH_CONCURRENCY', 2),
+    'default': env.int('RQ_DEFAULT_CONCURRENCY', 1),
+    'bulk': env.int('RQ_BULK_CONCURRENCY', 2),
+}
+# workers are replaced after this many jobs or once they use this many MB
+RQ_WORKER_MAX_JOBS = env.int('RQ_WORKER_MAX_JOBS', 1000)
+RQ_WORKER_MAX_MEMORY = env.int('RQ_WORKER_MAX_MEMORY', 256)
+# the leading rqscheduler renews its lease every heartbeat, shorter than the lease, a standby
+# takes over once the lease runs out, see common.scheduler
+RQ_SCHEDULER_LEASE_SECONDS = env.int('RQ_SCHEDULER_LEASE_SECONDS', 15)
+RQ_SCHEDULER_HEARTBEAT_SECONDS = env.int('RQ_SCHEDULER_HEARTBEAT_SECONDS', 5)
+
+# where jobs are queued, 'rq' or 'database' to run without redis, see common.job_backends
+JOB_BACKEND = env.str('JOB_BACKEND', 'rq')
+# database jobs claimed by a worker are claimed again after JOB_LEASE_SECONDS, at most
+# JOB_MAX_ATTEMPTS times, and finished ones are deleted after JOB_RESULT_TTL seconds
+JOB_LEASE_SECONDS = env.int('JOB_LEASE_SECONDS', 600)
+JOB_MAX_ATTEMPTS = env.int('JOB_MAX_ATTEMPTS', 3)
+JOB_RESULT_TTL = env.int('JOB_RESULT_TTL', 500)
+JOB_BATCH_SIZE = env.int('JOB_BATCH_SIZE', 20)
+
+# cache settings, CACHE_URL picks another cache e.g. dbcache://cache_table or locmemcache://
+# without redis the database cache is the default, create its table with createcachetable
+CACHES = {
+    'default': env.cache_url('CACHE_URL', default=(
+        os.getenv('REDISTOGO_URL', 'redis://localhost:6379') if JOB_BACKEND == 'rq'
+        else 'dbcache://cache_table')),
 }
 
 # rqscheduler cron jobs
 RQ_CRON_JOBS = [
     {
-        'cron_string': '0 0 * * *',  # Run at 00:00 daily
-        # 'cron_string': '*/2 * * * *',  # Run every 2nd minute
-        'func': 'bookings.jobs.travel_date_reminder',
+        'cron_string': '*/15 * * * *',  # Run every 15th minute
+        'func': 'authentication.jobs.delete_expired_tokens',
+    },
+    {
+        'cron_string': '* * * * *',  # Run every minute, sends retries that are due
+        'func': 'bookings.outbox.drain_outbox',
+    },
+    {
+        'cron_string': '0 * * * *',  # Run every hour, schedules reminders missed after commit
+        'func': 'bookings.jobs.reconcile_reminders',
     },
 ]
 
@@ -224,9 +283,61 @@ USE_TZ = True
 # password duration
 PASSWORD_VALIDITY_IN_HOURS = env.int('PASSWORD_VALIDITY_IN_HOURS', 1)
 
+# number of seats inserted per statement when creating seats in bulk
+SEAT_BULK_CREATE_BATCH_SIZE = env.int('SEAT_BULK_CREATE_BATCH_SIZE', 500)
+
+# how long a seat is held for a user completing a booking
+SEAT_HOLD_MINUTES = env.int('SEAT_HOLD_MINUTES', 10)
+SEAT_HOLD_MAX_MINUTES = env.int('SEAT_HOLD_MAX_MINUTES', 30)
+# passengers booked at most by one group booking
+GROUP_BOOKING_MAX_PASSENGERS = env.int('GROUP_BOOKING_MAX_PASSENGERS', 100)
+
+# 'raw' stores token keys as sent by clients, 'hashed' stores their sha256 only
+TOKEN_STORAGE = env.str('TOKEN_STORAGE', 'raw')
+# expired tokens deleted per statement by authentication.jobs.delete_expired_tokens
+TOKEN_SWEEP_BATCH_SIZE = env.int('TOKEN_SWEEP_BATCH_SIZE', 1000)
+
+# token -> user cache of CustomTokenAuthentication, held per process in front of the cache
+TOKEN_CACHE_ENABLED = env.bool('TOKEN_CACHE_ENABLED', True)
+TOKEN_CACHE_SIZE = env.int('TOKEN_CACHE_SIZE', 10000)
+TOKEN_CACHE_SECONDS = env.int('TOKEN_CACHE_SECONDS', 300)
+# how long a process keeps its own copy, trusted only until a token is invalidated
+TOKEN_CACHE_LOCAL_SECONDS = env.int('TOKEN_CACHE_LOCAL_SECONDS', 30)
+
 # POSTMARK TOKEN
 POSTMARK_TOKEN = env.str('POSTMARK_TOKEN', 'postmark_token')
 POSTMARK_SENDER_EMAIL = env.str('POSTMARK_SENDER_EMAIL', 'no_reply@airtech.com')
+# emails are only sent to users of these domains
+EMAIL_ALLOWED_DOMAINS = env.list('EMAIL_ALLOWED_DOMAINS', default=['andela.com'])
+POSTMARK_API_URL = env.str('POSTMARK_API_URL', 'https://api.postmarkapp.com/')
+POSTMARK_TIMEOUT = env.int('POSTMARK_TIMEOUT', 10)
+# emails per Postmark batch request, Postmark accepts up to 500
+POSTMARK_BATCH_SIZE = env.int('POSTMARK_BATCH_SIZE', 500)
+
+# email outbox, failed sends are retried after OUTBOX_RETRY_SECONDS doubling per attempt
+OUTBOX_MAX_ATTEMPTS = env.int('OUTBOX_MAX_ATTEMPTS', 5)
+OUTBOX_RETRY_SECONDS = env.int('OUTBOX_RETRY_SECONDS', 60)
+# how long a claimed email is left to its worker before another may send it, longer than
+# a batch request to Postmark takes
+OUTBOX_LEASE_SECONDS = env.int('OUTBOX_LEASE_SECONDS', 120)
+# emails per second sent to Postmark by all workers together, up to EMAIL_SEND_BURST at once
+EMAIL_SEND_RATE = env.float('EMAIL_SEND_RATE', 50)
+EMAIL_SEND_BURST = env.int('EMAIL_SEND_BURST', 500)
+
+# responses of creates sent with an Idempotency-Key are replayed for IDEMPOTENCY_KEY_TTL
+# seconds, a repeat of a request still running waits up to IDEMPOTENCY_WAIT_SECONDS for it
+IDEMPOTENCY_KEY_TTL = env.int('IDEMPOTENCY_KEY_TTL', 24 * 60 * 60)
+IDEMPOTENCY_LOCK_SECONDS = env.int('IDEMPOTENCY_LOCK_SECONDS', 60)
+IDEMPOTENCY_WAIT_SECONDS = env.int('IDEMPOTENCY_WAIT_SECONDS', 10)
+
+# travel reminders, scheduled per booking BOOKING_REMINDER_HOURS before its departure
+BOOKING_REMINDERS_ENABLED = env.bool('BOOKING_REMINDERS_ENABLED', True)
+BOOKING_REMINDER_HOURS = env.int('BOOKING_REMINDER_HOURS', 24)
+# bookings scheduled by each reminder scheduling job
+REMINDER_CHUNK_SIZE = env.int('REMINDER_CHUNK_SIZE', 1000)
+# reminders due this many hours either side of now are scheduled again every hour, more
+# than an hour so consecutive runs overlap
+REMINDER_RECONCILE_HOURS = env.int('REMINDER_RECONCILE_HOURS', 2)
 
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/2.1/howto/static-files/
@@ -12,6 +12,7 @@ urlpatterns = [
     url(r'^v{}/auth/'.format(API_VERSION), include(('authentication.urls', 'authentication'), namespace='authentication')),
     url(r'^v{}/'.format(API_VERSION), include(('flights.urls', 'flights'), namespace='flights')),
     url(r'^v{}/'.format(API_VERSION), include(('bookings.urls', 'bookings'), namespace='bookings')),
+    url(r'^v{}/'.format(API_VERSION), include(('common.urls', 'common'), namespace='common')),
 ]
 
 
@@ -0,0 +1,21 @@
+import pytest
+
+from django.core.cache import cache
+
+from authentication.token_cache import token_cache
+
+
+@pytest.fixture(autouse=True)
+def local_cache(settings):
+    """Keep tests off redis: use a local memory cache and schedule no reminders."""
+    settings.CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+    # reminders are scheduled in redis, tests of them enable it with a fake scheduler
+    settings.BOOKING_REMINDERS_ENABLED = False
+    yield
+    cache.clear()
+    token_cache.clear()
+    token_cache.reset_stats()
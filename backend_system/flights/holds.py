@@ -0,0 +1,53 @@
+"""
+Temporary seat holds.
+A hold reserves a free seat for a user for a few minutes while they complete a booking.
+Holds live in the cache (redis) only and expire on their own, nothing is written to the
+database until the seat is booked.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+
+def _hold_key(seat):
+    return f'seat-hold:{seat.pk}'
+
+
+def seat_holder(seat):
+    """Return the id of the user holding seat or None if the seat is not held."""
+    return cache.get(_hold_key(seat))
+
+
+def hold_seat(seat, user, minutes=None):
+    """
+    Hold seat for user. Holding a seat the user already holds extends the hold.
+    Returns False if another user holds the seat.
+    """
+    timeout = 60 * (minutes or settings.SEAT_HOLD_MINUTES)
+    if cache.add(_hold_key(seat), str(user.pk), timeout):
+        return True
+    if seat_holder(seat) == str(user.pk):
+        cache.touch(_hold_key(seat), timeout)
+        return True
+    return False
+
+
+def is_held_by_other(seat, *users):
+    """True if seat is held by someone other than the given users."""
+    holder = seat_holder(seat)
+    return holder is not None and holder not in {str(user.pk) for user in users}
+
+
+def release_seat_hold(seat, user=None):
+    """Release the hold on seat, only if it is held by user when a user is given."""
+    if user is None or seat_holder(seat) == str(user.pk):
+        cache.delete(_hold_key(seat))
+
+
+def seat_holders(seats):
+    """Return the id of the user holding each held seat of seats by seat pk, in one lookup."""
+    holders = cache.get_many([_hold_key(seat) for seat in seats])
+    return {seat.pk: holders[_hold_key(seat)] for seat in seats if _hold_key(seat) in holders}
+
+
+def release_seat_holds(seats):
+    cache.delete_many([_hold_key(seat) for seat in seats])
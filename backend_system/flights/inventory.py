@@ -0,0 +1,174 @@
+"""
+Compact seat inventory of a flight.
+
+Seats are addressed by (row, letter) and numbered row by row, every row having a slot
+for every letter of the cabin. Which slots hold a seat and which seats are booked are
+kept as two bitsets, so a whole flight fits in a few dozen bytes.
+"""
+import uuid
+
+
+class CompactSeat(object):
+    """Seat of a compact inventory with the attributes FlightSeatsViewSerializer reads."""
+
+    def __init__(self, flight_id, row, letter, class_group, booked):
+        self.row = row
+        self.letter = letter
+        self.class_group = class_group
+        self.booked = booked
+        # stable id so clients can address the seat as they would a Seat row
+        self.id = uuid.uuid5(flight_id, self.seat) if flight_id else None
+
+    @property
+    def seat(self):
+        return str(self.row) + self.letter
+
+
+class SeatMap(object):
+    """
+    Bitset backed seat map.
+        rows: number of rows of the cabin.
+        letters: seat letters of a row e.g. 'ABCDEF'.
+        bands: (class_group, first_row, last_row) tuples.
+        seats: bitset of the slots that hold a seat.
+        booked: bitset of the booked seats.
+    """
+
+    def __init__(self, rows, letters, bands, seats=0, booked=0):
+        self.rows = rows
+        self.letters = letters
+        self.bands = bands
+        self.seats = seats
+        self.booked = booked
+
+    @classmethod
+    def from_seats(cls, seats):
+        """Build a seat map from (row, letter, class_group, booked) tuples."""
+        seats = list(seats)
+        rows = max((row for row, _, _, _ in seats), default=0)
+        letters = ''.join(sorted({letter for _, letter, _, _ in seats}))
+        row_class_groups = {}
+        for row, _, class_group, _ in seats:
+            if row_class_groups.setdefault(row, class_group) != class_group:
+                raise ValueError(f'Row {row} has seats in more than one class_group.')
+        bands = []
+        for row in sorted(row_class_groups):
+            class_group = row_class_groups[row]
+            if bands and bands[-1][0] == class_group and bands[-1][2] == row - 1:
+                bands[-1] = (class_group, bands[-1][1], row)
+            else:
+                bands.append((class_group, row, row))
+        seat_map = cls(rows, letters, bands)
+        for row, letter, _, booked in seats:
+            seat_map.add(row, letter, booked=booked)
+        return seat_map
+
+    @staticmethod
+    def encode_bands(bands):
+        return ';'.join(f'{class_group}:{first}-{last}' for class_group, first, last in bands)
+
+    @staticmethod
+    def decode_bands(value):
+        bands = []
+        for band in filter(None, value.split(';')):
+            class_group, _, rows = band.rpartition(':')
+            first, _, last = rows.partition('-')
+            bands.append((class_group, int(first), int(last)))
+        return bands
+
+    @staticmethod
+    def to_bytes(bitset):
+        return bitset.to_bytes((bitset.bit_length() + 7) // 8, 'little')
+
+    @staticmethod
+    def from_bytes(value):
+        return int.from_bytes(bytes(value or b''), 'little')
+
+    def index(self, row, letter):
+        """Slot number of a seat, None if the cabin has no such slot."""
+        column = self.letters.find(letter.upper())
+        if column < 0 or not 1 <= row <= self.rows:
+            return None
+        return (row - 1) * len(self.letters) + column
+
+    def position(self, index):
+        row, column = divmod(index, len(self.letters))
+        return row + 1, self.letters[column]
+
+    def class_group(self, row):
+        for class_group, first, last in self.bands:
+            if first <= row <= last:
+                return class_group
+        return None
+
+    def class_mask(self, class_group):
+        """Bitset of all the slots in the rows of class_group."""
+        mask = 0
+        width = len(self.letters)
+        for band_class_group, first, last in self.bands:
+            if band_class_group == class_group:
+                mask |= ((1 << ((last - first + 1) * width)) - 1) << ((first - 1) * width)
+        return mask
+
+    def add(self, row, letter, booked=False):
+        index = self.index(row, letter)
+        if index is None:
+            raise ValueError(f'Seat {row}{letter} is outside the seat map.')
+        self.seats |= 1 << index
+        if booked:
+            self.booked |= 1 << index
+
+    def lookup(self, row, letter):
+        """Return (class_group, booked) of a seat or None if the seat does not exist."""
+        index = self.index(row, letter)
+        if index is None or not self.seats >> index & 1:
+            return None
+        return self.class_group(row), bool(self.booked >> index & 1)
+
+    def free(self, class_group=None):
+        free = self.seats & ~self.booked
+        if class_group is not None:
+            free &= self.class_mask(class_group)
+        return free
+
+    def find_free(self, class_group=None):
+        """Return (row, letter) of the first free seat, None if every seat is booked."""
+        free = self.free(class_group)
+        if not free:
+            return None
+        # isolate the lowest set bit
+        return self.position((free & -free).bit_length() - 1)
+
+    def free_count(self, class_group=None):
+        return bin(self.free(class_group)).count('1')
+
+    def claim(self, row, letter):
+        """Mark a free seat booked, returns False if the seat is missing or booked."""
+        lookup = self.lookup(row, letter)
+        if lookup is None or lookup[1]:
+            return False
+        self.booked |= 1 << self.index(row, letter)
+        return True
+
+    def release(self, row, letter):
+        """Mark a booked seat free, returns False if the seat is missing or free."""
+        lookup = self.lookup(row, letter)
+        if lookup is None or not lookup[1]:
+            return False
+        self.booked &= ~(1 << self.index(row, letter))
+        return True
+
+    def __iter__(self):
+        seats = self.seats
+        while seats:
+            index = (seats & -seats).bit_length() - 1
+            seats &= seats - 1
+            row, letter = self.position(index)
+            yield row, letter, self.class_group(row), bool(self.booked >> index & 1)
+
+    def __len__(self):
+        return bin(self.seats).count('1')
+
+    def compact_seats(self, flight_id):
+        return [CompactSeat(flight_id, row, letter, class_group, booked)
+                for row, letter, class_group, booked in self]
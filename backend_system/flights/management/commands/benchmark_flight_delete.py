@@ -0,0 +1,73 @@
+"""
+Time soft deleting and restoring flights carrying --seats seats and --bookings bookings.
+The bulk cascade is compared with deleting every row one at a time through
+SoftDeleteModel.delete. All data created is rolled back.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from authentication.models import User
+from bookings.models import Booking
+from flights.models import Flight, Seat
+
+
+class Command(BaseCommand):
+    help = __doc__
+
+    def add_arguments(self, parser):
+        parser.add_argument('--flights', type=int, dest='flights', default=10)
+        parser.add_argument('--seats', type=int, dest='seats', default=500)
+        parser.add_argument('--bookings', type=int, dest='bookings', default=500)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.user = User.objects.create_user(
+                email='delete.benchmark@email.com', password='benchmark')
+            per_row = [self.seed(f'DELETEBENCH ROW {number}', options)
+                       for number in range(options['flights'])]
+            bulk = [self.seed(f'DELETEBENCH BULK {number}', options)
+                    for number in range(options['flights'])]
+
+            self.stdout.write(f'{options["flights"]} flights of {options["seats"]} seats and '
+                              f'{options["bookings"]} bookings')
+            self.stdout.write(f'{"":<16} {"ms per flight":>14} {"queries":>10}')
+            self.report('row by row', per_row, self.delete_rows)
+            self.report('bulk delete', bulk, lambda flight: flight.delete())
+            self.report('bulk restore', bulk, lambda flight: flight.restore())
+            restored = Booking.objects.filter(flight__in=bulk).count()
+            if restored != options['flights'] * options['bookings']:
+                self.stderr.write(f'Only {restored} bookings were restored.')
+            transaction.set_rollback(True)
+
+    def seed(self, name, options):
+        flight = Flight.objects.create(name=name, created_by=self.user)
+        Seat.objects.bulk_create([
+            Seat(flight=flight, row=number // 6 + 1, letter='ABCDEF'[number % 6])
+            for number in range(options['seats'])
+        ], batch_size=500)
+        seats = list(Seat.objects.filter(flight=flight)[:options['bookings']])
+        Booking.objects.bulk_create([
+            Booking(booked_by=self.user, flight=flight,
+                    seat=seats[number] if number < len(seats) else None)
+            for number in range(options['bookings'])
+        ], batch_size=500)
+        return flight
+
+    def delete_rows(self, flight):
+        for booking in Booking.objects.filter(flight=flight):
+            booking.delete()
+        for seat in Seat.objects.filter(flight=flight):
+            seat.delete()
+        # SoftDeleteModel.delete of the flight row alone
+        super(Flight, flight).delete()
+
+    def report(self, name, flights, run):
+        start = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            for flight in flights:
+                run(flight)
+        duration = (time.perf_counter() - start) * 1000 / len(flights)
+        self.stdout.write(f'{name:<16} {duration:>14.1f} {len(queries) // len(flights):>10}')
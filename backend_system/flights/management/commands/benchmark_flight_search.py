@@ -0,0 +1,115 @@
+"""
+Time the flight search against a seeded database of flights spread over many routes and a
+year of departures. Seeded rows are named SEARCHBENCH-<n> and removed at the end unless
+--keep is given, in which case later runs reuse them.
+"""
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from authentication.models import User
+from flights.models import Flight, Location, Seat
+
+
+class Command(BaseCommand):
+    help = __doc__
+    prefix = 'SEARCHBENCH'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--flights', type=int, dest='flights', default=1000000)
+        parser.add_argument('--locations', type=int, dest='locations', default=50)
+        parser.add_argument('--seats', type=int, dest='seats', default=0,
+                            help='Seats seeded per flight for the first 10000 flights.')
+        parser.add_argument('--repeat', type=int, dest='repeat', default=20)
+        parser.add_argument('--batch-size', type=int, dest='batch_size', default=10000)
+        parser.add_argument('--keep', action='store_true', dest='keep',
+                            help='Keep the seeded flights for later runs.')
+
+    def handle(self, *args, **options):
+        self.now = timezone.now()
+        try:
+            locations = self.seed_locations(options['locations'])
+            self.seed_flights(locations, options)
+            self.run(locations, options)
+        finally:
+            if not options['keep']:
+                self.cleanup()
+
+    def seed_locations(self, count):
+        for number in range(count):
+            Location.objects.get_or_create(
+                country=self.prefix.title(), city=f'City{number}', airport=f'Airport{number}')
+        return list(Location.objects.filter(country=self.prefix.title()))
+
+    def seed_flights(self, locations, options):
+        existing = Flight.objects_with_deleted.filter(name__startswith=self.prefix).count()
+        user, _ = User.objects.get_or_create(
+            email='search.benchmark@email.com',
+            defaults={'first_name': 'Search', 'last_name': 'Benchmark'})
+        start = time.perf_counter()
+        for first in range(existing, options['flights'], options['batch_size']):
+            flights = []
+            for number in range(first, min(first + options['batch_size'], options['flights'])):
+                origin, destination = random.sample(locations, 2)
+                flights.append(Flight(
+                    name=f'{self.prefix}-{number}', origin=origin, destination=destination,
+                    departure_time=self.now + timezone.timedelta(minutes=random.randint(0, 525600)),
+                    created_by=user, status='Scheduled',
+                    deleted_at=self.now if random.random() < 0.05 else None))
+            Flight.objects.bulk_create(flights)
+            if options['seats'] and first < 10000:
+                Seat.objects.bulk_create([
+                    Seat(flight=flight, row=seat // 6 + 1, letter='ABCDEF'[seat % 6],
+                         class_group='Business' if seat < 12 else 'Economy',
+                         booked=random.random() < 0.8)
+                    for flight in flights for seat in range(options['seats'])
+                ], batch_size=500)
+        if existing < options['flights']:
+            self.stdout.write(f'Seeded {options["flights"] - existing} flights in '
+                              f'{time.perf_counter() - start:.1f}s')
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(f'ANALYZE {Flight._meta.db_table}')
+                cursor.execute(f'ANALYZE {Seat._meta.db_table}')
+
+    def run(self, locations, options):
+        def route():
+            origin, destination = random.sample(locations, 2)
+            after = self.now + timezone.timedelta(days=random.randint(0, 358))
+            return {'origin': origin, 'destination': destination, 'departure_after': after,
+                    'departure_before': after + timezone.timedelta(days=7)}
+
+        def window():
+            after = self.now + timezone.timedelta(days=random.randint(0, 364))
+            return {'departure_after': after,
+                    'departure_before': after + timezone.timedelta(hours=1)}
+
+        def seats():
+            return dict(route(), class_group='Business', seats=2)
+
+        self.stdout.write(f'{"search":<28} {"median ms":>10} {"p95 ms":>10}')
+        for name, params in [('route and week', route), ('departure hour', window),
+                             ('route with free seats', seats)]:
+            durations = []
+            for _ in range(options['repeat']):
+                # a page of results as the search endpoint serves it
+                queryset = Flight.objects.all().search(**params())[:10]
+                start = time.perf_counter()
+                list(queryset)
+                durations.append((time.perf_counter() - start) * 1000)
+            durations.sort()
+            self.stdout.write(f'{name:<28} {statistics.median(durations):>10.2f} '
+                              f'{durations[int(len(durations) * 0.95) - 1]:>10.2f}')
+            if options['verbosity'] > 1:
+                self.stdout.write(queryset.explain())
+
+    def cleanup(self):
+        flights = Flight.objects_with_deleted.filter(name__startswith=self.prefix)
+        Seat.objects_with_deleted.filter(flight__in=flights).hard_delete()
+        flights.hard_delete()
+        Location.objects.filter(country=self.prefix.title()).delete()
+        User.objects.filter(email='search.benchmark@email.com').delete()
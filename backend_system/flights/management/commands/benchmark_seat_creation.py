@@ -0,0 +1,62 @@
+"""
+Compare database round trips and duration of creating a flight seat map one seat at a
+time against the bulk seat creation used by SeatViewset.create.
+All data created by the benchmark is rolled back.
+"""
+import string
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from authentication.models import User
+from flights.models import Flight
+from flights.serializers import SeatBulkCreateSerializer, SeatSerializer
+
+
+class Command(BaseCommand):
+    help = __doc__
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', dest='rows', default=[10, 30, 60],
+                            help='Number of rows of the seat maps to create.')
+        parser.add_argument('--letters', type=int, dest='letters', default=6,
+                            help='Number of seat letters per row.')
+
+    def handle(self, *args, **options):
+        letters = list(string.ascii_uppercase[:options['letters']])
+        self.stdout.write(f'{"seats":>8} {"per seat queries":>18} {"per seat secs":>14} '
+                          f'{"bulk queries":>14} {"bulk secs":>10}')
+        for rows in options['rows']:
+            rows = list(range(1, rows + 1))
+            single_queries, single_time = self.run(self.create_one_by_one, rows, letters)
+            bulk_queries, bulk_time = self.run(self.create_in_bulk, rows, letters)
+            self.stdout.write(f'{len(rows) * len(letters):>8} {single_queries:>18} '
+                              f'{single_time:>14.3f} {bulk_queries:>14} {bulk_time:>10.3f}')
+
+    def run(self, create, rows, letters):
+        with transaction.atomic():
+            user = User.objects.create_user(
+                email='seat.benchmark@email.com', password='benchmark')
+            flight = Flight.objects.create(name='SEAT BENCHMARK', created_by=user)
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                create(flight, rows, letters)
+                duration = time.perf_counter() - start
+            transaction.set_rollback(True)
+        return len(queries), duration
+
+    def create_one_by_one(self, flight, rows, letters):
+        for letter in letters:
+            for row in rows:
+                serializer = SeatSerializer(
+                    data={'row': row, 'letter': letter}, context={'flight': flight})
+                serializer.is_valid(raise_exception=True)
+                serializer.save()
+
+    def create_in_bulk(self, flight, rows, letters):
+        serializer = SeatBulkCreateSerializer(
+            data={'rows': rows, 'letters': letters}, context={'flight': flight})
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
@@ -0,0 +1,93 @@
+"""
+Time the adjacent seat finder on widebody cabins at high load factors.
+For each load factor --flights flights of --rows rows of --letters letters are seeded with
+seats booked at random, then parties of each of --party-sizes are seated on every flight.
+The finder is timed end to end with its query and on the seat grid alone, against
+serializing the whole seat list a client searches on its own. Reports how many parties sat
+in a single row and how many rows the others spanned. All data created is rolled back.
+"""
+import json
+import random
+import string
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from authentication.models import User
+from flights.models import Flight, Seat
+from flights.seating import SeatGrid, find_adjacent_seats
+from flights.serializers import FlightSeatsViewSerializer
+
+
+class Command(BaseCommand):
+    help = __doc__
+
+    def add_arguments(self, parser):
+        parser.add_argument('--flights', type=int, dest='flights', default=20)
+        parser.add_argument('--rows', type=int, dest='rows', default=60)
+        # 3-4-3 economy cabin, widebodies skip the letter I
+        parser.add_argument('--letters', dest='letters', default='ABCDEFGHJK')
+        parser.add_argument('--load-factors', type=float, nargs='+', dest='load_factors',
+                            default=[0.8, 0.9, 0.95])
+        parser.add_argument('--party-sizes', type=int, nargs='+', dest='party_sizes',
+                            default=[2, 3, 4, 6, 9])
+
+    def handle(self, *args, **options):
+        self.options = options
+        letters = options['letters'].upper()
+        if not set(letters) <= set(string.ascii_uppercase):
+            self.stderr.write('Seat letters should be letters from A to Z.')
+            return
+        self.stdout.write(f'{options["flights"]} flights of {options["rows"]} rows of '
+                          f'{letters}')
+        self.stdout.write(f'{"load":>5} {"party":>5} {"finder (ms)":>12} {"grid (us)":>10} '
+                          f'{"list (ms)":>10} {"list (KB)":>10} {"same row":>9} '
+                          f'{"rows":>5} {"found":>6}')
+        with transaction.atomic():
+            user = User.objects.create_user(
+                email='seat.finder.benchmark@email.com', password='benchmark')
+            for load_factor in options['load_factors']:
+                flights = [self.seed(user, letters, load_factor, number)
+                           for number in range(options['flights'])]
+                for party_size in options['party_sizes']:
+                    self.run(flights, load_factor, party_size)
+            transaction.set_rollback(True)
+
+    def seed(self, user, letters, load_factor, number):
+        flight = Flight.objects.create(
+            name=f'SEAT FINDER {load_factor} {number}', created_by=user)
+        Seat.objects.bulk_create([
+            Seat(flight=flight, row=row, letter=letter, booked=random.random() < load_factor)
+            for row in range(1, self.options['rows'] + 1) for letter in letters])
+        return flight
+
+    def run(self, flights, load_factor, party_size):
+        start = time.perf_counter()
+        blocks = [find_adjacent_seats(flight, party_size) for flight in flights]
+        finder = time.perf_counter() - start
+
+        grids = [SeatGrid(Seat.objects.filter(flight=flight, class_group='Economy'))
+                 for flight in flights]
+        start = time.perf_counter()
+        for grid in grids:
+            grid.find_block(party_size)
+        search = time.perf_counter() - start
+
+        # what a client downloads to search the seats on its own
+        start = time.perf_counter()
+        payloads = [json.dumps(FlightSeatsViewSerializer(
+            Seat.objects.filter(flight=flight), many=True).data, default=str)
+            for flight in flights]
+        listing = time.perf_counter() - start
+
+        found = [block for block in blocks if block]
+        same_row = sum(1 for block in found if len({seat.row for seat in block}) == 1)
+        spans = [max(seat.row for seat in block) - min(seat.row for seat in block) + 1
+                 for block in found]
+        self.stdout.write(
+            f'{load_factor:>5.0%} {party_size:>5} {finder * 1e3 / len(flights):>12.3f} '
+            f'{search * 1e6 / len(flights):>10.1f} {listing * 1e3 / len(flights):>10.3f} '
+            f'{sum(map(len, payloads)) / 1024 / len(flights):>10.1f} '
+            f'{same_row / max(len(found), 1):>9.0%} '
+            f'{sum(spans) / max(len(spans), 1):>5.1f} {len(found):>6}')
@@ -0,0 +1,129 @@
+"""
+Compare memory and lookup latency of the compact seat inventory against one Seat row per
+seat. Both models are loaded the way the API reads them; memory is measured on a sample of
+flights with tracemalloc and extrapolated to --flights.
+With --db the lookups are also timed against the database, all data created is rolled back.
+"""
+import random
+import string
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from authentication.models import User
+from flights.inventory import SeatMap
+from flights.models import Flight, Seat, SeatInventory
+
+
+class Command(BaseCommand):
+    help = __doc__
+
+    def add_arguments(self, parser):
+        parser.add_argument('--flights', type=int, dest='flights', default=100000,
+                            help='Number of flights to report memory for.')
+        parser.add_argument('--sample', type=int, dest='sample', default=1000,
+                            help='Number of flights actually built and measured.')
+        parser.add_argument('--rows', type=int, dest='rows', default=30)
+        parser.add_argument('--letters', type=int, dest='letters', default=6)
+        parser.add_argument('--load-factor', type=float, dest='load_factor', default=0.8,
+                            help='Share of booked seats.')
+        parser.add_argument('--lookups', type=int, dest='lookups', default=100000)
+        parser.add_argument('--db', action='store_true', dest='db',
+                            help='Also time lookups against the database.')
+
+    def handle(self, *args, **options):
+        self.letters = string.ascii_uppercase[:options['letters']]
+        self.rows = options['rows']
+        self.load_factor = options['load_factor']
+        flights = [self.seats() for _ in range(options['sample'])]
+        scale = options['flights'] / options['sample']
+
+        rows_memory, seat_rows = self.measure(
+            lambda: [{(row, letter): (class_group, booked)
+                      for row, letter, class_group, booked in seats} for seats in flights])
+        maps_memory, seat_maps = self.measure(
+            lambda: [SeatMap.from_seats(seats) for seats in flights])
+
+        lookups = [(random.randrange(len(flights)), random.randint(1, self.rows),
+                    random.choice(self.letters)) for _ in range(options['lookups'])]
+        rows_lookup = self.time(lambda: [seat_rows[flight].get((row, letter))
+                                         for flight, row, letter in lookups])
+        maps_lookup = self.time(lambda: [seat_maps[flight].lookup(row, letter)
+                                         for flight, row, letter in lookups])
+        rows_free = self.time(lambda: [self.find_free(seat_rows[flight])
+                                       for flight, _, _ in lookups])
+        maps_free = self.time(lambda: [seat_maps[flight].find_free('Economy')
+                                       for flight, _, _ in lookups])
+
+        seats_per_flight = self.rows * len(self.letters)
+        stored_bytes = sum(len(SeatMap.to_bytes(seat_map.seats)) +
+                           len(SeatMap.to_bytes(seat_map.booked)) for seat_map in seat_maps)
+        self.stdout.write(f'{options["flights"]} flights of {seats_per_flight} seats, '
+                          f'{self.load_factor:.0%} booked')
+        self.stdout.write(f'{"":<28} {"seat rows":>14} {"seat map":>14}')
+        self.stdout.write(f'{"rows stored":<28} {int(seats_per_flight * options["flights"]):>14} '
+                          f'{options["flights"]:>14}')
+        self.stdout.write(f'{"bitset bytes stored":<28} {"":>14} '
+                          f'{int(stored_bytes * scale):>14}')
+        self.stdout.write(f'{"python memory (MB)":<28} {rows_memory * scale / 2 ** 20:>14.1f} '
+                          f'{maps_memory * scale / 2 ** 20:>14.1f}')
+        self.stdout.write(f'{"lookup (us)":<28} {rows_lookup * 1e6 / len(lookups):>14.3f} '
+                          f'{maps_lookup * 1e6 / len(lookups):>14.3f}')
+        self.stdout.write(f'{"find free seat (us)":<28} {rows_free * 1e6 / len(lookups):>14.3f} '
+                          f'{maps_free * 1e6 / len(lookups):>14.3f}')
+        if options['db']:
+            self.benchmark_database(flights[:100], lookups[:1000])
+
+    def seats(self):
+        seats = []
+        for row in range(1, self.rows + 1):
+            class_group = 'Business' if row <= 4 else 'Economy'
+            for letter in self.letters:
+                seats.append((row, letter, class_group, random.random() < self.load_factor))
+        return seats
+
+    def find_free(self, seats):
+        for (row, letter), (class_group, booked) in seats.items():
+            if class_group == 'Economy' and not booked:
+                return row, letter
+
+    def measure(self, build):
+        tracemalloc.start()
+        result = build()
+        memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return memory, result
+
+    def time(self, run):
+        start = time.perf_counter()
+        run()
+        return time.perf_counter() - start
+
+    def benchmark_database(self, flights, lookups):
+        lookups = [(flight % len(flights), row, letter) for flight, row, letter in lookups]
+        with transaction.atomic():
+            user = User.objects.create_user(
+                email='inventory.benchmark@email.com', password='benchmark')
+            flight_ids = []
+            for number, seats in enumerate(flights):
+                flight = Flight.objects.create(name=f'INVENTORY {number}', created_by=user)
+                flight_ids.append(flight.id)
+                Seat.objects.bulk_create([
+                    Seat(flight=flight, row=row, letter=letter, class_group=class_group,
+                         booked=booked) for row, letter, class_group, booked in seats])
+                inventory = SeatInventory(flight=flight)
+                inventory.seat_map = SeatMap.from_seats(seats)
+                inventory.save()
+
+            rows_lookup = self.time(lambda: [
+                Seat.objects.filter(flight_id=flight_ids[flight], row=row, letter=letter)
+                .values_list('class_group', 'booked').first()
+                for flight, row, letter in lookups])
+            maps_lookup = self.time(lambda: [
+                SeatInventory.objects.get(flight_id=flight_ids[flight]).seat_map
+                .lookup(row, letter) for flight, row, letter in lookups])
+            transaction.set_rollback(True)
+        self.stdout.write(f'{"database lookup (ms)":<28} {rows_lookup * 1e3 / len(lookups):>14.3f} '
+                          f'{maps_lookup * 1e3 / len(lookups):>14.3f}')
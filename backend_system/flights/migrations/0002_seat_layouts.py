@@ -0,0 +1,42 @@
+# Generated by Django 2.1.4 on 2026-10-18 06:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeatLayout',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('name', models.CharField(max_length=60, unique=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='LayoutSeat',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('class_group', models.CharField(default='Economy', max_length=60)),
+                ('letter', models.CharField(max_length=1)),
+                ('row', models.IntegerField()),
+                ('layout', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seats', to='flights.SeatLayout')),
+            ],
+            options={
+                'unique_together': {('letter', 'row', 'layout')},
+            },
+        ),
+    ]
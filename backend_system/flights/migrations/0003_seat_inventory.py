@@ -0,0 +1,34 @@
+# Generated by Django 2.1.4 on 2026-10-18 06:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0002_seat_layouts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeatInventory',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('deleted_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('rows', models.IntegerField()),
+                ('letters', models.CharField(max_length=26)),
+                ('class_bands', models.CharField(max_length=255)),
+                ('seats', models.BinaryField(default=b'')),
+                ('booked', models.BinaryField(default=b'')),
+                ('version', models.IntegerField(default=0)),
+                ('flight', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='seat_inventory', to='flights.Flight')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 2.2.28 on 2026-10-18 06:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0003_seat_inventory'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(condition=models.Q(deleted_at=None), fields=['origin', 'destination', 'departure_time'], name='flight_route_departure_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(condition=models.Q(deleted_at=None), fields=['departure_time'], name='flight_departure_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='seat',
+            index=models.Index(condition=models.Q(('booked', False), ('deleted_at', None)), fields=['flight', 'class_group'], name='seat_free_idx'),
+        ),
+    ]
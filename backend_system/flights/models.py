@@ -1,5 +1,18 @@
-from django.db import models, transaction
-from common.models import BaseModel, SoftDeleteModel
+from django.db import connection, models
+from django.db.models import F
+from django.utils import timezone
+
+from bookings import reminders
+from common.models import BaseModel, SoftDeleteManager, SoftDeleteModel, SoftDeleteQuerySet
+from flights.inventory import SeatMap
+
+
+# SQL expressions generating a new seat primary key inside INSERT ... SELECT statements
+SEAT_ID_SQL = {
+    'postgresql': 'md5(random()::text || clock_timestamp()::text)::uuid',
+    'sqlite': 'lower(hex(randomblob(16)))',
+    'mysql': "replace(uuid(), '-', '')",
+}
 
 
 class Location(BaseModel):
@@ -23,6 +36,44 @@ class Location(BaseModel):
         return '%s, %s, %s' % (self.airport, self.city, self.country)
 
 
+class FlightQuerySet(SoftDeleteQuerySet):
+    def search(self, origin=None, destination=None, departure_after=None,
+               departure_before=None, status=None, class_group=None, seats=None):
+        """
+        Flights matching a route and departure window ordered by departure.
+        With seats only flights with at least that many free seats, of class_group when
+        given, are returned, counted on the Seat rows or the seat inventory of the flight.
+        """
+        queryset = self
+        if origin:
+            queryset = queryset.filter(origin=origin)
+        if destination:
+            queryset = queryset.filter(destination=destination)
+        if departure_after:
+            queryset = queryset.filter(departure_time__gte=departure_after)
+        if departure_before:
+            queryset = queryset.filter(departure_time__lte=departure_before)
+        if status:
+            queryset = queryset.filter(status__iexact=status)
+        if seats or class_group:
+            free_seats = Seat.objects.filter(flight=models.OuterRef('pk'), booked=False)
+            if class_group:
+                free_seats = free_seats.filter(class_group=class_group)
+            free_seats = free_seats.order_by().values('flight').annotate(
+                count=models.Count('pk')).values('count')
+            # seat inventories keep their seats in bitsets, their free seats are counted on
+            # the inventories of the matching flights in one query
+            inventory_flights = [
+                inventory.flight_id
+                for inventory in SeatInventory.objects.filter(flight__in=queryset)
+                if inventory.seat_map.free_count(class_group) >= (seats or 1)
+            ]
+            queryset = queryset.annotate(
+                free_seats=models.Subquery(free_seats, output_field=models.IntegerField())
+            ).filter(models.Q(free_seats__gte=seats or 1) | models.Q(pk__in=inventory_flights))
+        return queryset.order_by('departure_time', 'id')
+
+
 class Flight(SoftDeleteModel):
     name = models.CharField(max_length=60, null=False, blank=False, unique=False)
     origin = models.ForeignKey(
@@ -37,8 +88,24 @@ class Flight(SoftDeleteModel):
         on_delete=models.DO_NOTHING)
     status = models.CharField(max_length=25, null=True, blank=True)
 
+    objects = SoftDeleteManager(queryset_class=FlightQuerySet)
+    objects_with_deleted = SoftDeleteManager(queryset_class=FlightQuerySet, with_deleted=True)
+
     class Meta:
         unique_together = ('name', 'departure_time')
+        indexes = [
+            # flight search by route and departure window over flights not deleted
+            models.Index(fields=['origin', 'destination', 'departure_time'],
+                         condition=models.Q(deleted_at=None), name='flight_route_departure_idx'),
+            models.Index(fields=['departure_time'],
+                         condition=models.Q(deleted_at=None), name='flight_departure_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_departure_time = instance.__dict__.get('departure_time')
+        return instance
 
     def save(self, force_insert=False, force_update=False, using=None,
              update_fields=None):
@@ -46,17 +113,30 @@ class Flight(SoftDeleteModel):
         self.name = self.name.upper()
         if self.gate:
             self.gate = self.gate.upper()
-        return super(Flight, self).save(force_insert=force_insert, force_update=force_update,
-                                        using=using, update_fields=update_fields)
+        adding = self._state.adding
+        result = super(Flight, self).save(force_insert=force_insert, force_update=force_update,
+                                          using=using, update_fields=update_fields)
+        departure_time = self.__dict__.get('departure_time')
+        if not adding and departure_time != getattr(self, '_loaded_departure_time', None):
+            # reminders of the flight's bookings are due at another time
+            reminders.on_commit_schedule(self.booking.values_list('id', flat=True))
+        self._loaded_departure_time = departure_time
+        return result
+
+    def copy_seats_from(self, flight):
+        """Copy the seats of another flight onto this flight in a single statement."""
+        return _copy_seats(self, Seat, 'flight', flight.pk, skip_deleted=True)
 
-    @transaction.atomic
     def delete(self, *args, **kwargs):
-        super().delete()
-        # soft_delete related objects
-        if self._meta.related_objects:
-            relations = [rel.get_accessor_name() for rel in self._meta.related_objects]
-            for relation in relations:
-                getattr(self, relation).all().delete()
+        # soft delete the flight with its seats, seat inventory and bookings
+        booking_ids = list(self.booking.values_list('id', flat=True))
+        self.deleted_at = timezone.now()
+        Flight.objects_with_deleted.filter(pk=self.pk).delete_cascade(deleted_at=self.deleted_at)
+        reminders.on_commit_cancel(booking_ids)
+
+    def restore(self):
+        super().restore()
+        reminders.on_commit_schedule(self.booking.values_list('id', flat=True))
 
 
 class Seat(SoftDeleteModel):
@@ -68,6 +148,11 @@ class Seat(SoftDeleteModel):
 
     class Meta:
         unique_together = ('letter', 'row', 'flight')
+        indexes = [
+            # free seats per class_group of a flight
+            models.Index(fields=['flight', 'class_group'],
+                         condition=models.Q(booked=False, deleted_at=None), name='seat_free_idx'),
+        ]
 
     def save(self, force_insert=False, force_update=False, using=None,
              update_fields=None):
@@ -79,3 +164,169 @@ class Seat(SoftDeleteModel):
     @property
     def seat(self):
         return str(self.row) + self.letter
+
+    def claim(self):
+        """
+        Book the seat with a single conditional UPDATE so that only one of many concurrent
+        requests can claim it. Returns False if the seat was already booked.
+        """
+        claimed = Seat.objects.filter(pk=self.pk, booked=False).update(
+            booked=True, updated_at=timezone.now())
+        if claimed:
+            self.booked = True
+        return bool(claimed)
+
+    def release(self):
+        Seat.objects.filter(pk=self.pk).update(booked=False, updated_at=timezone.now())
+        self.booked = False
+
+    @classmethod
+    def swap(cls, old_seat, new_seat):
+        """
+        Move a booking from old_seat to new_seat. Both seats are locked in primary key order
+        so that concurrent swaps of the same seats can not deadlock.
+        Must run inside a transaction. Returns False if new_seat was already booked.
+        """
+        seats = [seat for seat in (old_seat, new_seat) if seat is not None]
+        list(cls.objects.select_for_update().filter(pk__in=[seat.pk for seat in seats])
+             .order_by('pk').values_list('pk', flat=True))
+        if old_seat is not None:
+            old_seat.release()
+        if new_seat is not None:
+            return new_seat.claim()
+        return True
+
+
+class SeatInventory(SoftDeleteModel):
+    """
+    Optional compact seat inventory of a flight used instead of one Seat row per seat.
+    The seats and booked bitsets are the little endian bytes of a SeatMap.
+    """
+    flight = models.OneToOneField(
+        'Flight', null=False, blank=False, related_name='seat_inventory',
+        on_delete=models.CASCADE)
+    rows = models.IntegerField(null=False, blank=False)
+    letters = models.CharField(max_length=26, null=False, blank=False)
+    class_bands = models.CharField(max_length=255, null=False, blank=False)
+    seats = models.BinaryField(null=False, default=b'')
+    booked = models.BinaryField(null=False, default=b'')
+    version = models.IntegerField(null=False, default=0)
+
+    # number of times a claim is retried when another request changed the inventory
+    MAX_CLAIM_ATTEMPTS = 10
+
+    @property
+    def seat_map(self):
+        return SeatMap(
+            self.rows, self.letters, SeatMap.decode_bands(self.class_bands),
+            seats=SeatMap.from_bytes(self.seats), booked=SeatMap.from_bytes(self.booked))
+
+    @seat_map.setter
+    def seat_map(self, seat_map):
+        self.rows = seat_map.rows
+        self.letters = seat_map.letters
+        self.class_bands = SeatMap.encode_bands(seat_map.bands)
+        self.seats = SeatMap.to_bytes(seat_map.seats)
+        self.booked = SeatMap.to_bytes(seat_map.booked)
+
+    def update_seat_map(self, change):
+        """
+        Apply change to the seat map and store the result with a conditional UPDATE on
+        version, so concurrent claims never overwrite each other.
+        change returns the seat it picked or None to leave the inventory untouched.
+        """
+        for _ in range(self.MAX_CLAIM_ATTEMPTS):
+            seat_map = self.seat_map
+            seat = change(seat_map)
+            if seat is None:
+                return None
+            updated = SeatInventory.objects.filter(pk=self.pk, version=self.version).update(
+                booked=SeatMap.to_bytes(seat_map.booked), version=F('version') + 1,
+                updated_at=timezone.now())
+            if updated:
+                self.booked = SeatMap.to_bytes(seat_map.booked)
+                self.version += 1
+                return seat
+            self.refresh_from_db(fields=['booked', 'version'])
+        return None
+
+    def claim(self, row, letter):
+        """Atomically book the given seat, returns False if it is not free."""
+        seat = (row, letter.upper())
+        claimed = self.update_seat_map(lambda seat_map: seat if seat_map.claim(*seat) else None)
+        return claimed is not None
+
+    def claim_free(self, class_group=None):
+        """Atomically book the first free seat of class_group, returns its (row, letter)."""
+        def claim_first_free(seat_map):
+            seat = seat_map.find_free(class_group)
+            if seat is not None:
+                seat_map.claim(*seat)
+            return seat
+        return self.update_seat_map(claim_first_free)
+
+    def release(self, row, letter):
+        """Atomically free the given seat, returns False if it is not booked."""
+        seat = (row, letter.upper())
+        released = self.update_seat_map(
+            lambda seat_map: seat if seat_map.release(*seat) else None)
+        return released is not None
+
+
+class SeatLayout(BaseModel):
+    """A reusable cabin layout whose seats can be copied onto flights."""
+    name = models.CharField(max_length=60, unique=True, null=False, blank=False)
+
+    def __str__(self):
+        return self.name
+
+    def apply_to(self, flight):
+        """Copy the seats of this layout onto the given flight in a single statement."""
+        return _copy_seats(flight, LayoutSeat, 'layout', self.pk)
+
+
+class LayoutSeat(BaseModel):
+    class_group = models.CharField(max_length=60, default='Economy')
+    letter = models.CharField(max_length=1, null=False, blank=False)
+    row = models.IntegerField(null=False, blank=False)
+    layout = models.ForeignKey(
+        'SeatLayout', null=False, blank=False, related_name='seats', on_delete=models.CASCADE)
+
+    class Meta:
+        unique_together = ('letter', 'row', 'layout')
+
+
+def _copy_seats(flight, source_model, source_field, source_pk, skip_deleted=False):
+    """
+    Insert a free seat on flight for every seat of source_model whose source_field is
+    source_pk with one INSERT ... SELECT, skipping positions the flight already has.
+    Returns the number of seats created.
+    """
+    quote = connection.ops.quote_name
+    seat_fields = {field.name: field for field in Seat._meta.concrete_fields}
+    columns = {name: quote(field.column) for name, field in seat_fields.items()}
+    source_column = quote(source_model._meta.get_field(source_field).column)
+    now = seat_fields['created_at'].get_db_prep_value(timezone.now(), connection)
+    flight_id = seat_fields['flight'].get_db_prep_value(flight.pk, connection)
+    source_id = source_model._meta.get_field(source_field).get_db_prep_value(source_pk, connection)
+    deleted_filter = f'AND source.{columns["deleted_at"]} IS NULL' if skip_deleted else ''
+    sql = f"""
+        INSERT INTO {quote(Seat._meta.db_table)} (
+            {columns['id']}, {columns['created_at']}, {columns['updated_at']},
+            {columns['deleted_at']}, {columns['class_group']}, {columns['letter']},
+            {columns['row']}, {columns['booked']}, {columns['flight']}
+        )
+        SELECT {SEAT_ID_SQL[connection.vendor]}, %s, %s, NULL, source.{columns['class_group']},
+               source.{columns['letter']}, source.{columns['row']}, %s, %s
+        FROM {quote(source_model._meta.db_table)} source
+        WHERE source.{source_column} = %s {deleted_filter}
+        AND NOT EXISTS (
+            SELECT 1 FROM {quote(Seat._meta.db_table)} seat
+            WHERE seat.{columns['flight']} = %s
+            AND seat.{columns['row']} = source.{columns['row']}
+            AND seat.{columns['letter']} = source.{columns['letter']}
+        )
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [now, now, False, flight_id, source_id, flight_id])
+        return cursor.rowcount
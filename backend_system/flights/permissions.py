@@ -6,13 +6,17 @@ class FlightsPermissions(IsAuthenticatedUser):
         'list': 'view',
         'retrieve': 'view',
         'create': 'create',
+        'clone': 'create',
+        'claim': 'update',
+        'release': 'update',
+        'group': 'create',
         'update': 'update',
         'destroy': 'delete',
     }
 
     def has_permission(self, request, view):
         if super().has_permission(request, view):
-            if view.action in ['create', 'update']:
+            if view.action in ['create', 'update', 'clone', 'group', 'claim', 'release']:
                 return request.user.is_staff
 
             if view.action == 'destroy':
@@ -0,0 +1,166 @@
+"""
+Adjacent seat finder.
+
+Finds a block of free seats of a class_group to seat a party together. The seats of the
+class_group are loaded in one query and laid out as a grid of rows by letters, seats next
+to each other in a row have neighbouring letters of the cabin, e.g. H and J of a cabin
+without an I. Aisles are not part of the seat data so a block may cross one.
+The seats of a block are connected, each is next to, in front of or behind another.
+A block in a single row is preferred, the one leaving the fewest free seats around it so
+larger parties still find a row, then a block over the fewest adjacent rows and letters.
+"""
+from flights.holds import seat_holders
+from flights.models import Seat
+
+
+class SeatGrid(object):
+    """
+    Free seats of a cabin by row and letter position.
+        seats: seats with a row, letter and booked attribute, all of one class_group.
+        taken: pks of free seats that are not to be allocated e.g. held seats.
+    """
+
+    def __init__(self, seats, taken=()):
+        seats = list(seats)
+        self.letters = sorted({seat.letter for seat in seats})
+        position = {letter: index for index, letter in enumerate(self.letters)}
+        self.grid = {}
+        for seat in seats:
+            cells = self.grid.setdefault(seat.row, [None] * len(self.letters))
+            if not seat.booked and seat.pk not in taken:
+                cells[position[seat.letter]] = seat
+        self.rows = sorted(self.grid)
+
+    def find_block(self, count):
+        """Return the seats of the best block of count free seats, empty if there is none."""
+        if count < 1:
+            return []
+        return self.find_in_row(count) or self.find_across_rows(count)
+
+    def find_in_row(self, count):
+        best = None
+        for row in self.rows:
+            cells = self.grid[row]
+            start = None
+            # a None sentinel closes the run ending on the last letter
+            for index, seat in enumerate(cells + [None]):
+                if seat is not None:
+                    if start is None:
+                        start = index
+                    continue
+                if start is not None and index - start >= count:
+                    candidate = (index - start - count, row, start)
+                    if best is None or candidate < best:
+                        best = candidate
+                start = None
+        if best is None:
+            return []
+        _, row, start = best
+        return self.grid[row][start:start + count]
+
+    def find_across_rows(self, count):
+        # free seats per letter position of the rows from each first row, grown by a row
+        # for each span until a span holds a block. count connected seats span at most
+        # count rows and letter positions so no wider window is searched
+        cells = self.grouped_cells(count)
+        if not cells:
+            return []
+        totals = {index: [0] * len(self.letters) for index in range(len(self.rows))}
+        for span in range(2, min(count, len(self.rows)) + 1):
+            best = None
+            for first in range(len(self.rows) - span + 1):
+                last = first + span - 1
+                if first not in totals:
+                    continue
+                if self.rows[last] - self.rows[first] != span - 1:
+                    # rows are missing in between, no longer span from this row holds a block
+                    del totals[first]
+                    continue
+                column_totals = totals[first]
+                if span == 2:
+                    self.add_row(column_totals, self.rows[first], cells)
+                self.add_row(column_totals, self.rows[last], cells)
+                window = self.connected_window(
+                    self.rows[first:last + 1], column_totals, count, cells)
+                if window is not None:
+                    left, right, seats = window
+                    if best is None or (right - left, self.rows[first], left) < best[0]:
+                        best = ((right - left, self.rows[first], left), seats)
+            if best is not None:
+                return best[1]
+        return []
+
+    def add_row(self, column_totals, row, cells):
+        for index in range(len(self.letters)):
+            if (row, index) in cells:
+                column_totals[index] += 1
+
+    def grouped_cells(self, count):
+        """(row, letter position) of the free seats in groups of at least count connected seats."""
+        free = {(row, index) for row in self.rows
+                for index, seat in enumerate(self.grid[row]) if seat is not None}
+        cells = set()
+        while free:
+            group = self.grow(free.pop(), free, len(free) + 1)
+            if len(group) >= count:
+                cells.update(group)
+        return cells
+
+    @staticmethod
+    def grow(start, cells, count):
+        """
+        Take up to count cells connected to start out of cells, breadth first so any first
+        cells taken are connected.
+        """
+        group = [start]
+        position = 0
+        while position < len(group) and len(group) < count:
+            row, index = group[position]
+            position += 1
+            for cell in ((row - 1, index), (row, index - 1), (row, index + 1), (row + 1, index)):
+                if cell in cells:
+                    cells.discard(cell)
+                    group.append(cell)
+        return group[:count]
+
+    def connected_window(self, rows, column_totals, count, cells):
+        """
+        Return (left, right, seats) of the fewest letter positions of rows holding count
+        connected seats, or None.
+        """
+        for width in range(min(count, len(self.letters))):
+            for left in range(len(self.letters) - width):
+                right = left + width
+                if sum(column_totals[left:right + 1]) >= count:
+                    seats = self.connected_seats(rows, left, right, count, cells)
+                    if seats:
+                        return left, right, seats
+        return None
+
+    def connected_seats(self, rows, left, right, count, cells):
+        """
+        Return count seats of cells in the consecutive rows between letter positions left and
+        right that are each next to, in front of or behind another, empty if there are none.
+        """
+        window = {(row, index) for row in rows for index in range(left, right + 1)
+                  if (row, index) in cells}
+        for start in sorted(window):
+            if start in window:
+                window.discard(start)
+                group = self.grow(start, window, count)
+                if len(group) >= count:
+                    return [self.grid[row][index] for row, index in sorted(group)]
+        return []
+
+
+def find_adjacent_seats(flight, count, class_group='Economy', user=None):
+    """
+    Return the best block of count free seats of class_group on flight, or an empty list.
+    Seats held by users other than user are left out.
+    """
+    seats = list(Seat.objects.filter(flight=flight, class_group=class_group)
+                 .only('id', 'class_group', 'letter', 'row', 'booked'))
+    holders = seat_holders([seat for seat in seats if not seat.booked])
+    user_id = str(user.pk) if user is not None else None
+    taken = {pk for pk, holder in holders.items() if holder != user_id}
+    return SeatGrid(seats, taken).find_block(count)
@@ -1,9 +1,20 @@
+from django.conf import settings
 from django.db import transaction
 
 from rest_framework import serializers
 
 from authentication.serializers import BasicUserSerializer
-from flights.models import Location, Flight, Seat
+from flights.holds import hold_seat
+from flights.inventory import CompactSeat, SeatMap
+from flights.models import LayoutSeat, Location, Flight, Seat, SeatInventory, SeatLayout
+
+
+def validate_without_seat_inventory(flight):
+    """Seats of a flight with a compact seat inventory are only managed through the inventory."""
+    if SeatInventory.objects.filter(flight=flight).exists():
+        raise serializers.ValidationError(
+            'Flight uses a compact seat inventory, its seats are only managed through the seat '
+            'inventory.')
 
 
 class LocationSerializer(serializers.ModelSerializer):
@@ -44,6 +55,8 @@ class FlightEmployeeReadOnlySerializer(serializers.ModelSerializer):
     arrival_time = serializers.DateTimeField(allow_null=True, required=False)
     created_by = BasicUserSerializer(read_only=True)
 
+    select_related_fields = ('origin', 'destination', 'created_by')
+
     class Meta:
         model = Flight
         fields = ('id', 'name', 'origin', 'destination', 'departure_time', 'arrival_time',
@@ -57,6 +70,8 @@ class FlightSerializer(serializers.ModelSerializer):
     departure_time = serializers.DateTimeField(allow_null=True, default=None)
     arrival_time = serializers.DateTimeField(allow_null=True, default=None)
 
+    select_related_fields = ('origin', 'destination')
+
     class Meta:
         model = Flight
         fields = ('id', 'name', 'origin', 'destination', 'departure_time', 'arrival_time',
@@ -151,10 +166,33 @@ class FlightSerializer(serializers.ModelSerializer):
         return instance
 
 
+class FlightSearchSerializer(serializers.Serializer):
+    """Query parameters of the flight search."""
+    origin = serializers.PrimaryKeyRelatedField(
+        queryset=Location.objects.all(), required=False)
+    destination = serializers.PrimaryKeyRelatedField(
+        queryset=Location.objects.all(), required=False)
+    departure_after = serializers.DateTimeField(required=False)
+    departure_before = serializers.DateTimeField(required=False)
+    status = serializers.CharField(max_length=25, required=False)
+    class_group = serializers.CharField(max_length=60, required=False)
+    seats = serializers.IntegerField(min_value=1, required=False)
+
+    def validate(self, attrs):
+        departure_after = attrs.get('departure_after')
+        departure_before = attrs.get('departure_before')
+        if departure_after and departure_before and departure_after > departure_before:
+            raise serializers.ValidationError(
+                'departure_after should be earlier than departure_before.')
+        return attrs
+
+
 class SeatSerializer(serializers.ModelSerializer):
     flight = serializers.SlugRelatedField(
         many=False, slug_field='name', read_only=True)
 
+    select_related_fields = ('flight',)
+
     class Meta:
         model = Seat
         fields = ('id', 'class_group', 'letter', 'row', 'booked', 'flight')
@@ -162,6 +200,7 @@ class SeatSerializer(serializers.ModelSerializer):
 
     def validate(self, attrs):
         flight = self.context['flight']
+        validate_without_seat_inventory(flight)
         row = attrs.get('row')
         letter = attrs.get('letter')
         try:
@@ -186,6 +225,79 @@ class SeatSerializer(serializers.ModelSerializer):
         return seat
 
 
+class SeatBulkCreateSerializer(serializers.Serializer):
+    """Create all seats for the given rows and letters of a flight at once."""
+    class_group = serializers.CharField(max_length=60, default='Economy')
+    rows = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False)
+    letters = serializers.ListField(
+        child=serializers.CharField(min_length=1, max_length=1), allow_empty=False)
+
+    def validate(self, attrs):
+        flight = self.context['flight']
+        validate_without_seat_inventory(flight)
+        # drop duplicates while keeping the order the seats were given in
+        attrs['rows'] = list(dict.fromkeys(attrs['rows']))
+        attrs['letters'] = list(dict.fromkeys(letter.upper() for letter in attrs['letters']))
+        # a single query finds every seat that already exists, soft deleted seats
+        # included since they still hold the unique (letter, row, flight) slot.
+        existing = Seat.objects_with_deleted.filter(
+            flight=flight, row__in=attrs['rows'], letter__in=attrs['letters']
+        ).values_list('row', 'letter')
+        attrs['existing_seats'] = set(existing)
+        return attrs
+
+    @transaction.atomic
+    def create(self, validated_data):
+        flight = self.context['flight']
+        existing_seats = validated_data['existing_seats']
+        seats = [
+            Seat(flight=flight, row=row, letter=letter, class_group=validated_data['class_group'])
+            for letter in validated_data['letters']
+            for row in validated_data['rows']
+            if (row, letter) not in existing_seats
+        ]
+        Seat.objects.bulk_create(seats, batch_size=settings.SEAT_BULK_CREATE_BATCH_SIZE)
+        return seats
+
+    def to_representation(self, instance):
+        existing_seats = sorted(self.validated_data['existing_seats'])
+        return {
+            'message': 'Seats for given row(s) and letter(s) created successfully.',
+            'created_count': len(instance),
+            'existing_seats': [str(row) + letter for row, letter in existing_seats],
+        }
+
+
+class SeatHoldSerializer(serializers.Serializer):
+    """Hold a free seat for the requesting user for a few minutes."""
+    minutes = serializers.IntegerField(min_value=1, required=False)
+
+    def validate_minutes(self, value):
+        if value > settings.SEAT_HOLD_MAX_MINUTES:
+            raise serializers.ValidationError(
+                f'A seat can be held for at most {settings.SEAT_HOLD_MAX_MINUTES} minutes.')
+        return value
+
+    def validate(self, attrs):
+        if self.context['seat'].booked:
+            raise serializers.ValidationError('Seat is already booked.')
+        return attrs
+
+    def create(self, validated_data):
+        seat = self.context['seat']
+        minutes = validated_data.get('minutes') or settings.SEAT_HOLD_MINUTES
+        if not hold_seat(seat, self.context['request'].user, minutes):
+            raise serializers.ValidationError('Seat is held by another user.')
+        return {'seat': seat.seat, 'minutes': minutes}
+
+    def to_representation(self, instance):
+        return {
+            'message': f'Seat {instance["seat"]} held for {instance["minutes"]} minutes.',
+            'seat': instance['seat'],
+            'minutes': instance['minutes'],
+        }
+
+
 class SeatSlimSerializer(serializers.ModelSerializer):
     class Meta:
         model = Seat
@@ -198,3 +310,194 @@ class FlightSeatsViewSerializer(serializers.ModelSerializer):
         model = Seat
         fields = ('id', 'class_group', 'seat', 'booked')
         read_only_fields = ('id', 'created_at', 'updated_at')
+
+
+class AdjacentSeatsSerializer(serializers.Serializer):
+    """Query parameters of the adjacent seat finder."""
+    seats = serializers.IntegerField(min_value=1)
+    class_group = serializers.CharField(max_length=60, default='Economy')
+
+    def validate_seats(self, value):
+        if value > settings.GROUP_BOOKING_MAX_PASSENGERS:
+            raise serializers.ValidationError(
+                f'At most {settings.GROUP_BOOKING_MAX_PASSENGERS} seats can be found at once.')
+        return value
+
+
+class SeatLayoutBandSerializer(serializers.Serializer):
+    """A block of seats sharing a class_group within a seat layout."""
+    class_group = serializers.CharField(max_length=60, default='Economy')
+    rows = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False)
+    letters = serializers.ListField(
+        child=serializers.CharField(min_length=1, max_length=1), allow_empty=False)
+
+
+class SeatLayoutSerializer(serializers.ModelSerializer):
+    bands = SeatLayoutBandSerializer(many=True, write_only=True)
+    seat_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = SeatLayout
+        fields = ('id', 'name', 'bands', 'seat_count')
+        read_only_fields = ('id', 'created_at', 'updated_at')
+
+    def validate_bands(self, bands):
+        seats = {}
+        for band in bands:
+            for letter in band['letters']:
+                for row in band['rows']:
+                    if (row, letter.upper()) in seats:
+                        raise serializers.ValidationError(
+                            f'Seat {row}{letter.upper()} is in more than one band.')
+                    seats[(row, letter.upper())] = band['class_group']
+        return seats
+
+    def save_seats(self, layout, seats):
+        layout_seats = [
+            LayoutSeat(layout=layout, row=row, letter=letter, class_group=class_group)
+            for (row, letter), class_group in seats.items()
+        ]
+        LayoutSeat.objects.bulk_create(
+            layout_seats, batch_size=settings.SEAT_BULK_CREATE_BATCH_SIZE)
+        layout.seat_count = len(layout_seats)
+
+    @transaction.atomic
+    def create(self, validated_data):
+        seats = validated_data.pop('bands')
+        layout = SeatLayout.objects.create(**validated_data)
+        self.save_seats(layout, seats)
+        return layout
+
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        seats = validated_data.pop('bands')
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+
+        instance.save()
+        # replace the layout seats with the new bands.
+        instance.seats.all().delete()
+        self.save_seats(instance, seats)
+        return instance
+
+
+class SeatCloneSerializer(serializers.Serializer):
+    """Copy the seats of a seat layout or of another flight onto a flight."""
+    layout = serializers.PrimaryKeyRelatedField(
+        queryset=SeatLayout.objects.all(), required=False, allow_null=True)
+    flight = serializers.PrimaryKeyRelatedField(
+        queryset=Flight.objects.all(), required=False, allow_null=True)
+
+    def validate(self, attrs):
+        if bool(attrs.get('layout')) == bool(attrs.get('flight')):
+            raise serializers.ValidationError(
+                'Provide either a seat layout or a flight to copy seats from.')
+        if attrs.get('flight') == self.context['flight']:
+            raise serializers.ValidationError('A flight can not copy seats from itself.')
+        validate_without_seat_inventory(self.context['flight'])
+        return attrs
+
+    @transaction.atomic
+    def create(self, validated_data):
+        flight = self.context['flight']
+        if validated_data.get('layout'):
+            created_count = validated_data['layout'].apply_to(flight)
+        else:
+            created_count = flight.copy_seats_from(validated_data['flight'])
+        return {'created_count': created_count}
+
+    def to_representation(self, instance):
+        return {
+            'message': 'Seats copied successfully.',
+            'created_count': instance['created_count'],
+        }
+
+
+class SeatInventorySerializer(serializers.ModelSerializer):
+    """Compact seat inventory of a flight built from class_group bands."""
+    bands = SeatLayoutBandSerializer(many=True, write_only=True)
+    seat_count = serializers.SerializerMethodField()
+    free_seats = serializers.SerializerMethodField()
+
+    class Meta:
+        model = SeatInventory
+        fields = ('id', 'rows', 'letters', 'class_bands', 'bands', 'seat_count', 'free_seats')
+        read_only_fields = ('id', 'rows', 'letters', 'class_bands', 'created_at', 'updated_at')
+
+    def validate(self, attrs):
+        flight = self.context['flight']
+        if SeatInventory.objects_with_deleted.filter(flight=flight).exists():
+            raise serializers.ValidationError('Flight already has a seat inventory.')
+        if Seat.objects.filter(flight=flight).exists():
+            raise serializers.ValidationError(
+                'Flight already has seats, compact inventory is only for flights without seats.')
+        seats = SeatLayoutSerializer().validate_bands(attrs['bands'])
+        try:
+            attrs['seat_map'] = SeatMap.from_seats(
+                (row, letter, class_group, False) for (row, letter), class_group in seats.items())
+        except ValueError as error:
+            raise serializers.ValidationError(str(error))
+        if len(attrs['seat_map'].letters) > 26:
+            raise serializers.ValidationError('A row can have at most 26 seat letters.')
+        return attrs
+
+    def get_seat_count(self, obj):
+        return len(obj.seat_map)
+
+    def get_free_seats(self, obj):
+        seat_map = obj.seat_map
+        return {class_group: seat_map.free_count(class_group)
+                for class_group in dict.fromkeys(band[0] for band in seat_map.bands)}
+
+    @transaction.atomic
+    def create(self, validated_data):
+        inventory = SeatInventory(flight=self.context['flight'])
+        inventory.seat_map = validated_data['seat_map']
+        inventory.save()
+        return inventory
+
+
+class SeatClaimSerializer(serializers.Serializer):
+    """Claim a given seat, or the first free seat of a class_group, of a seat inventory."""
+    row = serializers.IntegerField(min_value=1, required=False)
+    letter = serializers.CharField(min_length=1, max_length=1, required=False)
+    class_group = serializers.CharField(max_length=60, required=False)
+
+    def validate(self, attrs):
+        if bool(attrs.get('row')) != bool(attrs.get('letter')):
+            raise serializers.ValidationError('Provide both the seat row and letter.')
+        return attrs
+
+    def create(self, validated_data):
+        inventory = self.context['inventory']
+        if validated_data.get('row'):
+            seat = (validated_data['row'], validated_data['letter'].upper())
+            if not inventory.claim(*seat):
+                raise serializers.ValidationError('Invalid seat choice.')
+        else:
+            seat = inventory.claim_free(validated_data.get('class_group'))
+            if seat is None:
+                raise serializers.ValidationError('No free seat available.')
+        row, letter = seat
+        return CompactSeat(
+            inventory.flight_id, row, letter, inventory.seat_map.class_group(row), True)
+
+    def to_representation(self, instance):
+        return FlightSeatsViewSerializer(instance).data
+
+
+class SeatReleaseSerializer(serializers.Serializer):
+    """Free a booked seat of a seat inventory."""
+    row = serializers.IntegerField(min_value=1)
+    letter = serializers.CharField(min_length=1, max_length=1)
+
+    def create(self, validated_data):
+        inventory = self.context['inventory']
+        row, letter = validated_data['row'], validated_data['letter'].upper()
+        if not inventory.release(row, letter):
+            raise serializers.ValidationError('Seat is not booked.')
+        return CompactSeat(
+            inventory.flight_id, row, letter, inventory.seat_map.class_group(row), False)
+
+    def to_representation(self, instance):
+        return FlightSeatsViewSerializer(instance).data
@@ -1,8 +1,14 @@
+from django.db import connection
 from django.db.utils import IntegrityError
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
 from authentication.models import User
-from flights.models import Location, Flight, Seat
+from bookings.models import Booking
+from flights.holds import hold_seat
+from flights.inventory import SeatMap
+from flights.models import LayoutSeat, Location, Flight, Seat, SeatInventory, SeatLayout
+from flights.seating import SeatGrid, find_adjacent_seats
 
 
 class LocationTestCase(TestCase):
@@ -57,6 +63,37 @@ class FlightTestCase(TestCase):
         self.assertEqual(Seat.objects.all().count(), 0)
         self.assertIsNotNone(Seat.objects_with_deleted.get(pk=seat.pk).deleted_at)
 
+    def test_delete_cascades_with_one_update_per_relation(self):
+        seats = [Seat.objects.create(letter='A', row=row, flight=self.flight)
+                 for row in range(1, 4)]
+        for seat in seats:
+            Booking.objects.create(booked_by=self.user, flight=self.flight, seat=seat)
+        with CaptureQueriesContext(connection) as queries:
+            self.flight.delete()
+        updates = [query['sql'].split('"')[1] for query in queries.captured_queries
+                   if query['sql'].startswith('UPDATE')]
+        # bookings are reached through the flight and through their seat
+        self.assertEqual(sorted(updates), ['bookings_booking', 'bookings_booking', 'flights_flight',
+                                           'flights_seat', 'flights_seatinventory'])
+        flight = Flight.objects_with_deleted.get(pk=self.flight.pk)
+        deleted_at = {flight.deleted_at}
+        deleted_at.update(Seat.objects_with_deleted.values_list('deleted_at', flat=True))
+        deleted_at.update(Booking.objects_with_deleted.values_list('deleted_at', flat=True))
+        self.assertEqual(deleted_at, {self.flight.deleted_at})
+
+    def test_restore_restores_rows_deleted_with_flight(self):
+        seat = Seat.objects.create(letter='A', row='1', flight=self.flight)
+        deleted_seat = Seat.objects.create(letter='B', row='1', flight=self.flight)
+        booking = Booking.objects.create(booked_by=self.user, flight=self.flight, seat=seat)
+        deleted_seat.delete()
+        self.flight.delete()
+        self.flight.restore()
+        self.assertTrue(Flight.objects.filter(pk=self.flight.pk).exists())
+        self.assertTrue(Seat.objects.filter(pk=seat.pk).exists())
+        self.assertTrue(Booking.objects.filter(pk=booking.pk).exists())
+        # deleted before the flight so it stays deleted
+        self.assertFalse(Seat.objects.filter(pk=deleted_seat.pk).exists())
+
 
 class SeatTestCase(TestCase):
     def setUp(self):
@@ -76,3 +113,164 @@ class SeatTestCase(TestCase):
     def test_seat_can_not_be_created_without_flight(self):
         with self.assertRaises(IntegrityError):
             Seat.objects.create(letter='A', row='1')
+
+
+class SeatGridTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='flightsystem@email.com', password='flightpassword')
+        self.flight = Flight.objects.create(
+            name='FLIGHT1',
+            gate='G20',
+            created_by=self.user
+        )
+        # three economy rows of a cabin without an I, x marks the booked seats
+        layout = {2: 'xx.x.xx.x', 3: 'x...xx..x', 4: '.x..x.xxx'}
+        Seat.objects.bulk_create([
+            Seat(flight=self.flight, row=row, letter=letter, booked=state == 'x')
+            for row, states in layout.items() for letter, state in zip('ABCDEFGHJ', states)])
+        Seat.objects.create(flight=self.flight, row=1, letter='B', class_group='Business')
+
+    def seats(self, block):
+        return [seat.seat for seat in block]
+
+    def test_prefers_tightest_block_in_a_row(self):
+        self.assertEqual(self.seats(find_adjacent_seats(self.flight, 2)), ['3G', '3H'])
+        self.assertEqual(self.seats(find_adjacent_seats(self.flight, 3)), ['3B', '3C', '3D'])
+
+    def test_falls_back_to_adjacent_rows(self):
+        self.assertEqual(self.seats(find_adjacent_seats(self.flight, 4)),
+                         ['3C', '3D', '4C', '4D'])
+        # 3B-3D with 2C, 4C and 4D are the largest group of connected seats
+        self.assertEqual(self.seats(find_adjacent_seats(self.flight, 6)),
+                         ['2C', '3B', '3C', '3D', '4C', '4D'])
+        self.assertEqual(find_adjacent_seats(self.flight, 7), [])
+        self.assertEqual(self.seats(find_adjacent_seats(self.flight, 1, 'Business')), ['1B'])
+
+    def grid(self, layout):
+        return SeatGrid(
+            Seat(row=row, letter=letter, booked=state == 'x')
+            for row, states in enumerate(layout, 1) for letter, state in zip('ABCDEFGHJK', states))
+
+    def test_seats_that_do_not_touch_are_not_a_block(self):
+        self.assertEqual(self.grid(['.xxxxxxxxx', 'xxxxxxxxx.']).find_block(2), [])
+        self.assertEqual(self.grid(['.x.', 'xxx']).find_block(2), [])
+        self.assertEqual(self.grid(['.x.', 'x.x', '.x.']).find_block(2), [])
+        seats = self.grid(['.x.', '...']).find_block(5)
+        self.assertEqual([seat.seat for seat in seats], ['1A', '1C', '2A', '2B', '2C'])
+
+    def test_block_is_connected_across_rows(self):
+        seats = self.grid(['..xx', 'x.xx', 'x..x']).find_block(4)
+        self.assertEqual([seat.seat for seat in seats], ['1A', '1B', '2B', '3B'])
+
+    def test_rows_with_a_gap_are_not_adjacent(self):
+        seats = [Seat(row=row, letter='A', booked=False) for row in (1, 3)]
+        self.assertEqual(SeatGrid(seats).find_block(2), [])
+        seats.append(Seat(row=4, letter='A', booked=False))
+        self.assertEqual([seat.row for seat in SeatGrid(seats).find_block(2)], [3, 4])
+
+    def test_leaves_out_seats_held_by_others(self):
+        held = Seat.objects.get(flight=self.flight, row=3, letter='G')
+        hold_seat(held, self.user)
+        other = User.objects.create_user(email='other@email.com', password='flightpassword')
+        self.assertEqual(self.seats(find_adjacent_seats(self.flight, 2, user=self.user)),
+                         ['3G', '3H'])
+        self.assertEqual(self.seats(find_adjacent_seats(self.flight, 2, user=other)),
+                         ['4C', '4D'])
+
+    def test_finds_seats_in_one_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            find_adjacent_seats(self.flight, 4, 'Economy')
+        self.assertEqual(len(queries), 1)
+
+
+class SeatLayoutTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='flightsystem@email.com', password='flightpassword')
+        self.flight = Flight.objects.create(
+            name='FLIGHT1',
+            gate='G20',
+            created_by=self.user
+        )
+        self.layout = SeatLayout.objects.create(name='A320')
+        LayoutSeat.objects.create(layout=self.layout, row=1, letter='A', class_group='Business')
+        LayoutSeat.objects.create(layout=self.layout, row=2, letter='A')
+        LayoutSeat.objects.create(layout=self.layout, row=2, letter='B')
+
+    def test_apply_layout_to_flight(self):
+        self.assertEqual(self.layout.apply_to(self.flight), 3)
+        self.assertEqual(Seat.objects.filter(flight=self.flight).count(), 3)
+        seat = Seat.objects.get(flight=self.flight, row=1, letter='A')
+        self.assertEqual(seat.class_group, 'Business')
+        self.assertFalse(seat.booked)
+        self.assertIsNone(seat.deleted_at)
+        self.assertIsNotNone(seat.created_at)
+
+    def test_apply_layout_skips_existing_seats(self):
+        Seat.objects.create(letter='A', row='1', flight=self.flight)
+        self.assertEqual(self.layout.apply_to(self.flight), 2)
+        self.assertEqual(Seat.objects.filter(flight=self.flight).count(), 3)
+
+    def test_copy_seats_from_flight(self):
+        self.layout.apply_to(self.flight)
+        Seat.objects.filter(flight=self.flight, row=2, letter='B').update(booked=True)
+        Seat.objects.get(flight=self.flight, row=2, letter='A').delete()
+        other_flight = Flight.objects.create(name='FLIGHT2', created_by=self.user)
+        self.assertEqual(other_flight.copy_seats_from(self.flight), 2)
+        # copied seats are all free and soft deleted seats are left out
+        self.assertEqual(Seat.objects.filter(flight=other_flight, booked=False).count(), 2)
+        self.assertFalse(Seat.objects.filter(flight=other_flight, row=2, letter='A').exists())
+
+
+class SeatInventoryTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='flightsystem@email.com', password='flightpassword')
+        self.flight = Flight.objects.create(
+            name='FLIGHT1',
+            gate='G20',
+            created_by=self.user
+        )
+        seats = [(1, letter, 'Business', False) for letter in 'AC']
+        seats += [(row, letter, 'Economy', False) for row in (2, 3) for letter in 'ABC']
+        self.inventory = SeatInventory(flight=self.flight)
+        self.inventory.seat_map = SeatMap.from_seats(seats)
+        self.inventory.save()
+
+    def test_seat_map_lookup(self):
+        seat_map = SeatInventory.objects.get(flight=self.flight).seat_map
+        self.assertEqual(len(seat_map), 8)
+        self.assertEqual(seat_map.lookup(1, 'a'), ('Business', False))
+        self.assertEqual(seat_map.lookup(3, 'C'), ('Economy', False))
+        # row 1 has no B seat and row 4 does not exist
+        self.assertIsNone(seat_map.lookup(1, 'B'))
+        self.assertIsNone(seat_map.lookup(4, 'A'))
+
+    def test_claim_seat(self):
+        self.assertTrue(self.inventory.claim(2, 'b'))
+        self.assertFalse(self.inventory.claim(2, 'B'))
+        self.assertFalse(self.inventory.claim(1, 'B'))
+        seat_map = SeatInventory.objects.get(flight=self.flight).seat_map
+        self.assertEqual(seat_map.lookup(2, 'B'), ('Economy', True))
+        self.assertEqual(seat_map.free_count('Economy'), 5)
+
+    def test_claim_free_seat_per_class_group(self):
+        self.assertEqual(self.inventory.claim_free('Business'), (1, 'A'))
+        self.assertEqual(self.inventory.claim_free('Business'), (1, 'C'))
+        self.assertIsNone(self.inventory.claim_free('Business'))
+        self.assertEqual(self.inventory.claim_free('Economy'), (2, 'A'))
+
+    def test_claim_retries_on_concurrent_change(self):
+        stale_inventory = SeatInventory.objects.get(flight=self.flight)
+        self.assertTrue(self.inventory.claim(2, 'A'))
+        # the stale copy does not overwrite the claim made in between
+        self.assertFalse(stale_inventory.claim(2, 'A'))
+        self.assertTrue(stale_inventory.claim(2, 'B'))
+        seat_map = SeatInventory.objects.get(flight=self.flight).seat_map
+        self.assertEqual(seat_map.free_count(), 6)
+
+    def test_delete_flight_soft_deletes_inventory(self):
+        self.flight.delete()
+        self.assertFalse(SeatInventory.objects.filter(flight=self.flight).exists())
+        self.assertTrue(SeatInventory.objects_with_deleted.filter(flight=self.flight).exists())
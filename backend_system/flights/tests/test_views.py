@@ -1,10 +1,13 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from django.shortcuts import reverse
 
 from rest_framework.test import APITestCase
 
 from authentication.models import User
-from flights.models import Location, Flight, Seat
+from flights.inventory import SeatMap
+from flights.models import Location, Flight, Seat, SeatInventory, SeatLayout
 
 
 class LocationViewSetTestCase(APITestCase):
@@ -256,6 +259,18 @@ class FlightViewSetTestCase(APITestCase):
             self.assertEqual(response.data['name'], 'FLIGHT1')
             self.assertEqual(Location.objects.all().count(), 2)
 
+    def test_flight_is_added_once_per_idempotency_key(self):
+        """Test a retried add flight returns the first response."""
+        self.client.force_authenticate(user=self.staff_user)
+        response1 = self.client.post(self.url, data=self.data, format='json',
+                                     HTTP_IDEMPOTENCY_KEY='flight-retry')
+        self.assertEqual(response1.status_code, 201)
+        response2 = self.client.post(self.url, data=self.data, format='json',
+                                     HTTP_IDEMPOTENCY_KEY='flight-retry')
+        self.assertEqual(response2.status_code, 201)
+        self.assertEqual(response2.data['id'], response1.data['id'])
+        self.assertEqual(Flight.objects.count(), 1)
+
     def test_cannot_add_duplicate_flight_no_departure_time(self):
         """Flight with similar name to an existing unscheduled flight."""
         self.client.force_authenticate(user=self.staff_user)
@@ -394,6 +409,23 @@ class FlightViewSetTestCase(APITestCase):
         self.assertEqual(response2.status_code, 200)
         self.assertEqual(response2.data['total_count'], 2)
 
+    def test_list_flights_query_count_does_not_grow_with_page(self):
+        """Test listing flights runs the same number of queries for any page size."""
+        for number in range(12):
+            Flight.objects.create(
+                name=f'FLIGHT{number}', origin=self.location1, destination=self.location2,
+                created_by=self.super_user)
+        for user in (self.normal_user, self.staff_user):
+            with self.subTest(user=user.email):
+                self.client.force_authenticate(user=user)
+                with CaptureQueriesContext(connection) as small:
+                    response = self.client.get(self.url + '?page-size=2')
+                    self.assertEqual(len(response.data['results']), 2)
+                with CaptureQueriesContext(connection) as large:
+                    response = self.client.get(self.url + '?page-size=12')
+                    self.assertEqual(len(response.data['results']), 12)
+                self.assertEqual(len(small), len(large))
+
     def test_update_flight(self):
         """Test update flight functionality."""
         # create location
@@ -478,6 +510,73 @@ class FlightViewSetTestCase(APITestCase):
         self.assertEqual(Flight.objects.all().count(), 0)
 
 
+class FlightSearchTestCase(APITestCase):
+    """Test flight search by route, departure window and free seats."""
+    def setUp(self):
+        self.normal_user = User.objects.create_user(
+            email='normal@email.com', password='flightpassword')
+        self.nairobi = Location.objects.create(country='Kenya', city='Nairobi', airport='JKIA')
+        self.paris = Location.objects.create(country='France', city='Paris', airport='Gaulle')
+        self.now = timezone.now()
+        self.flights = [
+            Flight.objects.create(
+                name=f'FLIGHT{hours}', origin=self.nairobi, destination=self.paris,
+                departure_time=self.now + timezone.timedelta(hours=hours),
+                created_by=self.normal_user, status='Scheduled')
+            for hours in (3, 1, 2)
+        ]
+        Flight.objects.create(
+            name='RETURN', origin=self.paris, destination=self.nairobi,
+            departure_time=self.now, created_by=self.normal_user)
+        Seat.objects.create(letter='A', row='1', flight=self.flights[0], class_group='Business')
+        Seat.objects.create(letter='A', row='2', flight=self.flights[1])
+        Seat.objects.create(letter='B', row='2', flight=self.flights[1], booked=True)
+        self.url = reverse('flights:flight-search')
+        self.client.force_authenticate(user=self.normal_user)
+
+    def search(self, **params):
+        response = self.client.get(self.url, data=params)
+        self.assertEqual(response.status_code, 200)
+        return [flight['name'] for flight in response.data['results']]
+
+    def test_search_by_route_sorted_by_departure(self):
+        names = self.search(origin=self.nairobi.id, destination=self.paris.id)
+        self.assertEqual(names, ['FLIGHT1', 'FLIGHT2', 'FLIGHT3'])
+
+    def test_search_by_departure_window(self):
+        names = self.search(
+            origin=self.nairobi.id,
+            departure_after=(self.now + timezone.timedelta(minutes=90)).isoformat(),
+            departure_before=(self.now + timezone.timedelta(hours=4)).isoformat())
+        self.assertEqual(names, ['FLIGHT2', 'FLIGHT3'])
+
+    def test_search_by_free_seats(self):
+        self.assertEqual(self.search(seats=1), ['FLIGHT1', 'FLIGHT3'])
+        self.assertEqual(self.search(class_group='Business'), ['FLIGHT3'])
+        self.assertEqual(self.search(class_group='Economy', seats=2), [])
+
+    def test_search_by_free_seats_of_seat_inventory(self):
+        inventory = SeatInventory(flight=self.flights[2])
+        inventory.seat_map = SeatMap.from_seats([
+            (1, 'A', 'Business', False), (1, 'B', 'Business', True),
+            (2, 'A', 'Economy', False), (2, 'B', 'Economy', False)])
+        inventory.save()
+        self.assertEqual(self.search(seats=1), ['FLIGHT1', 'FLIGHT2', 'FLIGHT3'])
+        self.assertEqual(self.search(class_group='Business'), ['FLIGHT2', 'FLIGHT3'])
+        self.assertEqual(self.search(class_group='Economy', seats=2), ['FLIGHT2'])
+        self.assertEqual(self.search(class_group='Business', seats=2), [])
+
+    def test_search_excludes_deleted_flights(self):
+        self.flights[1].delete()
+        self.assertEqual(self.search(status='scheduled'), ['FLIGHT2', 'FLIGHT3'])
+
+    def test_search_invalid_departure_window(self):
+        response = self.client.get(self.url, data={
+            'departure_after': self.now + timezone.timedelta(hours=1),
+            'departure_before': self.now})
+        self.assertEqual(response.status_code, 400)
+
+
 class SeatViewsetTestCase(APITestCase):
     """SeatViewset Testcase."""
     def setUp(self):
@@ -554,6 +653,31 @@ class SeatViewsetTestCase(APITestCase):
         Seat.objects.get(row=2, letter='A', class_group='Business')
         Seat.objects.get(row=2, letter='B', class_group='Business')
 
+    def test_add_multiple_seats_reports_existing_seats(self):
+        """Test bulk seat creation skips and reports seats that already exist."""
+        Seat.objects.create(letter='A', row='1', flight=self.flight)
+        self.client.force_authenticate(user=self.super_user)
+        url = self.url + '?letter=a&letter=b&row=1&row=2'
+        response = self.client.post(url, data={}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created_count'], 3)
+        self.assertEqual(response.data['existing_seats'], ['1A'])
+        self.assertEqual(Seat.objects.filter(flight=self.flight).count(), 4)
+
+    def test_add_multiple_seats_query_count_does_not_grow_with_seats(self):
+        """Test bulk seat creation runs the same number of queries for any seat count."""
+        self.client.force_authenticate(user=self.super_user)
+        with CaptureQueriesContext(connection) as small:
+            response = self.client.post(self.url + '?letter=a&row=1', data={}, format='json')
+            self.assertEqual(response.status_code, 201)
+        rows = '&'.join(f'row={row}' for row in range(2, 62))
+        url = self.url + '?letter=a&letter=b&letter=c&letter=d&letter=e&letter=f&' + rows
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.post(url, data={}, format='json')
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created_count'], 360)
+        self.assertEqual(len(small), len(large))
+
     def test_retrieve_seat(self):
         """Test users can retrieve a given seat for a given flight."""
         # create seat
@@ -583,6 +707,80 @@ class SeatViewsetTestCase(APITestCase):
         response = self.client.get(self.url, format='json')
         self.assertEqual(response.data['total_count'], 2)
 
+    def test_list_seats_query_count_does_not_grow_with_page(self):
+        """Test listing seats runs the same number of queries for any page size."""
+        for row in range(1, 13):
+            Seat.objects.create(letter='A', row=row, flight=self.flight)
+        self.client.force_authenticate(user=self.normal_user)
+        with CaptureQueriesContext(connection) as small:
+            response = self.client.get(self.url + '?page-size=2')
+            self.assertEqual(len(response.data['results']), 2)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(self.url + '?page-size=12')
+            self.assertEqual(len(response.data['results']), 12)
+        self.assertEqual(len(small), len(large))
+
+    def test_hold_seat(self):
+        """Test a seat can be held by one user at a time."""
+        seat = Seat.objects.create(letter='A', row='1', flight=self.flight)
+        url = reverse('flights:flight-seat-hold', kwargs={'flight_pk': self.flight.id, 'pk': seat.id})
+        with self.subTest('Test user can hold a free seat.'):
+            self.client.force_authenticate(user=self.normal_user)
+            response = self.client.post(url, data={'minutes': 5}, format='json')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['seat'], '1A')
+            self.assertEqual(response.data['minutes'], 5)
+            # holding it again extends the hold
+            response = self.client.post(url, data={}, format='json')
+            self.assertEqual(response.status_code, 200)
+
+        with self.subTest('Test other users cannot hold a held seat.'):
+            self.client.force_authenticate(user=self.staff_user)
+            response = self.client.post(url, data={}, format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('Seat is held by another user.', str(response.data))
+
+        with self.subTest('Test seat can be held once released.'):
+            self.client.force_authenticate(user=self.normal_user)
+            response = self.client.delete(url)
+            self.assertEqual(response.status_code, 204)
+            self.client.force_authenticate(user=self.staff_user)
+            response = self.client.post(url, data={}, format='json')
+            self.assertEqual(response.status_code, 200)
+
+        with self.subTest('Test booked seats cannot be held.'):
+            Seat.objects.filter(id=seat.id).update(booked=True)
+            response = self.client.post(url, data={}, format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('Seat is already booked.', str(response.data))
+
+    def test_find_adjacent_seats(self):
+        """Test users can find a block of free seats next to each other."""
+        for row in (1, 2):
+            for letter in 'ABCD':
+                Seat.objects.create(letter=letter, row=row, flight=self.flight,
+                                    booked=letter == 'B')
+        url = reverse('flights:flight-seat-adjacent', kwargs={'flight_pk': self.flight.id})
+        self.client.force_authenticate(user=self.normal_user)
+        with self.subTest('Test a block in a single row is preferred.'):
+            response = self.client.get(url, {'seats': 2})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([seat['seat'] for seat in response.data], ['1C', '1D'])
+
+        with self.subTest('Test larger parties are seated over adjacent rows.'):
+            response = self.client.get(url, {'seats': 4})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([seat['seat'] for seat in response.data], ['1C', '1D', '2C', '2D'])
+
+        with self.subTest('Test no seats are returned when no block is free.'):
+            response = self.client.get(url, {'seats': 2, 'class_group': 'Business'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data, [])
+
+        with self.subTest('Test the number of seats is required.'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 400)
+
     def test_update_seat(self):
         """Test seat can be updated."""
         # create seat
@@ -659,3 +857,233 @@ class SeatViewsetTestCase(APITestCase):
         self.assertEqual(response.status_code, 204)
         self.assertEqual(Flight.objects.all().count(), 0)
         self.assertEqual(Seat.objects.all().count(), 0)
+
+
+class SeatLayoutViewSetTestCase(APITestCase):
+    """SeatLayoutViewSet Testcase."""
+    def setUp(self):
+        self.normal_user = User.objects.create_user(
+            email='normal@email.com', password='flightpassword')
+        self.staff_user = User.objects.create_user(
+            email='staff@email.com', password='flightpassword')
+        self.staff_user.is_staff = True
+        self.staff_user.save()
+        self.flight = Flight.objects.create(
+            name='FLIGHT1',
+            gate='G20',
+            created_by=self.staff_user
+        )
+        self.url = reverse('flights:seat-layout-list')
+        self.clone_url = reverse('flights:flight-seat-clone', kwargs={'flight_pk': self.flight.id})
+        self.data = {
+            'name': 'A320',
+            'bands': [
+                {'class_group': 'Business', 'rows': [1, 2], 'letters': ['a', 'b']},
+                {'rows': [3, 4, 5], 'letters': ['a', 'b', 'c']},
+            ]
+        }
+
+    def test_add_seat_layout(self):
+        """Test staff can add a seat layout from class_group bands."""
+        with self.subTest('Test normal user cannot add seat layout.'):
+            self.client.force_authenticate(user=self.normal_user)
+            response = self.client.post(self.url, data=self.data, format='json')
+            self.assertEqual(response.status_code, 403)
+
+        with self.subTest('Test a staff can add seat layout.'):
+            self.client.force_authenticate(user=self.staff_user)
+            response = self.client.post(self.url, data=self.data, format='json')
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(response.data['name'], 'A320')
+            self.assertEqual(response.data['seat_count'], 13)
+            response = self.client.get(self.url, format='json')
+            self.assertEqual(response.data['results'][0]['seat_count'], 13)
+
+    def test_seat_layout_bands_can_not_overlap(self):
+        """Test a seat can only belong to one band."""
+        self.data['bands'][1]['rows'].append(1)
+        self.client.force_authenticate(user=self.staff_user)
+        response = self.client.post(self.url, data=self.data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Seat 1A is in more than one band.', str(response.data))
+
+    def test_clone_seat_layout_to_flight(self):
+        """Test seats of a layout are copied onto a flight."""
+        self.client.force_authenticate(user=self.staff_user)
+        response = self.client.post(self.url, data=self.data, format='json')
+        layout = SeatLayout.objects.get(id=response.data['id'])
+        with self.subTest('Test normal user cannot copy seats.'):
+            self.client.force_authenticate(user=self.normal_user)
+            response = self.client.post(
+                self.clone_url, data={'layout': layout.id}, format='json')
+            self.assertEqual(response.status_code, 403)
+
+        with self.subTest('Test staff can copy layout seats onto a flight.'):
+            self.client.force_authenticate(user=self.staff_user)
+            response = self.client.post(
+                self.clone_url, data={'layout': layout.id}, format='json')
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(response.data['created_count'], 13)
+            self.assertEqual(Seat.objects.filter(flight=self.flight).count(), 13)
+            self.assertEqual(
+                Seat.objects.filter(flight=self.flight, class_group='Business').count(), 4)
+
+        with self.subTest('Test staff can copy seats of another flight.'):
+            flight = Flight.objects.create(name='FLIGHT2', created_by=self.staff_user)
+            url = reverse('flights:flight-seat-clone', kwargs={'flight_pk': flight.id})
+            response = self.client.post(url, data={'flight': self.flight.id}, format='json')
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(response.data['created_count'], 13)
+
+    def test_clone_requires_one_source(self):
+        """Test seats are copied from either a layout or a flight."""
+        self.client.force_authenticate(user=self.staff_user)
+        response = self.client.post(self.clone_url, data={}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Provide either a seat layout or a flight to copy seats from.',
+                      str(response.data))
+
+
+class SeatInventoryViewSetTestCase(APITestCase):
+    """SeatInventoryViewSet Testcase."""
+    def setUp(self):
+        self.normal_user = User.objects.create_user(
+            email='normal@email.com', password='flightpassword')
+        self.staff_user = User.objects.create_user(
+            email='staff@email.com', password='flightpassword')
+        self.staff_user.is_staff = True
+        self.staff_user.save()
+        self.flight = Flight.objects.create(
+            name='FLIGHT1',
+            gate='G20',
+            created_by=self.staff_user
+        )
+        self.url = reverse('flights:flight-seat-inventory', kwargs={'flight_pk': self.flight.id})
+        self.claim_url = reverse(
+            'flights:flight-seat-inventory-claim', kwargs={'flight_pk': self.flight.id})
+        self.data = {
+            'bands': [
+                {'class_group': 'Business', 'rows': [1], 'letters': ['a', 'b']},
+                {'rows': [2, 3], 'letters': ['a', 'b', 'c']},
+            ]
+        }
+
+    def test_add_seat_inventory(self):
+        """Test staff can add a compact seat inventory to a flight."""
+        with self.subTest('Test normal user cannot add seat inventory.'):
+            self.client.force_authenticate(user=self.normal_user)
+            response = self.client.post(self.url, data=self.data, format='json')
+            self.assertEqual(response.status_code, 403)
+
+        with self.subTest('Test staff can add seat inventory.'):
+            self.client.force_authenticate(user=self.staff_user)
+            response = self.client.post(self.url, data=self.data, format='json')
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(response.data['seat_count'], 8)
+            self.assertEqual(response.data['free_seats'], {'Business': 2, 'Economy': 6})
+
+        with self.subTest('Test flight can only have one seat inventory.'):
+            response = self.client.post(self.url, data=self.data, format='json')
+            self.assertEqual(response.status_code, 400)
+
+    def test_list_seats_of_seat_inventory(self):
+        """Test seats of a compact inventory are listed like Seat rows."""
+        self.client.force_authenticate(user=self.staff_user)
+        self.client.post(self.url, data=self.data, format='json')
+        self.client.post(self.claim_url, data={'row': 2, 'letter': 'c'}, format='json')
+        self.client.force_authenticate(user=self.normal_user)
+        url = reverse('flights:flight-seat-list', kwargs={'flight_pk': self.flight.id})
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_count'], 8)
+        self.assertEqual(set(response.data['results'][0]), {'id', 'class_group', 'seat', 'booked'})
+        self.assertEqual(response.data['results'][0]['seat'], '1A')
+        self.assertEqual(response.data['results'][0]['class_group'], 'Business')
+        booked = [seat['seat'] for seat in response.data['results'] if seat['booked']]
+        self.assertEqual(booked, ['2C'])
+
+    def test_claim_seat(self):
+        """Test seats of a compact inventory can be claimed once."""
+        self.client.force_authenticate(user=self.staff_user)
+        self.client.post(self.url, data=self.data, format='json')
+        with self.subTest('Test normal user cannot claim a seat.'):
+            self.client.force_authenticate(user=self.normal_user)
+            response = self.client.post(
+                self.claim_url, data={'class_group': 'Business'}, format='json')
+            self.assertEqual(response.status_code, 403)
+
+        self.client.force_authenticate(user=self.staff_user)
+        response = self.client.post(self.claim_url, data={'class_group': 'Business'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['seat'], '1A')
+        self.assertTrue(response.data['booked'])
+        response = self.client.post(self.claim_url, data={'row': 1, 'letter': 'a'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Invalid seat choice.', str(response.data))
+        response = self.client.get(self.url, format='json')
+        self.assertEqual(response.data['free_seats'], {'Business': 1, 'Economy': 6})
+
+    def test_seats_of_inventory_flight_are_only_managed_by_the_inventory(self):
+        """Test Seat rows cannot be added to or booked on a flight with a seat inventory."""
+        self.client.force_authenticate(user=self.staff_user)
+        self.client.post(self.url, data=self.data, format='json')
+        message = 'Flight uses a compact seat inventory'
+        seats_url = reverse('flights:flight-seat-list', kwargs={'flight_pk': self.flight.id})
+        with self.subTest('Test seats cannot be added.'):
+            response = self.client.post(
+                seats_url, data={'row': 4, 'letter': 'a'}, format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn(message, str(response.data))
+            response = self.client.post(seats_url + '?row=4&letter=a', format='json')
+            self.assertEqual(response.status_code, 400)
+
+        with self.subTest('Test seats cannot be copied onto the flight.'):
+            other = Flight.objects.create(name='FLIGHT2', created_by=self.staff_user)
+            Seat.objects.create(flight=other, row=1, letter='A')
+            url = reverse('flights:flight-seat-clone', kwargs={'flight_pk': self.flight.id})
+            response = self.client.post(url, data={'flight': other.id}, format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn(message, str(response.data))
+
+        with self.subTest('Test the flight cannot be booked through the Seat endpoints.'):
+            url = reverse('bookings:flight-bookings-list', kwargs={'flight_pk': self.flight.id})
+            response = self.client.post(url, data={'booked_by': {
+                'email': self.normal_user.email, 'first_name': 'Jane', 'last_name': 'Doe'}},
+                format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn(message, str(response.data))
+            url = reverse('bookings:flight-bookings-group', kwargs={'flight_pk': self.flight.id})
+            response = self.client.post(
+                url, data={'passengers': [{'email': self.normal_user.email}]}, format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn(message, str(response.data))
+        self.assertFalse(Seat.objects.filter(flight=self.flight).exists())
+
+    def test_release_seat(self):
+        """Test claimed seats of a compact inventory can be released."""
+        self.client.force_authenticate(user=self.staff_user)
+        self.client.post(self.url, data=self.data, format='json')
+        self.client.post(self.claim_url, data={'row': 2, 'letter': 'b'}, format='json')
+        release_url = reverse(
+            'flights:flight-seat-inventory-release', kwargs={'flight_pk': self.flight.id})
+        with self.subTest('Test normal user cannot release a seat.'):
+            self.client.force_authenticate(user=self.normal_user)
+            response = self.client.post(release_url, data={'row': 2, 'letter': 'b'}, format='json')
+            self.assertEqual(response.status_code, 403)
+
+        with self.subTest('Test staff can release a claimed seat.'):
+            self.client.force_authenticate(user=self.staff_user)
+            response = self.client.post(release_url, data={'row': 2, 'letter': 'b'}, format='json')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['seat'], '2B')
+            self.assertFalse(response.data['booked'])
+            response = self.client.get(self.url, format='json')
+            self.assertEqual(response.data['free_seats'], {'Business': 2, 'Economy': 6})
+
+        with self.subTest('Test free seats cannot be released.'):
+            response = self.client.post(release_url, data={'row': 2, 'letter': 'b'}, format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('Seat is not booked.', str(response.data))
+            self.client.post(self.claim_url, data={'row': 2, 'letter': 'b'}, format='json')
+            response = self.client.post(self.claim_url, data={'row': 2, 'letter': 'b'}, format='json')
+            self.assertEqual(response.status_code, 400)
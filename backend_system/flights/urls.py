@@ -6,6 +6,8 @@ from flights import views
 urlpatterns = [
     url(r'^flights/$', views.FlightViewSet.as_view(
         actions={'post': 'create', 'get': 'list'}), name='flight-list'),
+    url(r'^flights/search/$', views.FlightViewSet.as_view(
+        actions={'get': 'search'}), name='flight-search'),
     url(r'^flights/(?P<pk>[a-f0-9-]+)/$', views.FlightViewSet.as_view(
         actions={'get': 'retrieve', 'put': 'update', 'delete': 'destroy'}), name='flight-detail'),
     url(r'^allowed-destinations/$', views.LocationViewSet.as_view(
@@ -15,8 +17,28 @@ urlpatterns = [
         name='destination-detail'),
     url(r'^flights/(?P<flight_pk>[a-f0-9-]+)/seats/$', views.SeatViewset.as_view(
         actions={'post': 'create', 'get': 'list'}), name='flight-seat-list'),
+    url(r'^flights/(?P<flight_pk>[a-f0-9-]+)/seats/clone/$', views.SeatViewset.as_view(
+        actions={'post': 'clone'}), name='flight-seat-clone'),
+    url(r'^flights/(?P<flight_pk>[a-f0-9-]+)/seats/adjacent/$', views.SeatViewset.as_view(
+        actions={'get': 'adjacent'}), name='flight-seat-adjacent'),
     url(r'^flights/(?P<flight_pk>[a-f0-9-]+)/seats/(?P<pk>[a-f0-9-]+)/$',
         views.SeatViewset.as_view(
             actions={'get': 'retrieve', 'put': 'update', 'delete': 'destroy'}),
         name='flight-seat-detail'),
+    url(r'^flights/(?P<flight_pk>[a-f0-9-]+)/seats/(?P<pk>[a-f0-9-]+)/hold/$',
+        views.SeatViewset.as_view(actions={'post': 'hold', 'delete': 'release_hold'}),
+        name='flight-seat-hold'),
+    url(r'^flights/(?P<flight_pk>[a-f0-9-]+)/seat-inventory/$', views.SeatInventoryViewSet.as_view(
+        actions={'post': 'create', 'get': 'retrieve'}), name='flight-seat-inventory'),
+    url(r'^flights/(?P<flight_pk>[a-f0-9-]+)/seat-inventory/claim/$',
+        views.SeatInventoryViewSet.as_view(actions={'post': 'claim'}),
+        name='flight-seat-inventory-claim'),
+    url(r'^flights/(?P<flight_pk>[a-f0-9-]+)/seat-inventory/release/$',
+        views.SeatInventoryViewSet.as_view(actions={'post': 'release'}),
+        name='flight-seat-inventory-release'),
+    url(r'^seat-layouts/$', views.SeatLayoutViewSet.as_view(
+        actions={'post': 'create', 'get': 'list'}), name='seat-layout-list'),
+    url(r'^seat-layouts/(?P<pk>[a-f0-9-]+)/$', views.SeatLayoutViewSet.as_view(
+        actions={'get': 'retrieve', 'put': 'update', 'delete': 'destroy'}),
+        name='seat-layout-detail'),
 ]
@@ -1,20 +1,35 @@
+from django.db.models import Count
+from django.shortcuts import get_object_or_404
+
 from rest_framework.exceptions import NotFound
 from rest_framework import viewsets
 from rest_framework.response import Response
 from rest_framework import status
 
-from flights.models import Flight, Location, Seat
+from common.views import EagerLoadingMixin, IdempotentCreateMixin
+from flights.holds import release_seat_hold
+from flights.models import Flight, Location, Seat, SeatInventory, SeatLayout
+from flights.seating import find_adjacent_seats
 from flights.serializers import (
+    AdjacentSeatsSerializer,
     FlightSerializer,
     FlightEmployeeReadOnlySerializer,
+    FlightSearchSerializer,
     FlightSeatsViewSerializer,
     LocationSerializer,
+    SeatBulkCreateSerializer,
+    SeatClaimSerializer,
+    SeatCloneSerializer,
+    SeatHoldSerializer,
+    SeatInventorySerializer,
+    SeatLayoutSerializer,
+    SeatReleaseSerializer,
     SeatSerializer,
 )
 from flights.permissions import FlightsPermissions
 
 
-class FlightViewSet(viewsets.ModelViewSet):
+class FlightViewSet(IdempotentCreateMixin, EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = Flight.objects.all()
     permission_classes = (FlightsPermissions,)
 
@@ -22,15 +37,18 @@ class FlightViewSet(viewsets.ModelViewSet):
         return super().get_queryset()
 
     def get_serializer_class(self):
-        if self.action == 'list' and self.request.user.is_staff:
+        if self.action in ['list', 'search'] and self.request.user.is_staff:
             return FlightEmployeeReadOnlySerializer
         return FlightSerializer
 
-    def create(self, request, *args, **kwargs):
-        serializer = self.get_serializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
-        return Response(data=serializer.data, status=status.HTTP_201_CREATED)
+    def search(self, request, *args, **kwargs):
+        # filter flights by route, departure window, status and free seats
+        search_serializer = FlightSearchSerializer(data=request.query_params)
+        search_serializer.is_valid(raise_exception=True)
+        queryset = self.get_queryset().search(**search_serializer.validated_data)
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
 
 class LocationViewSet(viewsets.ModelViewSet):
@@ -42,7 +60,13 @@ class LocationViewSet(viewsets.ModelViewSet):
         return super().get_queryset()
 
 
-class SeatViewset(viewsets.ModelViewSet):
+class SeatLayoutViewSet(viewsets.ModelViewSet):
+    queryset = SeatLayout.objects.annotate(seat_count=Count('seats')).order_by('name')
+    serializer_class = SeatLayoutSerializer
+    permission_classes = (FlightsPermissions,)
+
+
+class SeatViewset(EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = Seat.objects.all()
     permission_classes = (FlightsPermissions,)
 
@@ -68,26 +92,97 @@ class SeatViewset(viewsets.ModelViewSet):
         context['flight'] = flight
         return context
 
+    def list(self, request, *args, **kwargs):
+        # flights using a compact seat inventory have no Seat rows, list its seats instead.
+        inventory = SeatInventory.objects.filter(flight_id=self.kwargs['flight_pk']).first()
+        if inventory is None:
+            return super().list(request, *args, **kwargs)
+        page = self.paginate_queryset(inventory.seat_map.compact_seats(inventory.flight_id))
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
     def create(self, request, *args, **kwargs):
         # allow users to create a bunch of seats at ago
         # the user provides a list of seat letters and list of row numbers.
         rows = self.request.query_params.getlist('row', None)
         letters = self.request.query_params.getlist('letter', None)
         if rows and letters:
-            # iterate through the lists provided to create seats.
-            data = {}
-            data['class_group'] = request.data.get('class_group', 'Economy')
-            for letter in letters:
-                for row in rows:
-                    data['row'] = row
-                    data['letter'] = letter
-                    serializer = self.get_serializer(data=data)
-                    serializer.is_valid(raise_exception=True)
-                    serializer.save()
-            message = {'message': 'Seats for given row(s) and letter(s) created successfully.'}
-            return Response(data=message, status=status.HTTP_201_CREATED)
+            # validate and insert all the seats in bulk instead of one seat at a time.
+            data = {
+                'class_group': request.data.get('class_group', 'Economy'),
+                'rows': rows,
+                'letters': letters,
+            }
+            serializer = SeatBulkCreateSerializer(
+                data=data, context=self.get_serializer_context())
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+            return Response(data=serializer.data, status=status.HTTP_201_CREATED)
         else:
             serializer = self.get_serializer(data=request.data)
             serializer.is_valid(raise_exception=True)
             serializer.save()
             return Response(data=serializer.data, status=status.HTTP_201_CREATED)
+
+    def hold(self, request, *args, **kwargs):
+        # reserve the seat for the user while they complete their booking
+        context = self.get_serializer_context()
+        context['seat'] = self.get_object()
+        serializer = SeatHoldSerializer(data=request.data, context=context)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(data=serializer.data, status=status.HTTP_200_OK)
+
+    def release_hold(self, request, *args, **kwargs):
+        release_seat_hold(self.get_object(), request.user)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def adjacent(self, request, *args, **kwargs):
+        # find a block of free seats next to each other to seat a party together
+        serializer = AdjacentSeatsSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        flight = get_object_or_404(Flight.objects.all(), id=self.kwargs['flight_pk'])
+        seats = find_adjacent_seats(
+            flight, serializer.validated_data['seats'],
+            serializer.validated_data['class_group'], request.user)
+        return Response(data=FlightSeatsViewSerializer(seats, many=True).data,
+                        status=status.HTTP_200_OK)
+
+    def clone(self, request, *args, **kwargs):
+        # copy a seat layout or another flight's seats onto the flight
+        serializer = SeatCloneSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(data=serializer.data, status=status.HTTP_201_CREATED)
+
+
+class SeatInventoryViewSet(viewsets.ModelViewSet):
+    queryset = SeatInventory.objects.all()
+    serializer_class = SeatInventorySerializer
+    permission_classes = (FlightsPermissions,)
+
+    def get_object(self):
+        inventory = get_object_or_404(self.get_queryset(), flight_id=self.kwargs['flight_pk'])
+        self.check_object_permissions(self.request, inventory)
+        return inventory
+
+    def get_serializer_context(self):
+        """Serializer context."""
+        context = super().get_serializer_context()
+        context['flight'] = get_object_or_404(Flight.objects.all(), id=self.kwargs['flight_pk'])
+        return context
+
+    def claim(self, request, *args, **kwargs):
+        # book a given seat or the first free seat of a class_group
+        serializer = SeatClaimSerializer(data=request.data, context={'inventory': self.get_object()})
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(data=serializer.data, status=status.HTTP_200_OK)
+
+    def release(self, request, *args, **kwargs):
+        # free a claimed seat e.g. when its booking is cancelled
+        serializer = SeatReleaseSerializer(
+            data=request.data, context={'inventory': self.get_object()})
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(data=serializer.data, status=status.HTTP_200_OK)
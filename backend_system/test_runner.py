@@ -1,15 +1,24 @@
 """
 Configure running of pytest commands.
 """
+import os
 
 
 class PytestTestRunner(object):
     """Runs pytest to discover and run tests."""
 
-    def __init__(self, verbosity=1, failfast=False, keepdb=False, **kwargs):
+    def __init__(self, verbosity=1, failfast=False, keepdb=False, query_report=None, **kwargs):
         self.verbosity = verbosity
         self.failfast = failfast
         self.keepdb = keepdb
+        self.query_report = query_report
+
+    @classmethod
+    def add_arguments(cls, parser):
+        parser.add_argument(
+            '--query-report', dest='query_report',
+            help='Write the per endpoint query counts and SQL time of the query budget '
+                 'test to this json file.')
 
     def run_tests(self, test_labels):
         """Run pytest and return the exitcode.
@@ -29,5 +38,9 @@ class PytestTestRunner(object):
         if self.keepdb:
             argv.append('--reuse-db')
 
+        if self.query_report:
+            # read by common.tests.QueryBudgetTestCase
+            os.environ['QUERY_REPORT'] = os.path.abspath(self.query_report)
+
         argv.extend(test_labels)
         return pytest.main(argv)